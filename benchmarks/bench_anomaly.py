@@ -0,0 +1,83 @@
+"""
+Anomaly model benchmark: refit-every-run vs fit once (subsampled) and score.
+
+For each size, times fitting on every row (what each run used to do), fitting
+on a max_samples subsample, and scoring with a saved-then-loaded artifact. The
+loaded model must reproduce the in-memory model's scores exactly.
+
+Then fits and scores per segment (--segment-by) serially and with --workers
+processes, and checks both give identical scores.
+
+    PYTHONPATH=. python benchmarks/bench_anomaly.py --rows 100000 1000000 --max-samples 50000 --workers 8
+"""
+import argparse
+import os
+import tempfile
+import time
+
+import numpy as np
+
+from benchmarks.bench_ingest import write_csv
+from src.anomaly import (
+    SEGMENT_KEYS,
+    fit_anomaly_model,
+    fit_segmented_anomaly_model,
+    load_anomaly_model,
+    save_anomaly_model,
+    score_anomalies,
+)
+from src.ingest import load_invoice_data
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, nargs="+", default=[100_000, 1_000_000])
+    parser.add_argument("--max-samples", type=int, default=50_000)
+    parser.add_argument("--segment-by", choices=SEGMENT_KEYS, default="carrier")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    args = parser.parse_args()
+
+    print(f"{'rows':>10} {'fit all':>9} {'fit sub':>9} {'score':>8}")
+    with tempfile.TemporaryDirectory() as tmp:
+        for n in args.rows:
+            path = os.path.join(tmp, f"invoices_{n}.csv")
+            write_csv(path, n)
+            df = load_invoice_data(path)
+
+            start = time.perf_counter()
+            fit_anomaly_model(df)
+            t_full = time.perf_counter() - start
+
+            start = time.perf_counter()
+            model = fit_anomaly_model(df, max_samples=args.max_samples)
+            t_sub = time.perf_counter() - start
+
+            artifact = os.path.join(tmp, "anomaly.joblib")
+            save_anomaly_model(model, artifact)
+            start = time.perf_counter()
+            flags, scores = score_anomalies(load_anomaly_model(artifact), df)
+            t_score = time.perf_counter() - start
+
+            ref_flags, ref_scores = score_anomalies(model, df)
+            assert np.array_equal(scores, ref_scores) and np.array_equal(flags, ref_flags)
+            print(f"{n:>10} {t_full:>8.2f}s {t_sub:>8.2f}s {t_score:>7.2f}s")
+
+            segmented = []
+            for workers in (1, args.workers):
+                start = time.perf_counter()
+                seg_model = fit_segmented_anomaly_model(
+                    df, args.segment_by, max_samples=args.max_samples, workers=workers
+                )
+                t_fit = time.perf_counter() - start
+                start = time.perf_counter()
+                segmented.append(score_anomalies(seg_model, df, workers=workers))
+                t_seg_score = time.perf_counter() - start
+                print(
+                    f"{'':>10} per-{args.segment_by} ({len(seg_model.segments)} segments), "
+                    f"{workers} worker(s): fit {t_fit:.2f}s, score {t_seg_score:.2f}s"
+                )
+            assert all(np.array_equal(a, b) for a, b in zip(*segmented))
+
+
+if __name__ == "__main__":
+    main()
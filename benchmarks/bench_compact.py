@@ -0,0 +1,62 @@
+"""
+Compact-mode benchmark: in-memory size of the invoice frame with and without --compact.
+
+Runs ingest -> rate engine -> rules both ways on the same synthetic CSV, checks
+that the leakage report rows are identical, and reports frame memory.
+
+    PYTHONPATH=. python benchmarks/bench_compact.py --rows 1000000
+"""
+import argparse
+import os
+import tempfile
+import time
+
+import pandas as pd
+
+from benchmarks.bench_ingest import write_csv
+from src.ingest import load_invoice_data
+from src.rate_engine import compute_expected_billing
+from src.rules_engine import apply_leakage_rules
+
+REPORT_COLS = ["shipment_id", "flag_reason", "underbilled_amount"]
+
+
+def _mib(df: pd.DataFrame) -> float:
+    return df.memory_usage(deep=True).sum() / 2**20
+
+
+def run(path: str, compact: bool):
+    start = time.perf_counter()
+    df = load_invoice_data(path, compact=compact)
+    loaded = _mib(df)
+    df = compute_expected_billing(df, copy=False)
+    df = apply_leakage_rules(df, copy=False, compact=compact)
+    elapsed = time.perf_counter() - start
+    report = df.loc[df["flag_reason"] != "", REPORT_COLS].astype({"flag_reason": str})
+    return report, loaded, _mib(df), elapsed
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, nargs="+", default=[100_000, 1_000_000])
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        for n in args.rows:
+            path = os.path.join(tmp, f"invoices_{n}.csv")
+            write_csv(path, n)
+
+            base, base_loaded, base_final, base_s = run(path, compact=False)
+            small, small_loaded, small_final, small_s = run(path, compact=True)
+            pd.testing.assert_frame_equal(base.reset_index(drop=True), small.reset_index(drop=True))
+
+            print(
+                f"{n:>10,} rows  loaded {base_loaded:7.1f} -> {small_loaded:7.1f} MiB  "
+                f"after rules {base_final:7.1f} -> {small_final:7.1f} MiB "
+                f"({100 * (1 - small_final / base_final):.0f}% smaller)  "
+                f"time {base_s:.2f}s -> {small_s:.2f}s  (reports identical)"
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,104 @@
+"""
+Near-duplicate benchmark: blocked candidate generation vs all-pairs scoring.
+
+Takes a generated dataset and re-bills a fraction of its rows under new ids,
+up to min(--window-days) days later, with the amount and weight nudged within tolerance. Checks
+that blocking finds exactly the pairs an all-pairs comparison does (on the
+--brute-force-rows prefix) and that every injected re-bill is caught, then
+reports candidate-pair counts and timings per --window-days, with and without
+a history index holding the original rows.
+
+    PYTHONPATH=. python benchmarks/bench_duplicates.py --rows 100000 1000000 --window-days 1 3 7
+"""
+import argparse
+import os
+import tempfile
+import time
+
+import numpy as np
+import pandas as pd
+
+from data.generators.synthetic_invoice_generator import write_invoices
+from src.duplicates import DuplicateConfig, DuplicateIndex, DuplicateStats, block_keys, find_near_duplicates, score_pairs
+from src.ingest import load_invoice_data
+
+
+def with_rebills(df: pd.DataFrame, fraction: float, max_shift_days: int, seed: int = 7):
+    """Re-billed copies of a sample of df's rows and {new_id: original_id}."""
+    rng = np.random.default_rng(seed)
+    picks = rng.choice(len(df), size=int(len(df) * fraction), replace=False)
+    copies = df.iloc[picks].copy()
+    originals = copies["shipment_id"].to_numpy()
+    copies["shipment_id"] = [f"REBILL-{i}" for i in range(len(copies))]
+    shift = rng.integers(0, max_shift_days + 1, len(copies))
+    copies["ship_date"] = copies["ship_date"] + pd.to_timedelta(shift, unit="D")
+    copies["actual_billed_total"] = copies["actual_billed_total"] * rng.uniform(0.997, 1.003, len(copies))
+    copies["weight_lb"] = copies["weight_lb"] * rng.uniform(0.99, 1.01, len(copies))
+    return copies, dict(zip(copies["shipment_id"], originals))
+
+
+def brute_force(df: pd.DataFrame, config: DuplicateConfig) -> set:
+    keys = block_keys(df, config)
+    a, b = np.triu_indices(len(keys), k=1)
+    same = (keys["block"].to_numpy()[a] == keys["block"].to_numpy()[b]) & (
+        np.abs(keys["day"].to_numpy()[a] - keys["day"].to_numpy()[b]) <= config.window_days
+    )
+    a, b = a[same], b[same]
+    pairs = score_pairs(keys.iloc[b].reset_index(drop=True), keys.iloc[a].reset_index(drop=True), config)
+    return set(zip(pairs["shipment_id"], pairs["duplicate_of"]))
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, nargs="+", default=[100_000, 1_000_000])
+    parser.add_argument("--window-days", type=int, nargs="+", default=[1, 3, 7])
+    parser.add_argument("--rebill-fraction", type=float, default=0.01)
+    parser.add_argument("--brute-force-rows", type=int, default=5_000)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        for n in args.rows:
+            path = os.path.join(tmp, f"invoices_{n}.csv")
+            write_invoices(path, n, seed=42)
+            history = load_invoice_data(path)
+            rebills, truth = with_rebills(history, args.rebill_fraction, min(args.window_days))
+            batch = pd.concat([history, rebills], ignore_index=True)
+
+            small = batch.iloc[: args.brute_force_rows]
+            for window in args.window_days:
+                config = DuplicateConfig(window_days=window)
+                pairs = find_near_duplicates(small, config)
+                assert set(zip(pairs["shipment_id"], pairs["duplicate_of"])) == brute_force(small, config)
+
+                stats = DuplicateStats()
+                start = time.perf_counter()
+                pairs = find_near_duplicates(batch, config, stats)
+                t_batch = time.perf_counter() - start
+                found = set(zip(pairs["shipment_id"], pairs["duplicate_of"]))
+                caught = sum((new, old) in found for new, old in truth.items())
+                assert caught == len(truth), (caught, len(truth))
+                all_pairs = len(batch) * (len(batch) - 1) // 2
+                print(
+                    f"{n:>9} rows window {window}d  one batch: {stats.candidate_pairs:>10,} candidates "
+                    f"({stats.candidate_pairs / all_pairs:.2e} of all pairs), {stats.matched_pairs:>7,} pairs, "
+                    f"{t_batch:6.2f}s, re-bills caught {caught}/{len(truth)}"
+                )
+
+                index = DuplicateIndex(os.path.join(tmp, f"index_{n}_{window}.db"), config)
+                start = time.perf_counter()
+                index.add(history)
+                t_add = time.perf_counter() - start
+                stats = DuplicateStats()
+                start = time.perf_counter()
+                pairs = index.check(rebills, stats)
+                t_check = time.perf_counter() - start
+                found = set(zip(pairs["shipment_id"], pairs["duplicate_of"]))
+                assert all((new, old) in found for new, old in truth.items())
+                print(
+                    f"{'':>9} {'':>4}  {'':>9}  vs index:  {stats.candidate_pairs:>10,} candidates, "
+                    f"{stats.matched_pairs:>7,} pairs, index build {t_add:6.2f}s, check {len(rebills)} rows {t_check:6.2f}s"
+                )
+
+
+if __name__ == "__main__":
+    main()
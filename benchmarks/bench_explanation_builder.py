@@ -0,0 +1,73 @@
+"""
+Rule explanation benchmark: build_rule_explanations vs per-row build_rule_explanation.
+
+Runs ingest -> rate engine -> rules on the sample data tiled to the requested
+size with fresh ids (bench_ingest's generator bills everything correctly, so it
+flags nothing). Then renders the explanation text for the flagged rows both
+ways, on plain and --compact frames, and checks every string is identical
+before reporting timings. A few rows are blanked or zeroed first so the NaN,
+-0.0 and missing-carrier paths are covered.
+
+    PYTHONPATH=. python benchmarks/bench_explanation_builder.py --rows 100000 1000000
+"""
+import argparse
+import os
+import tempfile
+import time
+
+import numpy as np
+import pandas as pd
+
+from src.ingest import load_invoice_data
+from src.llm_explainer import build_rule_explanation, build_rule_explanations
+from src.rate_engine import compute_expected_billing
+from src.rules_engine import apply_leakage_rules
+
+
+def flagged_frame(path: str, compact: bool):
+    df = load_invoice_data(path, compact=compact)
+    df = compute_expected_billing(df, copy=False)
+    df = apply_leakage_rules(df, copy=False, compact=compact)
+    flagged = df[df["flag_reason"] != ""].copy()
+    edge = flagged.index[::97]
+    flagged.loc[edge[0::3], "carrier"] = np.nan
+    flagged.loc[edge[1::3], "fuel_surcharge_amount"] = -0.0
+    flagged.loc[edge[2::3], "distance_miles"] = np.nan
+    return flagged
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--data", default="data/freight_invoices_1k.csv")
+    parser.add_argument("--rows", type=int, nargs="+", default=[100_000, 1_000_000])
+    args = parser.parse_args()
+
+    print(f"{'rows':>10} {'mode':>8} {'flagged':>8} {'per-row':>9} {'batch':>8} {'speedup':>8}")
+    with tempfile.TemporaryDirectory() as tmp:
+        for n in args.rows:
+            path = os.path.join(tmp, f"invoices_{n}.csv")
+            sample = pd.read_csv(args.data)
+            tiled = pd.concat([sample] * -(-n // len(sample)), ignore_index=True).iloc[:n]
+            tiled["invoice_id"] = [f"{i:012X}" for i in range(n)]
+            tiled.to_csv(path, index=False)
+            for compact in (False, True):
+                flagged = flagged_frame(path, compact)
+
+                start = time.perf_counter()
+                legacy = [build_rule_explanation(row) for _, row in flagged.iterrows()]
+                t_legacy = time.perf_counter() - start
+
+                start = time.perf_counter()
+                batch = build_rule_explanations(flagged)
+                t_batch = time.perf_counter() - start
+
+                assert batch.tolist() == legacy, "batch explanations differ from the per-row builder"
+                mode = "compact" if compact else "default"
+                print(
+                    f"{n:>10} {mode:>8} {len(flagged):>8} {t_legacy:>8.2f}s {t_batch:>7.3f}s "
+                    f"{t_legacy / t_batch:>7.1f}x"
+                )
+
+
+if __name__ == "__main__":
+    main()
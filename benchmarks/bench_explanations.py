@@ -0,0 +1,71 @@
+"""
+LLM explanation benchmark against the local stub server.
+
+Runs the flagged rows of the sample through three setups: the old one call at
+a time path (concurrency 1, no cache), a cold concurrent run that fills the
+cache, and a warm run that must make no calls at all. A fourth run injects
+429s to check that retries still get every row rewritten.
+
+    PYTHONPATH=. python benchmarks/bench_explanations.py --latency 0.05 --concurrency 16
+"""
+import argparse
+import tempfile
+import time
+
+from src.ingest import load_invoice_data
+from src.llm_explainer import ExplanationCache, LLMExplainer, build_rule_explanations
+from src.rate_engine import compute_expected_billing
+from src.rules_engine import apply_leakage_rules
+from tests.stub_llm_server import StubLLMServer
+
+
+def _texts(data_path: str) -> list:
+    df = apply_leakage_rules(compute_expected_billing(load_invoice_data(data_path)))
+    return build_rule_explanations(df[df["flag_reason"] != ""]).tolist()
+
+
+def _run(label: str, server: StubLLMServer, texts: list, **kwargs) -> list:
+    explainer = LLMExplainer("stub-model", api_key="stub", base_url=server.base_url, backoff_base=0.01, **kwargs)
+    before = server.requests
+    t0 = time.perf_counter()
+    out = explainer.explain_many(texts)
+    elapsed = time.perf_counter() - t0
+    rewritten = sum(o is not None for o in out)
+    print(
+        f"{label:<28} {elapsed:8.2f}s  requests={server.requests - before:<5} "
+        f"cache_hits={explainer.cache_hits:<5} rewritten={rewritten}/{len(texts)}"
+    )
+    return out
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--data", default="data/freight_invoices_1k.csv")
+    parser.add_argument("--latency", type=float, default=0.05)
+    parser.add_argument("--concurrency", type=int, default=16)
+    args = parser.parse_args()
+
+    texts = _texts(args.data)
+    print(f"{len(texts)} flagged rows, {len(set(texts))} distinct texts, stub latency {args.latency}s")
+
+    server = StubLLMServer(latency=args.latency).start()
+    with tempfile.TemporaryDirectory() as cache_dir:
+        sequential = _run("sequential, no cache", server, texts, max_concurrency=1)
+        cold = _run(f"concurrency {args.concurrency}, cold cache", server, texts,
+                    max_concurrency=args.concurrency, cache=ExplanationCache(cache_dir))
+        before = server.requests
+        warm = _run("warm cache", server, texts,
+                    max_concurrency=args.concurrency, cache=ExplanationCache(cache_dir))
+        assert server.requests == before, "warm run should make no calls"
+        assert sequential == cold == warm
+    server.shutdown()
+
+    flaky = StubLLMServer(latency=args.latency, rate_limit_every=5).start()
+    retried = _run("429 every 5th request", flaky, texts, max_concurrency=args.concurrency)
+    assert retried == sequential, "retries should recover every rate-limited row"
+    print(f"  ({flaky.rate_limited} requests rate-limited and retried)")
+    flaky.shutdown()
+
+
+if __name__ == "__main__":
+    main()
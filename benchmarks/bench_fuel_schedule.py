@@ -0,0 +1,102 @@
+"""
+Fuel schedule benchmark: as-of join of ship dates onto weekly diesel prices.
+
+Checks FuelSchedule.fuel_pct (one searchsorted over the price dates) against
+pandas.merge_asof and against a per-row bisect lookup, then times the first
+two over millions of shipments and years of weekly prices.
+
+    PYTHONPATH=. python benchmarks/bench_fuel_schedule.py --rows 1000000 5000000 --years 5 20
+"""
+import argparse
+import bisect
+import time
+
+import numpy as np
+import pandas as pd
+
+from src.fuel_schedule import build_fuel_schedule
+
+
+def make_prices(years: int, seed: int = 42):
+    rng = np.random.default_rng(seed)
+    weeks = pd.date_range("2010-01-04", periods=52 * years, freq="W-MON")
+    prices = pd.DataFrame({"effective_date": weeks, "diesel_price": (3.8 + rng.normal(0, 0.03, len(weeks)).cumsum()).round(3)})
+    bounds = np.round(np.arange(2.0, 6.001, 0.05), 2)
+    brackets = pd.DataFrame(
+        {
+            "price_upper_bound": np.append(bounds, np.nan),
+            "fuel_pct": np.round(0.05 + 0.0025 * np.arange(len(bounds) + 1), 4),
+        }
+    )
+    return prices, brackets
+
+
+def make_ship_dates(n: int, prices: pd.DataFrame, seed: int = 42) -> pd.Series:
+    """Dates across the price series plus a few weeks before it; 0.1% missing."""
+    rng = np.random.default_rng(seed)
+    start = prices["effective_date"].iloc[0] - pd.Timedelta(days=21)
+    span = (prices["effective_date"].iloc[-1] - start).days + 14
+    dates = pd.Series(start + pd.to_timedelta(rng.integers(0, span, n), unit="D"))
+    dates[rng.random(n) < 0.001] = pd.NaT
+    return dates
+
+
+def merge_asof_pct(schedule, prices: pd.DataFrame, ship_dates: pd.Series) -> np.ndarray:
+    left = pd.DataFrame({"ship_date": ship_dates.astype("datetime64[ns]"), "row": np.arange(len(ship_dates))})
+    left = left.dropna(subset=["ship_date"]).sort_values("ship_date", kind="stable")
+    right = prices.assign(effective_date=prices["effective_date"].astype("datetime64[ns]")).sort_values("effective_date")
+    joined = pd.merge_asof(left, right, left_on="ship_date", right_on="effective_date")
+    price = joined["diesel_price"].to_numpy()
+    pct = np.where(np.isnan(price), np.nan, schedule.pcts[np.searchsorted(schedule.breaks, price, side="left")])
+    out = np.full(len(ship_dates), np.nan)
+    out[joined["row"].to_numpy()] = pct
+    return out
+
+
+def reference_pct(prices: pd.DataFrame, brackets: pd.DataFrame, ship_dates: pd.Series) -> np.ndarray:
+    dates = list(prices["effective_date"])
+    price = list(prices["diesel_price"])
+    bounds = brackets.sort_values("price_upper_bound", na_position="last")
+    upper = [np.inf if np.isnan(b) else b for b in bounds["price_upper_bound"]]
+    pcts = list(bounds["fuel_pct"])
+    out = []
+    for d in ship_dates:
+        i = bisect.bisect_right(dates, d) - 1 if not pd.isna(d) else -1
+        if i < 0:
+            out.append(np.nan)
+            continue
+        out.append(next(p for ub, p in zip(upper, pcts) if price[i] <= ub))
+    return np.array(out)
+
+
+def _timeit(fn, *args):
+    start = time.perf_counter()
+    out = fn(*args)
+    return out, time.perf_counter() - start
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, nargs="+", default=[1_000_000, 5_000_000])
+    parser.add_argument("--years", type=int, nargs="+", default=[5, 20])
+    parser.add_argument("--check-rows", type=int, default=20_000, help="Rows checked against the per-row lookup")
+    args = parser.parse_args()
+
+    for years in args.years:
+        prices, brackets = make_prices(years)
+        schedule = build_fuel_schedule(prices, brackets)
+        for n in args.rows:
+            ship_dates = make_ship_dates(n, prices)
+            fast, fast_s = _timeit(schedule.fuel_pct, ship_dates)
+            asof, asof_s = _timeit(merge_asof_pct, schedule, prices, ship_dates)
+            np.testing.assert_array_equal(fast, asof)
+            sample = ship_dates.head(args.check_rows)
+            np.testing.assert_array_equal(fast[: len(sample)], reference_pct(prices, brackets, sample))
+            print(
+                f"{years:>3} years ({len(prices):>5,} prices)  {n:>10,} rows  searchsorted {fast_s:7.3f}s  "
+                f"merge_asof {asof_s:7.3f}s  {np.isnan(fast).mean():6.2%} unpriced  (outputs identical)"
+            )
+
+
+if __name__ == "__main__":
+    main()
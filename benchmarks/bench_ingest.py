@@ -0,0 +1,127 @@
+"""
+Ingest benchmark: typed-schema load_invoice_data vs the original infer-then-coerce loader.
+
+Writes a synthetic-schema CSV of the requested size, loads it both ways, checks
+that the pipeline columns hold the same values, and reports wall time and peak
+traced memory per million rows.
+
+    PYTHONPATH=. python benchmarks/bench_ingest.py --rows 1000000
+"""
+import argparse
+import os
+import tempfile
+import time
+import tracemalloc
+
+import numpy as np
+import pandas as pd
+
+from src.ingest import SYNTHETIC_TO_PIPELINE_MAP, load_invoice_data
+from src.schema import REQUIRED_COLUMNS
+
+CARRIERS = ["FedEx Ground", "UPS Ground", "XPO Logistics", "Old Dominion", "YRC Freight"]
+ACCESSORIALS = ["", "liftgate_delivery", "residential_delivery,liftgate_delivery", "appointment_delivery"]
+
+
+def legacy_load_invoice_data(csv_path: str) -> pd.DataFrame:
+    """The pre-schema loader, kept here as the reference."""
+    df = pd.read_csv(csv_path)
+    if "invoice_id" in df.columns and "shipment_id" not in df.columns:
+        df = df.rename(columns=SYNTHETIC_TO_PIPELINE_MAP)
+    if "customer_id" not in df.columns:
+        df["customer_id"] = df["shipment_id"].astype(str).str[-6:].radd("CUST_")
+    if "freight_class" not in df.columns:
+        df["freight_class"] = 70
+    if "liftgate_required" not in df.columns:
+        s = df["accessorial_services"].fillna("").astype(str).str.lower()
+        df["liftgate_required"] = s.str.contains("liftgate")
+    if "liftgate_fee_charged" not in df.columns:
+        df["liftgate_fee_charged"] = pd.to_numeric(df["actual_billed_accessorials"], errors="coerce").fillna(0.0)
+    df["liftgate_required"] = (
+        df["liftgate_required"].astype(str).str.lower().isin(["true", "1", "yes", "y"])
+        if df["liftgate_required"].dtype != bool
+        else df["liftgate_required"]
+    )
+    for col in ["distance_miles", "weight_lb", "liftgate_fee_charged", "fuel_surcharge_amount",
+                "base_linehaul_amount", "actual_billed_total"]:
+        df[col] = pd.to_numeric(df[col], errors="coerce")
+    df["ship_date"] = pd.to_datetime(df["ship_date"], errors="coerce")
+    df["shipment_id"] = df["shipment_id"].astype(str).str.strip()
+    df["customer_id"] = df["customer_id"].astype(str).str.strip()
+    return df
+
+
+def write_csv(path: str, n: int, seed: int = 42) -> None:
+    rng = np.random.default_rng(seed)
+    linehaul = rng.uniform(50, 3000, n).round(2)
+    fuel = (linehaul * rng.uniform(0.1, 0.14, n)).round(2)
+    acc = rng.choice([0, 75, 95, 170], n)
+    pd.DataFrame(
+        {
+            "invoice_id": [f"{i:012X}" for i in rng.permutation(n)],
+            "shipment_date": (np.datetime64("2024-01-01") + rng.integers(0, 366, n)).astype(str),
+            "carrier": rng.choice(CARRIERS, n),
+            "origin_zip": rng.integers(10000, 99999, n),
+            "dest_zip": rng.integers(10000, 99999, n),
+            "distance_miles": rng.integers(300, 2800, n),
+            "weight_lbs": rng.integers(50, 5000, n),
+            "accessorial_services": rng.choice(ACCESSORIALS, n),
+            "expected_linehaul": linehaul,
+            "expected_fuel_surcharge": fuel,
+            "expected_accessorials": acc,
+            "expected_total": (linehaul + fuel + acc).round(2),
+            "actual_billed_fuel": fuel,
+            "actual_billed_accessorials": acc,
+            "actual_total_billed": (linehaul + fuel + acc).round(2),
+        }
+    ).to_csv(path, index=False)
+
+
+def _measure(fn, path: str):
+    # timed and traced separately: tracemalloc slows allocation-heavy parsing
+    start = time.perf_counter()
+    df = fn(path)
+    elapsed = time.perf_counter() - start
+
+    tracemalloc.start()
+    fn(path)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return df, elapsed, peak
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, nargs="+", default=[100_000, 1_000_000])
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        for n in args.rows:
+            path = os.path.join(tmp, f"invoices_{n}.csv")
+            write_csv(path, n)
+
+            old, old_s, old_peak = _measure(legacy_load_invoice_data, path)
+            new, new_s, new_peak = _measure(load_invoice_data, path)
+
+            for col in REQUIRED_COLUMNS:
+                if col in ("origin_zip", "destination_zip"):
+                    # typed schema keeps zips as strings (leading zeros survive)
+                    assert (old[col].astype(str) == new[col].astype(str)).all(), col
+                    continue
+                a, b = old[col], new[col]
+                if pd.api.types.is_numeric_dtype(a) and not pd.api.types.is_bool_dtype(a):
+                    np.testing.assert_array_equal(a.to_numpy(dtype="float64"), b.to_numpy(dtype="float64"), err_msg=col)
+                else:
+                    assert (a.astype(str) == b.astype(str)).all(), col
+
+            per_m = 1_000_000 / n
+            print(
+                f"{n:>10,} rows  legacy {old_s * per_m:7.2f}s/M {old_peak * per_m / 2**20:8.1f} MiB/M  "
+                f"typed {new_s * per_m:7.2f}s/M {new_peak * per_m / 2**20:8.1f} MiB/M  "
+                f"frame {old.memory_usage(deep=True).sum() / 2**20:7.1f} -> "
+                f"{new.memory_usage(deep=True).sum() / 2**20:7.1f} MiB"
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,94 @@
+"""
+Lane matching benchmark: LaneIndex vs the original full-table SequenceMatcher scan.
+
+Invoices are a mix of exact contract lanes and lanes with typos, so both the
+hash path and the pruned fuzzy path are exercised. Every lookup is checked
+against the full scan before timings are reported.
+
+    PYTHONPATH=. python benchmarks/bench_lane_index.py --contracts 2000 --invoices 300
+"""
+import argparse
+import time
+
+import numpy as np
+import pandas as pd
+
+from src.reconciliation import build_lane_index, fuzzy_ratio
+
+CITIES = [
+    "Buffalo, NY", "Columbus, OH", "Toledo, OH", "Detroit, MI", "Chicago, IL",
+    "Dallas, TX", "Houston, TX", "Phoenix, AZ", "Miami, FL", "Atlanta, GA",
+    "Denver, CO", "Seattle, WA", "Portland, OR", "Boston, MA", "Newark, NJ",
+    "Memphis, TN", "Nashville, TN", "Omaha, NE", "Tulsa, OK", "Reno, NV",
+]
+
+
+def legacy_match_lane(invoice_row: pd.Series, rate_table: pd.DataFrame):
+    """The pre-index implementation, kept here as the reference."""
+    inv_lane = f"{invoice_row['origin']}->{invoice_row['destination']}".lower()
+    rate_table = rate_table.copy()
+    rate_table["lane_key"] = (rate_table["origin"] + "->" + rate_table["destination"]).str.lower()
+    rate_table["lane_sim"] = rate_table["lane_key"].apply(lambda x: fuzzy_ratio(inv_lane, x))
+    best_idx = rate_table["lane_sim"].idxmax()
+    return rate_table.loc[best_idx], float(rate_table.loc[best_idx, "lane_sim"])
+
+
+def _place(rng, i: int) -> str:
+    city = CITIES[rng.integers(len(CITIES))]
+    return f"{city} #{i}" if i else city
+
+
+def make_tables(n_contracts: int, n_invoices: int, seed: int = 42):
+    rng = np.random.default_rng(seed)
+    rates = pd.DataFrame(
+        {
+            "origin": [_place(rng, rng.integers(n_contracts // 10 + 1)) for _ in range(n_contracts)],
+            "destination": [_place(rng, rng.integers(n_contracts // 10 + 1)) for _ in range(n_contracts)],
+        }
+    )
+    picks = rng.integers(n_contracts, size=n_invoices)
+    origins = rates["origin"].to_numpy()[picks].copy()
+    dests = rates["destination"].to_numpy()[picks].copy()
+    for i in range(0, n_invoices, 3):
+        s = origins[i]
+        cut = rng.integers(len(s))
+        origins[i] = s[:cut] + s[cut + 1:]
+    invoices = pd.DataFrame({"origin": origins, "destination": dests})
+    return invoices, rates
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--contracts", type=int, default=2_000)
+    parser.add_argument("--invoices", type=int, default=300)
+    args = parser.parse_args()
+
+    invoices, rates = make_tables(args.contracts, args.invoices)
+
+    start = time.perf_counter()
+    index = build_lane_index(rates)
+    build_s = time.perf_counter() - start
+
+    start = time.perf_counter()
+    fast = [index.lookup(o, d) for o, d in zip(invoices["origin"], invoices["destination"])]
+    fast_s = time.perf_counter() - start
+
+    start = time.perf_counter()
+    slow = [legacy_match_lane(row, rates) for _, row in invoices.iterrows()]
+    slow_s = time.perf_counter() - start
+
+    mismatches = 0
+    for (pos, score), (row, legacy_score) in zip(fast, slow):
+        if score != legacy_score or pos != rates.index.get_loc(row.name):
+            mismatches += 1
+    assert mismatches == 0, f"{mismatches} lookups differ from the full scan"
+
+    print(
+        f"{args.contracts:,} contracts x {args.invoices:,} invoices  "
+        f"index build {build_s:.3f}s  indexed {fast_s:.3f}s  full scan {slow_s:.3f}s  "
+        f"speedup {slow_s / max(fast_s, 1e-9):.1f}x  (matches identical)"
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,65 @@
+"""
+Rate engine benchmark: columnar compute_expected_billing vs the original iterrows loop.
+
+Checks that both paths produce identical expected_* columns, then times each
+at the requested sizes.
+
+    PYTHONPATH=. python benchmarks/bench_rate_engine.py --sizes 1000 100000 1000000
+"""
+import argparse
+import time
+
+import numpy as np
+import pandas as pd
+
+from src.rate_engine import compute_expected_billing
+from tests.helpers import EXPECTED_COLS, legacy_compute_expected_billing
+
+
+def make_frame(n: int, seed: int = 42) -> pd.DataFrame:
+    rng = np.random.default_rng(seed)
+    # Include exact tier boundaries so the <= edges are exercised.
+    miles = rng.integers(50, 2800, n).astype(float)
+    miles[: min(n, 4)] = [300.0, 1000.0, 300.5, 1000.5][: min(n, 4)]
+    return pd.DataFrame(
+        {
+            "distance_miles": miles,
+            "weight_lb": rng.integers(50, 5000, n).astype(float),
+            "freight_class": rng.choice([50, 55, 60, 65, 70, 77.5, 85, 92.5, 100, 150], n),
+            "liftgate_required": rng.random(n) < 0.2,
+        }
+    )
+
+
+def _timeit(fn, df: pd.DataFrame):
+    start = time.perf_counter()
+    out = fn(df)
+    return out, time.perf_counter() - start
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1_000, 100_000, 1_000_000])
+    parser.add_argument("--skip-legacy-above", type=int, default=1_000_000,
+                        help="Only time the iterrows loop up to this many rows")
+    args = parser.parse_args()
+
+    for n in args.sizes:
+        df = make_frame(n)
+        fast, fast_s = _timeit(compute_expected_billing, df)
+
+        if n > args.skip_legacy_above:
+            print(f"{n:>10,} rows  vectorized {fast_s:8.3f}s  legacy skipped")
+            continue
+
+        slow, slow_s = _timeit(legacy_compute_expected_billing, df)
+        for col in EXPECTED_COLS:
+            np.testing.assert_array_equal(fast[col].to_numpy(), slow[col].to_numpy(), err_msg=col)
+        print(
+            f"{n:>10,} rows  vectorized {fast_s:8.3f}s  legacy {slow_s:8.3f}s  "
+            f"speedup {slow_s / max(fast_s, 1e-9):8.1f}x  (outputs identical)"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,141 @@
+"""
+Rate index benchmark: contract pricing through a compiled src.rate_index.
+
+Checks that the default index reproduces compute_expected_billing exactly and
+that a generated contract table prices a sample the same as a per-row lookup
+over the raw table. It then times compile, save/load, and batch pricing
+against the built-in tiers.
+
+    PYTHONPATH=. python benchmarks/bench_rate_index.py --sizes 100000 1000000 --contracts 100 10000
+"""
+import argparse
+import os
+import tempfile
+import time
+
+import numpy as np
+import pandas as pd
+
+from benchmarks.bench_rate_engine import EXPECTED_COLS, make_frame
+from src.rate_engine import compute_expected_billing
+from src.rate_index import (
+    CONTRACT_COLUMNS,
+    WILDCARD,
+    compile_rate_index,
+    default_contract_table,
+    default_rate_index,
+    load_rate_index,
+)
+
+ZIP3S = [f"{z:03d}" for z in range(10, 1000, 7)]
+
+
+def make_invoices(n: int, n_customers: int, seed: int = 42) -> pd.DataFrame:
+    rng = np.random.default_rng(seed)
+    df = make_frame(n, seed)
+    df["customer_id"] = [f"CUST_{i:05d}" for i in rng.integers(0, n_customers, n)]
+    df["origin_zip"] = [z + f"{i:02d}" for z, i in zip(rng.choice(ZIP3S, n), rng.integers(0, 100, n))]
+    df["destination_zip"] = [z + f"{i:02d}" for z, i in zip(rng.choice(ZIP3S, n), rng.integers(0, 100, n))]
+    return df
+
+
+def make_contracts(n_contracts: int, n_customers: int, seed: int = 42) -> pd.DataFrame:
+    """The default contract plus customer, lane and customer+lane contracts with their own tiers."""
+    rng = np.random.default_rng(seed)
+    rows = [default_contract_table()]
+    keys = set()
+    while len(keys) < n_contracts:
+        kind = rng.integers(0, 3)
+        customer = f"CUST_{rng.integers(0, n_customers):05d}" if kind != 1 else WILDCARD
+        lane = (rng.choice(ZIP3S), rng.choice(ZIP3S)) if kind != 0 else (WILDCARD, WILDCARD)
+        keys.add((customer, *lane))
+    for key in sorted(keys):
+        bounds = np.sort(rng.choice(np.arange(100, 2500, 50), 3, replace=False)).astype(float)
+        part = {
+            "rate_per_lb": (bounds, rng.uniform(0.15, 0.5, 4).round(3)),
+            "weight_multiplier": (np.array([500.0, 2000.0]), np.array([1.0, 0.93, 0.86])),
+        }
+        if rng.random() < 0.5:
+            part["fuel_pct"] = (bounds[:2], rng.uniform(0.04, 0.16, 3).round(3))
+        for schedule, (b, v) in part.items():
+            upper = list(b) + [np.nan]
+            rows.append(pd.DataFrame([(*key, schedule, u, x) for u, x in zip(upper, v)], columns=CONTRACT_COLUMNS))
+    return pd.concat(rows, ignore_index=True)
+
+
+def reference_price(table: pd.DataFrame, df: pd.DataFrame) -> np.ndarray:
+    """expected_billed_total row by row, straight from the contract table."""
+    schedules = {}
+    for key, rows in table.groupby(["customer_id", "origin_zip3", "dest_zip3", "schedule"]):
+        rows = rows.assign(ub=pd.to_numeric(rows["upper_bound"]).fillna(np.inf)).sort_values("ub")
+        schedules[key] = list(zip(rows["ub"], rows["value"]))
+
+    def value(contract, schedule, x):
+        tiers = schedules.get((*contract, schedule)) or schedules[(WILDCARD, WILDCARD, WILDCARD, schedule)]
+        if np.isnan(x):
+            return tiers[-1][1]
+        return next(v for ub, v in tiers if x <= ub)
+
+    contracts = {key[:3] for key in schedules}
+    out = []
+    for row in df.itertuples(index=False):
+        o3, d3 = row.origin_zip[:3], row.destination_zip[:3]
+        candidates = [(row.customer_id, o3, d3), (row.customer_id, WILDCARD, WILDCARD), (WILDCARD, o3, d3)]
+        contract = next((c for c in candidates if c in contracts), (WILDCARD, WILDCARD, WILDCARD))
+        linehaul = (
+            value(contract, "rate_per_lb", row.distance_miles)
+            * value(contract, "weight_multiplier", row.weight_lb)
+            * value(contract, "class_multiplier", row.freight_class)
+            * row.weight_lb
+        )
+        fee = value(contract, "liftgate_fee", np.nan) if row.liftgate_required else 0.0
+        out.append(linehaul + linehaul * value(contract, "fuel_pct", row.distance_miles) + fee)
+    return np.array(out)
+
+
+def _timeit(fn, *args):
+    start = time.perf_counter()
+    out = fn(*args)
+    return out, time.perf_counter() - start
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sizes", type=int, nargs="+", default=[100_000, 1_000_000])
+    parser.add_argument("--contracts", type=int, nargs="+", default=[100, 10_000])
+    parser.add_argument("--customers", type=int, default=5_000)
+    parser.add_argument("--check-rows", type=int, default=2_000, help="Rows checked against the per-row reference")
+    args = parser.parse_args()
+
+    for n in args.sizes:
+        df = make_invoices(n, args.customers)
+        builtin, builtin_s = _timeit(compute_expected_billing, df)
+        default, default_s = _timeit(lambda d: compute_expected_billing(d, rate_index=default_rate_index()), df)
+        for col in EXPECTED_COLS:
+            np.testing.assert_array_equal(default[col].to_numpy(), builtin[col].to_numpy(), err_msg=col)
+        print(f"{n:>10,} rows  built-in {builtin_s:7.3f}s  default index {default_s:7.3f}s  (outputs identical)")
+
+        for c in args.contracts:
+            table = make_contracts(c, args.customers)
+            index, compile_s = _timeit(compile_rate_index, table)
+            with tempfile.TemporaryDirectory() as tmp:
+                path = os.path.join(tmp, "rates.npz")
+                index.save(path)
+                size_kb = os.path.getsize(path) / 1024
+                loaded, load_s = _timeit(load_rate_index, path)
+            priced, price_s = _timeit(lambda d: compute_expected_billing(d, rate_index=loaded), df)
+
+            sample = df.head(args.check_rows)
+            np.testing.assert_allclose(
+                priced["expected_billed_total"].to_numpy()[: len(sample)], reference_price(table, sample), rtol=1e-12
+            )
+            matched = np.bincount(loaded.contract_ids(df) > 0, minlength=2)[1]
+            print(
+                f"{'':>10}  {c:>6,} contracts  compile {compile_s:6.3f}s  load {load_s * 1000:6.1f} ms "
+                f"({size_kb:,.0f} KiB)  price {price_s:7.3f}s  {matched / n:6.1%} rows on a contract  "
+                f"(sample matches reference)"
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,45 @@
+"""
+Reconciliation benchmark: batch reconcile_invoices vs the row-by-row path.
+
+Both paths share one LaneIndex, so this isolates the per-invoice arithmetic,
+flag building and result assembly. The result frames and summaries are checked
+for equality before timings are reported.
+
+    PYTHONPATH=. python benchmarks/bench_reconciliation.py --invoices 1000 100000
+"""
+import argparse
+import time
+
+import pandas as pd
+
+from src.reconciliation import build_lane_index, reconcile_invoices
+from tests.helpers import make_reconciliation_tables
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--invoices", type=int, nargs="+", default=[1_000, 100_000])
+    args = parser.parse_args()
+
+    for n in args.invoices:
+        invoices, rates = make_reconciliation_tables(n)
+        index = build_lane_index(rates)
+
+        start = time.perf_counter()
+        fast, fast_summary = reconcile_invoices(invoices, rates, lane_index=index, batch=True)
+        fast_s = time.perf_counter() - start
+
+        start = time.perf_counter()
+        slow, slow_summary = reconcile_invoices(invoices, rates, lane_index=index, batch=False)
+        slow_s = time.perf_counter() - start
+
+        pd.testing.assert_frame_equal(fast, slow)
+        assert fast_summary == slow_summary, (fast_summary, slow_summary)
+        print(
+            f"{n:>10,} invoices  batch {fast_s:8.3f}s  rows {slow_s:8.3f}s  "
+            f"speedup {slow_s / max(fast_s, 1e-9):8.1f}x  (frames identical)"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,196 @@
+"""
+Leakage rollup benchmark: leakage_partials / leakage_rollups against rescanning rows.
+
+Checks that partials merged over chunks give the same summary and rollups as
+one pass, that the summary matches the original customer groupby, and that
+sketch quantiles are within SKETCH_ALPHA of the exact ones. Then times:
+
+- the one-pass partials vs one groupby over the rows per dimension;
+- the partials as dimensions are added (each costs a key column, not a pass);
+- rolling up a week of saved daily partials vs re-reading the week's rows.
+
+    PYTHONPATH=. python benchmarks/bench_rollups.py --rows 100000 1000000 --chunks 10
+"""
+import argparse
+import time
+
+import numpy as np
+import pandas as pd
+
+from src.reporting import (
+    SKETCH_ALPHA,
+    finalize_leakage_summary,
+    leakage_partials,
+    leakage_rollups,
+    merge_leakage_partials,
+)
+from src.schema import zip3
+
+FLAGS = ["UNDERBILLED", "MISSING_FUEL_SURCHARGE", "LIFTGATE_NOT_CHARGED", "POSSIBLE_DUPLICATE"]
+
+# input columns each rollup dimension reads
+DIMENSION_COLUMNS = [
+    ("customer", ["customer_id"]),
+    ("carrier", ["carrier"]),
+    ("lane", ["origin_zip", "destination_zip"]),
+    ("week", ["ship_date"]),
+]
+
+
+def make_rules_output(n: int, seed: int = 42, n_customers: int = 5_000) -> pd.DataFrame:
+    """Rule output shaped like the pipeline's: a quarter flagged, amounts skewed."""
+    rng = np.random.default_rng(seed)
+    # about 2,000 zips under 300 zip3 prefixes, so lanes repeat as they do on real invoices
+    zips = rng.integers(10, 1000, 300)[rng.integers(0, 300, 2_000)] * 100 + rng.integers(0, 100, 2_000)
+    flagged = rng.random(n) < 0.25
+    combos = np.array(["", *FLAGS, f"{FLAGS[0]}; {FLAGS[1]}", f"{FLAGS[0]}; {FLAGS[2]}"], dtype=object)
+    reasons = np.where(flagged, combos[rng.integers(1, len(combos), n)], "")
+    amounts = np.where(flagged, rng.lognormal(4.0, 1.2, n), rng.normal(0, 5, n)).round(2)
+    # a few credits among flagged rows
+    amounts[flagged & (rng.random(n) < 0.03)] *= -1
+    return pd.DataFrame(
+        {
+            "shipment_id": [f"S{i:09d}" for i in range(n)],
+            "customer_id": pd.Categorical([f"CUST{i:05d}" for i in rng.integers(0, n_customers, n)]),
+            "carrier": pd.Categorical([f"Carrier {i:02d}" for i in rng.integers(0, 40, n)]),
+            "origin_zip": zips[rng.integers(0, len(zips), n)],
+            "destination_zip": zips[rng.integers(0, len(zips), n)],
+            "ship_date": pd.Timestamp("2024-01-01") + pd.to_timedelta(rng.integers(0, 365, n), unit="D"),
+            "flag_reason": reasons,
+            "underbilled_amount": amounts,
+        }
+    )
+
+
+def reference_summary(df: pd.DataFrame) -> dict:
+    """summarize_leakage as it was: totals plus one customer groupby over the flagged rows."""
+    flagged = df[df["flag_reason"] != ""]
+    customers = flagged.groupby("customer_id", observed=True)["underbilled_amount"].sum()
+    return {
+        "total_shipments": len(df),
+        "flagged_shipments": len(flagged),
+        "flag_rate_pct": round(len(flagged) / len(df) * 100.0, 2),
+        "estimated_revenue_leakage_usd": round(float(flagged["underbilled_amount"].clip(lower=0).sum()), 2),
+        "top_customers_by_leakage_usd": customers.sort_index().sort_values(ascending=False, kind="stable").head(5).to_dict(),
+    }
+
+
+def per_dimension_scan(df: pd.DataFrame) -> dict:
+    """Sums and exact quantiles by each dimension, one groupby over the rows per dimension."""
+    flagged = df[df["flag_reason"] != ""]
+    keys = {
+        "customer": flagged["customer_id"],
+        "carrier": flagged["carrier"],
+        "lane": zip3(flagged["origin_zip"]) + "->" + zip3(flagged["destination_zip"]),
+        "flag": flagged["flag_reason"],
+        "week": flagged["ship_date"].dt.to_period("W").dt.start_time,
+    }
+    out = {}
+    for name, key in keys.items():
+        grouped = flagged["underbilled_amount"].groupby(key.to_numpy())
+        out[name] = (grouped.sum(), grouped.quantile([0.5, 0.9, 0.99]))
+    return out
+
+
+def merged_partials(df: pd.DataFrame, n_chunks: int) -> dict:
+    partials = None
+    for chunk in np.array_split(np.arange(len(df)), n_chunks):
+        part = leakage_partials(df.iloc[chunk])
+        partials = part if partials is None else merge_leakage_partials(partials, part)
+    return partials
+
+
+def _assert_same_rollups(a: dict, b: dict) -> None:
+    """Equal up to float summation order (sums are rounded to cents)."""
+    assert a.keys() == b.keys()
+    for key in a:
+        if isinstance(a[key], list):
+            assert len(a[key]) == len(b[key]), key
+            for x, y in zip(a[key], b[key]):
+                assert x.keys() == y.keys() and all(
+                    x[k] == y[k] or abs(x[k] - y[k]) <= 0.011 for k in x
+                ), (key, x, y)
+        else:
+            assert a[key] == b[key], key
+
+
+def check_quantiles(df: pd.DataFrame, rollups: dict) -> float:
+    """Worst relative error of the overall sketch quantiles against exact nearest-rank ones."""
+    amounts = df.loc[df["flag_reason"] != "", "underbilled_amount"].to_numpy()
+    worst = 0.0
+    for name, estimate in rollups["underbilled_quantiles"].items():
+        exact = np.quantile(amounts, float(name[1:]) / 100, method="inverted_cdf")
+        error = abs(estimate - exact) / abs(exact)
+        # estimates are rounded to cents
+        assert error <= SKETCH_ALPHA + 0.005 / abs(exact), (name, estimate, exact)
+        worst = max(worst, error)
+    return worst
+
+
+def _timeit(fn, *args):
+    start = time.perf_counter()
+    out = fn(*args)
+    return out, time.perf_counter() - start
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, nargs="+", default=[100_000, 1_000_000])
+    parser.add_argument("--chunks", type=int, default=10, help="Chunks (or days) the rows are split into")
+    args = parser.parse_args()
+
+    for n in args.rows:
+        df = make_rules_output(n)
+
+        partials, one_pass_s = _timeit(leakage_partials, df)
+        summary = finalize_leakage_summary(partials)
+        expected = reference_summary(df)
+        assert summary.keys() == expected.keys()
+        assert summary["top_customers_by_leakage_usd"].keys() == expected["top_customers_by_leakage_usd"].keys()
+        for key in ("total_shipments", "flagged_shipments", "flag_rate_pct", "estimated_revenue_leakage_usd"):
+            assert summary[key] == expected[key], key
+        np.testing.assert_allclose(
+            list(summary["top_customers_by_leakage_usd"].values()),
+            list(expected["top_customers_by_leakage_usd"].values()),
+        )
+
+        rollups, rollup_s = _timeit(leakage_rollups, partials)
+        merged, merged_s = _timeit(merged_partials, df, args.chunks)
+        assert finalize_leakage_summary(merged) == summary
+        _assert_same_rollups(leakage_rollups(merged), rollups)
+        worst = check_quantiles(df, rollups)
+
+        _, old_s = _timeit(reference_summary, df)
+        _, scan_s = _timeit(per_dimension_scan, df)
+        print(
+            f"{n:>10,} rows  partials {one_pass_s:6.3f}s + rollups {rollup_s:6.3f}s  "
+            f"({len(partials['cells']):,} cells)  customer groupby alone {old_s:6.3f}s  "
+            f"groupby per dimension {scan_s:6.3f}s  (summary and rollups match, "
+            f"{args.chunks} merged chunks too; quantile error {worst:.2%})"
+        )
+
+        line = []
+        for used in range(len(DIMENSION_COLUMNS) + 1):
+            dropped = [c for _, cols in DIMENSION_COLUMNS[used:] for c in cols]
+            _, s = _timeit(leakage_partials, df.drop(columns=dropped))
+            line.append(f"{'+'.join(['flag'] + [d for d, _ in DIMENSION_COLUMNS[:used]])} {s:6.3f}s")
+        print(f"{'':>10}       partials by dimensions: " + "  ".join(line))
+
+        days = [leakage_partials(df.iloc[chunk]) for chunk in np.array_split(np.arange(len(df)), args.chunks)]
+
+        def week_from_partials():
+            week = days[0]
+            for day in days[1:]:
+                week = merge_leakage_partials(week, day)
+            return finalize_leakage_summary(week), leakage_rollups(week)
+
+        _, from_partials_s = _timeit(week_from_partials)
+        _, rescan_s = _timeit(lambda: (reference_summary(df), per_dimension_scan(df)))
+        print(
+            f"{'':>10}       {args.chunks} saved partials rolled up {from_partials_s:6.3f}s  "
+            f"vs re-reading their rows {rescan_s:6.3f}s  (merged one chunk at a time: {merged_s:6.3f}s)"
+        )
+
+
+if __name__ == "__main__":
+    main()
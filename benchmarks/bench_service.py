@@ -0,0 +1,122 @@
+"""
+Audit service benchmark: per-batch latency against a warm service vs a cold
+``python -m src.run_pipeline`` process, and throughput of many small
+concurrent submissions with and without micro-batching.
+
+Runs the service in-process on a free localhost port. Checks that every
+concurrent submission gets the same rows back as when it is sent alone.
+
+    PYTHONPATH=. python benchmarks/bench_service.py --batch-rows 10 100 1000 --clients 16
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from src.anomaly import fit_anomaly_model, save_anomaly_model
+from src.ingest import load_invoice_data
+from src.service import ServiceConfig, make_server
+
+
+def _post(url: str, body: bytes) -> dict:
+    req = urllib.request.Request(url + "/audit", data=body, headers={"Content-Type": "text/csv"})
+    with urllib.request.urlopen(req) as resp:
+        return json.loads(resp.read())
+
+
+def _batches(lines: list, rows: int, n: int) -> list:
+    header, body = lines[0], lines[1:]
+    return [b"\n".join([header] + body[(i * rows) % len(body):][:rows]) + b"\n" for i in range(n)]
+
+
+def _serve(config: ServiceConfig):
+    server, service = make_server(config, port=0, quiet=True)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, service, f"http://127.0.0.1:{server.server_address[1]}"
+
+
+def _stop(server, service) -> None:
+    server.shutdown()
+    server.server_close()
+    service.close()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--data", default="data/freight_invoices_1k.csv")
+    parser.add_argument("--batch-rows", type=int, nargs="+", default=[10, 100, 1000])
+    parser.add_argument("--requests", type=int, default=50, help="Sequential requests per batch size")
+    parser.add_argument("--clients", type=int, default=16)
+    parser.add_argument("--concurrent-requests", type=int, default=200)
+    parser.add_argument("--workers", type=int, default=1)
+    args = parser.parse_args()
+
+    with open(args.data, "rb") as f:
+        lines = f.read().rstrip(b"\n").split(b"\n")
+
+    with tempfile.TemporaryDirectory() as tmp:
+        model_path = os.path.join(tmp, "anomaly.joblib")
+        save_anomaly_model(fit_anomaly_model(load_invoice_data(args.data)), model_path)
+
+        small = os.path.join(tmp, "batch.csv")
+        with open(small, "wb") as f:
+            f.write(_batches(lines, args.batch_rows[0], 1)[0])
+        start = time.perf_counter()
+        subprocess.run(
+            [sys.executable, "-m", "src.run_pipeline", "--data", small, "--outdir", os.path.join(tmp, "out"),
+             "--anomaly-model", model_path],
+            check=True, capture_output=True, env={**os.environ, "PYTHONPATH": "."},
+        )
+        cold_s = time.perf_counter() - start
+        print(f"cold run_pipeline process, {args.batch_rows[0]} rows: {cold_s * 1000:8.1f} ms")
+
+        config = ServiceConfig(anomaly_model_path=model_path, workers=args.workers)
+        start = time.perf_counter()
+        server, service, url = _serve(config)
+        print(f"service warm start:                 {(time.perf_counter() - start) * 1000:8.1f} ms")
+
+        for rows in args.batch_rows:
+            bodies = _batches(lines, rows, args.requests)
+            _post(url, bodies[0])
+            latency = []
+            for body in bodies:
+                t0 = time.perf_counter()
+                _post(url, body)
+                latency.append((time.perf_counter() - t0) * 1000)
+            print(
+                f"warm /audit, {rows:>5} rows:  p50 {np.percentile(latency, 50):7.1f} ms  "
+                f"p95 {np.percentile(latency, 95):7.1f} ms"
+            )
+        bodies = _batches(lines, args.batch_rows[0], args.concurrent_requests)
+        alone = [pd.DataFrame(_post(url, b)["results"]) for b in bodies]
+        _stop(server, service)
+
+        # max_batch_rows=1 audits every submission on its own
+        for label, max_rows in (("off", 1), ("on", ServiceConfig.max_batch_rows)):
+            config = ServiceConfig(anomaly_model_path=model_path, workers=args.workers, max_batch_rows=max_rows)
+            server, service, url = _serve(config)
+            start = time.perf_counter()
+            with ThreadPoolExecutor(args.clients) as pool:
+                together = list(pool.map(lambda b: _post(url, b), bodies))
+            elapsed = time.perf_counter() - start
+            batches = service.health()["batches"]
+            _stop(server, service)
+            for a, b in zip(alone, together):
+                pd.testing.assert_frame_equal(a, pd.DataFrame(b["results"]))
+            print(
+                f"{len(bodies)} x {args.batch_rows[0]}-row submissions, {args.clients} clients, batching {label:>3}: "
+                f"{elapsed:6.2f}s  {len(bodies) / elapsed:7.1f} req/s  in {batches} batches  (results identical)"
+            )
+
+
+if __name__ == "__main__":
+    main()
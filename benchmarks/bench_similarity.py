@@ -0,0 +1,148 @@
+"""
+Similarity benchmark: accessorial descriptions scored through src.similarity
+vs a SequenceMatcher call per row.
+
+Draws a million billed descriptions: known spellings with case, punctuation,
+abbreviation and typo variants, plus a long tail of one-off text. It times
+contract-description scores three ways: SequenceMatcher per row, the cached
+ratio() per row, and ratio() once per distinct pair. It then maps
+descriptions to canonical codes with AccessorialCodebook against a full
+SequenceMatcher scan over the known spellings. Every output is checked
+against its reference.
+
+    PYTHONPATH=. python benchmarks/bench_similarity.py --rows 1000000
+"""
+import argparse
+import time
+from difflib import SequenceMatcher
+
+import numpy as np
+import pandas as pd
+
+from src.similarity import (
+    ACCESSORIAL_ALIASES,
+    AccessorialCodebook,
+    clear_pair_cache,
+    description_key,
+    pair_cache_info,
+    ratio,
+)
+
+CONTRACT_DESCS = ["Lift Gate Service", "Hazmat Handling", "Inside Delivery", "Residential", "Detention"]
+SHORTHAND = {"service": "svc", "delivery": "del.", "appointment": "appt", "residential": "resi", "limited": "ltd"}
+
+
+def _variant(text: str, rng: np.random.Generator) -> str:
+    words = text.split()
+    if rng.random() < 0.3:
+        words = [SHORTHAND.get(w, w) for w in words]
+    out = " ".join(words)
+    kind = rng.integers(0, 5)
+    if kind == 1 and len(out) > 3:
+        i = rng.integers(0, len(out))
+        out = out[:i] + out[i + 1:]
+    elif kind == 2 and len(out) > 3:
+        i = rng.integers(0, len(out) - 1)
+        out = out[:i] + out[i + 1] + out[i] + out[i + 2:]
+    elif kind == 3:
+        out = out.replace(" ", rng.choice(["-", "_", ""]))
+    case = rng.integers(0, 3)
+    return out.upper() if case == 0 else out.title() if case == 1 else out
+
+
+def make_descriptions(n: int, n_variants: int, tail_pct: float, seed: int = 42) -> np.ndarray:
+    rng = np.random.default_rng(seed)
+    spellings = [s for aliases in ACCESSORIAL_ALIASES.values() for s in aliases]
+    variants = sorted({_variant(spellings[rng.integers(len(spellings))], rng) for _ in range(n_variants)})
+    # a few spellings dominate, like real invoices
+    weights = 1.0 / np.arange(1, len(variants) + 1)
+    out = np.array(variants, dtype=object)[rng.choice(len(variants), size=n, p=weights / weights.sum())]
+    tail = rng.random(n) < tail_pct
+    out[tail] = [f"misc charge {i}" for i in rng.integers(0, 10**7, int(tail.sum()))]
+    return out
+
+
+def full_scan_coder(min_score: float):
+    """Code lookup without dict, index or cache: the best ratio over every known spelling, first wins."""
+    keys, codes = [], []
+    for code, spellings in ACCESSORIAL_ALIASES.items():
+        for spelling in [code] + spellings:
+            key = description_key(spelling)
+            if key not in keys:
+                keys.append(key)
+                codes.append(code)
+
+    def code(text):
+        key = description_key(text)
+        if not key:
+            return None
+        scores = [SequenceMatcher(None, key, k).ratio() for k in keys]
+        best = int(np.argmax(scores))
+        return codes[best] if scores[best] >= min_score else None
+
+    return code
+
+
+def _timeit(fn, *args):
+    start = time.perf_counter()
+    out = fn(*args)
+    return out, time.perf_counter() - start
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, default=1_000_000)
+    parser.add_argument("--variants", type=int, default=400)
+    parser.add_argument("--tail-pct", type=float, default=0.002, help="Share of one-off descriptions")
+    parser.add_argument("--scan-rows", type=int, default=20_000, help="Rows coded by the full-scan reference")
+    args = parser.parse_args()
+
+    n = args.rows
+    billed = make_descriptions(n, args.variants, args.tail_pct)
+    contract = np.array(CONTRACT_DESCS, dtype=object)[np.random.default_rng(7).integers(0, len(CONTRACT_DESCS), n)]
+    print(f"{n:,} descriptions, {len(pd.unique(billed)):,} distinct")
+
+    def per_row_matcher():
+        return np.array([SequenceMatcher(None, str(a).lower(), str(b).lower()).ratio() for a, b in zip(billed, contract)])
+
+    def per_row_cached():
+        return np.array([ratio(a, b) for a, b in zip(billed, contract)])
+
+    def per_pair():
+        pairs = pd.DataFrame({"a": billed, "b": contract})
+        codes = pairs.groupby(["a", "b"], sort=False).ngroup().to_numpy()
+        firsts = pairs.drop_duplicates()
+        return np.array([ratio(a, b) for a, b in zip(firsts["a"], firsts["b"])])[codes]
+
+    reference, ref_s = _timeit(per_row_matcher)
+    clear_pair_cache()
+    cached, cached_s = _timeit(per_row_cached)
+    info = pair_cache_info()
+    clear_pair_cache()
+    bulk, bulk_s = _timeit(per_pair)
+    np.testing.assert_array_equal(cached, reference)
+    np.testing.assert_array_equal(bulk, reference)
+    print(f"pair scores    SequenceMatcher per row {ref_s:7.2f}s ({n / ref_s:>12,.0f}/s)")
+    print(
+        f"{'':15}cached ratio per row    {cached_s:7.2f}s ({n / cached_s:>12,.0f}/s)  "
+        f"{info.hits / max(info.hits + info.misses, 1):6.1%} cache hits"
+    )
+    print(f"{'':15}ratio per distinct pair {bulk_s:7.2f}s ({n / bulk_s:>12,.0f}/s)  (scores identical)")
+
+    codebook = AccessorialCodebook()
+    codes, cold_s = _timeit(codebook.codes, billed)
+    _, warm_s = _timeit(codebook.codes, billed)
+    sample = billed[: args.scan_rows]
+    full_scan_code = full_scan_coder(codebook.min_score)
+    scan, scan_s = _timeit(lambda: [full_scan_code(d) for d in sample])
+    assert codes[: len(sample)].tolist() == scan
+    coded = pd.Series(codes).notna().mean()
+    print(
+        f"codes          full scan per row       {scan_s:7.2f}s ({len(sample) / scan_s:>12,.0f}/s on {len(sample):,} rows)"
+    )
+    print(f"{'':15}codebook, cold          {cold_s:7.2f}s ({n / cold_s:>12,.0f}/s)  {coded:6.1%} coded")
+    print(f"{'':15}codebook, warm          {warm_s:7.2f}s ({n / warm_s:>12,.0f}/s)  (sample matches full scan)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,104 @@
+"""
+Startup benchmark: how long the CLI takes before any invoice is read.
+
+Times fresh interpreters importing pandas alone, importing src.run_pipeline and
+running ``--help``, then a 1k-row run with every stage vs ``--stages rules
+summary``. The slowest imports under src come from ``-X importtime``.
+
+Exits 1 if importing src.run_pipeline pulls in a dependency that should wait
+for its stage (sklearn, openai, ...), or costs more than --max-overhead-ms on
+top of pandas, so import-time regressions fail CI:
+
+    PYTHONPATH=. python benchmarks/bench_startup.py --repeat 5 --max-overhead-ms 300
+"""
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+# loaded only by the stage that needs them
+DEFERRED = ("sklearn", "scipy", "joblib", "openai", "httpx")
+
+
+def _run(args: list, env: dict) -> float:
+    start = time.perf_counter()
+    subprocess.run([sys.executable, *args], env=env, check=True, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    return time.perf_counter() - start
+
+
+def _median(args: list, env: dict, repeat: int) -> float:
+    return statistics.median(_run(args, env) for _ in range(repeat))
+
+
+def deferred_imports(env: dict) -> list:
+    code = (
+        "import sys, src.run_pipeline; "
+        f"print(' '.join(sorted({{m.split('.')[0] for m in sys.modules}} & set({DEFERRED!r}))))"
+    )
+    out = subprocess.run([sys.executable, "-c", code], env=env, check=True, capture_output=True, text=True).stdout
+    return out.split()
+
+
+def slowest_imports(env: dict, top: int) -> list:
+    """(cumulative ms, module) for the slowest top-level src and third-party imports."""
+    err = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", "import src.run_pipeline"],
+        env=env, check=True, capture_output=True, text=True,
+    ).stderr
+    rows = []
+    for line in err.splitlines():
+        _, cumulative, name = line.split("|")
+        if not cumulative.strip().isdigit():
+            continue
+        depth = (len(name) - len(name.lstrip()) - 1) // 2
+        if name.strip().startswith("src.") or depth <= 1:
+            rows.append((int(cumulative) / 1000, name.strip()))
+    return sorted(rows, reverse=True)[:top]
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--top", type=int, default=8, help="Slowest imports to list")
+    parser.add_argument("--data", default="data/freight_invoices_1k.csv")
+    parser.add_argument("--max-overhead-ms", type=float, default=300.0,
+                        help="Fail if importing src.run_pipeline takes this much longer than importing pandas")
+    args = parser.parse_args()
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join(filter(None, [os.getcwd(), os.environ.get("PYTHONPATH")])))
+
+    pandas_s = _median(["-c", "import pandas"], env, args.repeat)
+    import_s = _median(["-c", "import src.run_pipeline"], env, args.repeat)
+    help_s = _median(["-m", "src.run_pipeline", "--help"], env, args.repeat)
+    with tempfile.TemporaryDirectory() as tmp:
+        run = ["-m", "src.run_pipeline", "--data", args.data, "--outdir", tmp]
+        all_s = _median(run, env, args.repeat)
+        rules_s = _median(run + ["--stages", "rules", "summary"], env, args.repeat)
+
+    overhead_ms = (import_s - pandas_s) * 1000
+    print(f"import pandas               {pandas_s * 1000:7.0f} ms")
+    print(f"import src.run_pipeline     {import_s * 1000:7.0f} ms  ({overhead_ms:+.0f} ms over pandas)")
+    print(f"run_pipeline --help         {help_s * 1000:7.0f} ms")
+    print(f"1k rows, all stages         {all_s * 1000:7.0f} ms")
+    print(f"1k rows, rules summary      {rules_s * 1000:7.0f} ms")
+    print("slowest imports (cumulative):")
+    for ms, name in slowest_imports(env, args.top):
+        print(f"  {ms:8.1f} ms  {name}")
+
+    failures = []
+    loaded = deferred_imports(env)
+    if loaded:
+        failures.append(f"importing src.run_pipeline loads {', '.join(loaded)}")
+    if overhead_ms > args.max_overhead_ms:
+        failures.append(f"import overhead {overhead_ms:.0f} ms is over the {args.max_overhead_ms:.0f} ms budget")
+    for failure in failures:
+        print(f"FAIL: {failure}")
+    if failures:
+        sys.exit(1)
+    print("OK: no deferred dependency imported at startup, overhead within budget")
+
+
+if __name__ == "__main__":
+    main()
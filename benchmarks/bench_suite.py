@@ -0,0 +1,239 @@
+"""
+Benchmark suite: times every pipeline stage across dataset sizes and
+reconcile_invoices across rate-table sizes, and writes the results as JSON.
+
+Datasets come from the vectorized engine of
+data/generators/synthetic_invoice_generator.py with a fixed seed. They are
+cached under --data-dir so reruns (and runs on other commits) time the same
+bytes. Each measurement is the fastest of --repeat runs.
+
+    PYTHONPATH=. python benchmarks/bench_suite.py --sizes 10000 100000 --out before.json
+    PYTHONPATH=. python benchmarks/bench_suite.py --sizes 10000 100000 --compare before.json
+
+With --compare, any measurement more than --threshold slower than the baseline
+(and slower by at least --min-seconds, to ignore timer noise on tiny stages)
+is reported and the script exits with status 1.
+"""
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+from benchmarks.bench_lane_index import make_tables as make_lanes
+from data.generators.synthetic_invoice_generator import write_invoices
+from src.anomaly import fit_anomaly_model, has_anomaly_features, score_anomalies
+from src.ingest import load_invoice_data
+from src.llm_explainer import build_rule_explanations
+from src.rate_engine import compute_expected_billing
+from src.reconciliation import reconcile_invoices
+from src.reporting import summarize_leakage
+from src.rules_engine import apply_leakage_rules
+from src.stage_metrics import StageRecorder
+from tests.helpers import ACCESSORIALS, BILLED_DESCS
+
+SIZES = [10_000, 100_000, 1_000_000, 5_000_000]
+CONTRACTS = [100, 1_000, 10_000]
+RESULTS_VERSION = 1
+
+
+def dataset_path(data_dir: str, n: int, seed: int, workers: int = 1) -> str:
+    """Generated CSV for (n, seed), written on first use."""
+    path = os.path.join(data_dir, f"invoices_{n}_seed{seed}_vectorized.csv")
+    if not os.path.exists(path):
+        os.makedirs(data_dir, exist_ok=True)
+        start = time.perf_counter()
+        write_invoices(path, n, seed, workers=workers)
+        print(f"generated {path} in {time.perf_counter() - start:.1f}s", file=sys.stderr)
+    return path
+
+
+def make_reconcile_tables(n_contracts: int, n_invoices: int, seed: int = 42):
+    """bench_lane_index lanes (a third with typos) with the reconciliation columns filled in."""
+    lanes, rates = make_lanes(n_contracts, n_invoices, seed)
+    rng = np.random.default_rng(seed)
+    rates = rates.assign(
+        contract_lane_desc=rates["origin"] + " -> " + rates["destination"],
+        contract_rate_per_mile=rng.uniform(1.5, 3.5, n_contracts).round(2),
+        allowed_fuel_surcharge_pct=rng.choice([25.0, 30.0, 35.0], n_contracts),
+        allowed_accessorial_desc=rng.choice(ACCESSORIALS, n_contracts),
+        allowed_accessorial_cap=rng.choice([75.0, 85.0, 100.0], n_contracts),
+    )
+    invoices = pd.DataFrame(
+        {
+            "invoice_id": [f"INV-{i}" for i in range(n_invoices)],
+            "load_id": [f"LD-{i}" for i in range(n_invoices)],
+            "origin": lanes["origin"],
+            "destination": lanes["destination"],
+            "miles_billed": rng.integers(100, 1500, n_invoices),
+            "rate_billed_per_mile": rng.uniform(1.5, 3.6, n_invoices).round(2),
+            "fuel_surcharge_pct": rng.choice([24.0, 30.0, 34.0, 36.5], n_invoices),
+            "accessorial_desc": rng.choice(BILLED_DESCS, n_invoices),
+            "accessorial_amount": rng.choice([60.0, 85.0, 95.0, 125.0], n_invoices),
+        }
+    )
+    return invoices, rates
+
+
+def _pipeline_once(path: str, seed: int, anomaly: bool) -> StageRecorder:
+    metrics = StageRecorder()
+    with metrics.stage("load_invoice_data") as st:
+        df = load_invoice_data(path)
+        st.rows_out = len(df)
+    with metrics.stage("compute_expected_billing", rows_in=len(df)) as st:
+        df = compute_expected_billing(df)
+        st.rows_out = len(df)
+    with metrics.stage("apply_leakage_rules", rows_in=len(df)) as st:
+        df = apply_leakage_rules(df)
+        st.rows_out = int(df["is_flagged"].sum())
+    with metrics.stage("summarize_leakage", rows_in=len(df)):
+        summarize_leakage(df)
+    if anomaly and has_anomaly_features(df):
+        with metrics.stage("anomaly_fit", rows_in=len(df)):
+            model = fit_anomaly_model(df, random_state=seed)
+        with metrics.stage("anomaly_score", rows_in=len(df)) as st:
+            flags, _ = score_anomalies(model, df)
+            st.rows_out = int(flags.sum())
+    with metrics.stage("explanations", rows_in=len(df)) as st:
+        flagged = df[df["flag_reason"].fillna("") != ""]
+        st.rows_out = len(build_rule_explanations(flagged))
+    return metrics
+
+
+def _reconcile_once(invoices: pd.DataFrame, rates: pd.DataFrame) -> StageRecorder:
+    metrics = StageRecorder()
+    with metrics.stage("reconcile_invoices", rows_in=len(invoices)) as st:
+        result, _ = reconcile_invoices(invoices, rates)
+        st.rows_out = len(result)
+    return metrics
+
+
+def _fastest(runs: list, prefix: str) -> dict:
+    """Per stage, the record of the run with the lowest wall time."""
+    best = {}
+    for metrics in runs:
+        for name, m in metrics.stages.items():
+            key = f"{prefix}/{name}"
+            if key not in best or m.wall_s < best[key]["wall_s"]:
+                best[key] = {
+                    "wall_s": round(m.wall_s, 6),
+                    "cpu_s": round(m.cpu_s, 6),
+                    "rows_in": m.rows_in,
+                    "rows_out": m.rows_out,
+                }
+    return best
+
+
+def _git_commit() -> str:
+    try:
+        out = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True)
+        return out.stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def run_suite(sizes, contracts, reconcile_invoices_n: int, seed: int, repeat: int, data_dir: str, anomaly: bool,
+              gen_workers: int = 1) -> dict:
+    results = {}
+    for n in sizes:
+        path = dataset_path(data_dir, n, seed, gen_workers)
+        results.update(_fastest([_pipeline_once(path, seed, anomaly) for _ in range(repeat)], f"pipeline/{n}"))
+        print(f"pipeline {n:>10,} rows done", file=sys.stderr)
+    for c in contracts:
+        invoices, rates = make_reconcile_tables(c, reconcile_invoices_n, seed)
+        results.update(_fastest([_reconcile_once(invoices, rates) for _ in range(repeat)], f"reconcile/{c}"))
+        print(f"reconcile {c:>9,} contracts done", file=sys.stderr)
+    return {
+        "version": RESULTS_VERSION,
+        "commit": _git_commit(),
+        "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": platform.python_version(),
+        "pandas": pd.__version__,
+        "numpy": np.__version__,
+        "machine": platform.machine(),
+        "cpu_count": os.cpu_count(),
+        "seed": seed,
+        "repeat": repeat,
+        "results": results,
+    }
+
+
+def compare(current: dict, baseline: dict, threshold: float, min_seconds: float) -> list:
+    """(key, baseline_s, current_s) for every measurement that regressed past the threshold."""
+    regressions = []
+    for key, cur in current["results"].items():
+        base = baseline["results"].get(key)
+        if base is None:
+            continue
+        b, c = base["wall_s"], cur["wall_s"]
+        if c > b * (1 + threshold) and c - b >= min_seconds:
+            regressions.append((key, b, c))
+    return regressions
+
+
+def _print_results(current: dict, baseline: dict = None) -> None:
+    print(f"{'measurement':<44} {'wall':>9} {'cpu':>9}" + (f" {'baseline':>9} {'change':>8}" if baseline else ""))
+    for key, r in current["results"].items():
+        line = f"{key:<44} {r['wall_s']:>8.3f}s {r['cpu_s']:>8.3f}s"
+        base = (baseline or {}).get("results", {}).get(key)
+        if base:
+            change = r["wall_s"] / max(base["wall_s"], 1e-9) - 1
+            line += f" {base['wall_s']:>8.3f}s {change:>+7.1%}"
+        print(line)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sizes", type=int, nargs="*", default=SIZES)
+    parser.add_argument("--contracts", type=int, nargs="*", default=CONTRACTS, help="Rate-table sizes for reconcile_invoices")
+    parser.add_argument("--reconcile-invoices", type=int, default=10_000)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--data-dir", default=".cache/bench_data")
+    parser.add_argument("--gen-workers", type=int, default=os.cpu_count() or 1, help="Processes generating datasets")
+    parser.add_argument("--no-anomaly", action="store_true", help="Skip the anomaly fit/score stages")
+    parser.add_argument("--out", default=None, help="Results JSON (default: .cache/bench_results/<commit>.json)")
+    parser.add_argument("--results", default=None, help="Compare this results file instead of running the suite")
+    parser.add_argument("--compare", default=None, help="Baseline results JSON to check for regressions")
+    parser.add_argument("--threshold", type=float, default=0.20, help="Allowed slowdown as a fraction")
+    parser.add_argument("--min-seconds", type=float, default=0.05, help="Ignore slowdowns smaller than this")
+    args = parser.parse_args()
+
+    if args.results:
+        with open(args.results, encoding="utf-8") as f:
+            current = json.load(f)
+    else:
+        current = run_suite(
+            args.sizes, args.contracts, args.reconcile_invoices, args.seed,
+            args.repeat, args.data_dir, anomaly=not args.no_anomaly, gen_workers=args.gen_workers,
+        )
+        out = args.out or os.path.join(".cache", "bench_results", f"{current['commit']}.json")
+        os.makedirs(os.path.dirname(out) or ".", exist_ok=True)
+        with open(out, "w", encoding="utf-8") as f:
+            json.dump(current, f, indent=2)
+        print(f"results written to {out}", file=sys.stderr)
+
+    baseline = None
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            baseline = json.load(f)
+    _print_results(current, baseline)
+    if baseline is None:
+        return
+
+    regressions = compare(current, baseline, args.threshold, args.min_seconds)
+    print(f"\nbaseline {baseline.get('commit')} vs {current.get('commit')}: "
+          f"{len(regressions)} regression(s) past {args.threshold:.0%}")
+    for key, b, c in regressions:
+        print(f"  REGRESSION {key}: {b:.3f}s -> {c:.3f}s ({c / max(b, 1e-9) - 1:+.1%})")
+    if regressions:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -8,8 +8,16 @@ Features:
 - Seasonal pricing patterns (Q4 peak, fuel surcharges)
 - Realistic accessorial charges
 - Intentional errors (5-10% of invoices)
+
+generate_invoices draws one invoice at a time from Python's random module and
+is kept for the checked-in samples. For load-test sizes use write_invoices (or
+--engine vectorized), which draws whole columns with NumPy in fixed-size
+shards. Each shard has its own seed derived from (seed, shard number), so the
+output depends only on --seed, --n and --shard-rows, not on --workers.
 """
 import argparse
+import os
+from concurrent.futures import ProcessPoolExecutor
 from pathlib import Path
 import pandas as pd
 import numpy as np
@@ -18,6 +26,27 @@ import random
 from typing import Dict, List, Tuple
 import hashlib
 
+SHARD_ROWS = 500_000
+OUTPUT_FORMATS = ("csv", "parquet")
+
+# Order matters for the vectorized path: it is the order _select_accessorials
+# appends services in, so the joined strings match.
+VECTOR_ACCESSORIALS = [
+    'residential_delivery', 'liftgate_delivery', 'inside_delivery', 'appointment_delivery', 'limited_access'
+]
+ERROR_TYPES = [
+    'underbilled_linehaul',
+    'missing_fuel_surcharge',
+    'incorrect_fuel_rate',
+    'missing_accessorial',
+    'wrong_residential_flag'
+]
+ERROR_WEIGHTS = [0.35, 0.25, 0.20, 0.15, 0.05]
+
+_ID_MASK = (1 << 48) - 1
+_ID_MULT = 0x9E3779B97F4A7C15  # odd, so i -> i * MULT mod 2**48 is a bijection
+_HEX = np.frombuffer(b"0123456789ABCDEF", dtype=np.uint8)
+
 
 class FreightInvoiceGenerator:
     """Generate realistic synthetic freight invoices with billing errors."""
@@ -303,6 +332,253 @@ class FreightInvoiceGenerator:
         
         return df
 
+    def generate_invoices_vectorized(
+        self,
+        n: int,
+        rng: np.random.Generator,
+        start_index: int = 0,
+        id_salt: int = 0,
+        start_date: datetime = None,
+        end_date: datetime = None,
+        error_rate: float = 0.08
+    ) -> pd.DataFrame:
+        """
+        Same columns and distributions as generate_invoices, drawn as arrays
+        from ``rng``. Invoice ids are a bijective scramble of the row number
+        (start_index + i), so they never collide across shards.
+        """
+        start_date = np.datetime64(start_date or datetime(2024, 1, 1), 'D')
+        end_date = np.datetime64(end_date or datetime(2024, 12, 31), 'D')
+
+        cities = list(self.zip_codes)
+        zips = np.array([self.zip_codes[c] for c in cities], dtype=object)
+        carriers = list(self.carriers)
+        rate_per_mile = np.array([self.carriers[c]['base_rate_per_mile'] for c in carriers])
+        min_charge = np.array([self.carriers[c]['min_charge'] for c in carriers], dtype=float)
+        fuel_base = np.array([self.carriers[c]['fuel_base'] for c in carriers])
+        known = np.zeros((len(cities), len(cities)))
+        for (a, b), miles in self.distances.items():
+            known[cities.index(a), cities.index(b)] = known[cities.index(b), cities.index(a)] = miles
+
+        origin = rng.integers(len(cities), size=n)
+        dest = (origin + 1 + rng.integers(len(cities) - 1, size=n)) % len(cities)
+        origin_zip = zips[origin, rng.integers(zips.shape[1], size=n)]
+        dest_zip = zips[dest, rng.integers(zips.shape[1], size=n)]
+        carrier = rng.integers(len(carriers), size=n)
+
+        base_distance = known[origin, dest]
+        unknown = base_distance == 0
+        base_distance[unknown] = rng.integers(300, 2501, size=int(unknown.sum()))
+        distance = (base_distance * rng.uniform(0.95, 1.05, size=n)).astype(np.int64)
+        weight = rng.integers(50, 5001, size=n)
+
+        day = start_date + rng.integers(0, (end_date - start_date).astype(int) + 1, size=n)
+        weekday = (day.astype(np.int64) + 3) % 7  # 1970-01-01 was a Thursday
+        move = (weekday >= 5) & (rng.random(n) > 0.3)
+        day = day + np.where(move, 7 - weekday, 0)
+        is_residential = rng.random(n) < 0.3
+
+        base_rate = np.maximum(distance * rate_per_mile[carrier], min_charge[carrier])
+        base_rate *= np.where(weight > 2000, 1.15, np.where(weight < 200, 1.2, 1.0))
+        q4 = day.astype('datetime64[M]').astype(np.int64) % 12 >= 9
+        fuel_rate = fuel_base[carrier] * np.where(
+            q4, rng.uniform(1.15, 1.25, size=n), rng.uniform(1.0, 1.1, size=n)
+        )
+        fuel_charge = base_rate * fuel_rate
+
+        draws = rng.random((n, 5))
+        services = np.column_stack([
+            is_residential & (draws[:, 0] < 0.6),
+            np.where(is_residential, draws[:, 1] < 0.4, draws[:, 1] < 0.15),
+            draws[:, 2] < 0.1,
+            draws[:, 3] < 0.2,
+            draws[:, 4] < 0.08,
+        ])
+        prices = np.array([self.accessorials[s] for s in VECTOR_ACCESSORIALS], dtype=float)
+        code = services @ (1 << np.arange(len(VECTOR_ACCESSORIALS)))
+        joined = np.array([
+            ','.join(s for k, s in enumerate(VECTOR_ACCESSORIALS) if c >> k & 1)
+            for c in range(1 << len(VECTOR_ACCESSORIALS))
+        ], dtype=object)
+        accessorial_total = services @ prices
+        expected_total = base_rate + fuel_charge + accessorial_total
+
+        linehaul = np.round(base_rate, 2)
+        fuel = np.round(fuel_charge, 2)
+        accessorials = np.round(accessorial_total, 2)
+        actual_linehaul, actual_fuel, actual_acc = linehaul.copy(), fuel.copy(), accessorials.copy()
+        actual_total = np.round(expected_total, 2)
+        error_injected = np.full(n, 'none', dtype=object)
+        error_amount = np.zeros(n)
+
+        has_error = rng.random(n) < error_rate
+        error_type = rng.choice(len(ERROR_TYPES), size=n, p=ERROR_WEIGHTS)
+        error_draw = rng.random(n)
+
+        hit = has_error & (error_type == 0)
+        actual_linehaul[hit] *= 1 - (0.10 + 0.20 * error_draw[hit])
+        error_amount[hit] = linehaul[hit] - actual_linehaul[hit]
+
+        hit = has_error & (error_type == 1)
+        actual_fuel[hit] = 0.0
+        error_amount[hit] = fuel[hit]
+
+        hit = has_error & (error_type == 2)
+        actual_fuel[hit] = fuel[hit] * (0.5 + 0.3 * error_draw[hit])
+        error_amount[hit] = fuel[hit] - actual_fuel[hit]
+
+        counts = services.sum(axis=1)
+        hit = has_error & (error_type == 3) & (counts > 0)
+        pick = np.floor(error_draw * counts).astype(np.int64)
+        chosen = np.argmax(services.cumsum(axis=1) > pick[:, None], axis=1)
+        actual_acc[hit] -= prices[chosen[hit]]
+        error_amount[hit] = prices[chosen[hit]]
+        error_injected[hit] = np.array(
+            [f'missing_accessorial_{s}' for s in VECTOR_ACCESSORIALS], dtype=object
+        )[chosen[hit]]
+
+        hit = has_error & (error_type == 4) & is_residential
+        actual_acc[hit] -= 95
+        error_amount[hit] = 95.0
+
+        for k in (0, 1, 2, 4):
+            error_injected[has_error & (error_type == k) & (error_amount != 0)] = ERROR_TYPES[k]
+        actual_total[has_error] = (actual_linehaul + actual_fuel + actual_acc)[has_error]
+
+        index = np.arange(start_index, start_index + n, dtype=np.uint64)
+        scrambled = (index * np.uint64(_ID_MULT) + np.uint64(id_salt & _ID_MASK)) & np.uint64(_ID_MASK)
+        nibbles = (scrambled[:, None] >> np.arange(44, -1, -4, dtype=np.uint64)) & np.uint64(15)
+        invoice_id = _HEX[nibbles].view('S12').ravel().astype(str)
+
+        df = pd.DataFrame({
+            'invoice_id': invoice_id,
+            'shipment_date': day.astype(str),
+            'carrier': np.array(carriers, dtype=object)[carrier],
+            'origin_zip': origin_zip,
+            'dest_zip': dest_zip,
+            'origin_city': np.array(cities, dtype=object)[origin],
+            'dest_city': np.array(cities, dtype=object)[dest],
+            'distance_miles': distance,
+            'weight_lbs': weight,
+            'is_residential': is_residential,
+            'accessorial_services': joined[code],
+            'expected_linehaul': linehaul,
+            'expected_fuel_surcharge': fuel,
+            'expected_fuel_rate_pct': np.round(fuel_rate * 100, 2),
+            'expected_accessorials': accessorials,
+            'expected_total': np.round(expected_total, 2),
+            'actual_billed_linehaul': actual_linehaul,
+            'actual_billed_fuel': actual_fuel,
+            'actual_billed_accessorials': actual_acc,
+            'actual_total_billed': actual_total,
+            'error_injected': error_injected,
+            'error_amount': error_amount,
+        })
+        df['leakage_amount'] = df['expected_total'] - df['actual_total_billed']
+        df['leakage_pct'] = (df['leakage_amount'] / df['expected_total'] * 100).round(2)
+        df['has_leakage'] = df['leakage_amount'] > 1.0
+        return df
+
+
+def shard_rng(seed: int, shard: int) -> np.random.Generator:
+    """Independent, reproducible stream for one shard of a seeded dataset."""
+    return np.random.default_rng(np.random.SeedSequence(seed, spawn_key=(shard,)))
+
+
+def generate_shard(seed: int, shard: int, rows: int, shard_rows: int = SHARD_ROWS,
+                   error_rate: float = 0.08) -> pd.DataFrame:
+    """Rows [shard * shard_rows, shard * shard_rows + rows) of the dataset for ``seed``."""
+    return FreightInvoiceGenerator(seed=seed).generate_invoices_vectorized(
+        rows,
+        shard_rng(seed, shard),
+        start_index=shard * shard_rows,
+        id_salt=seed * _ID_MULT,
+        error_rate=error_rate,
+    )
+
+
+def _shard_sizes(n: int, shard_rows: int) -> List[int]:
+    return [min(shard_rows, n - start) for start in range(0, n, shard_rows)]
+
+
+def _ordered_map(fn, calls: List[tuple], workers: int):
+    """fn(*args) for each args in order; in a process pool at most 2 * workers ahead."""
+    if workers <= 1:
+        for args in calls:
+            yield fn(*args)
+        return
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        pending = []
+        for args in calls:
+            pending.append(pool.submit(fn, *args))
+            if len(pending) >= 2 * workers:
+                yield pending.pop(0).result()
+        for future in pending:
+            yield future.result()
+
+
+def iter_invoice_shards(n: int, seed: int = 42, shard_rows: int = SHARD_ROWS, workers: int = 1,
+                        error_rate: float = 0.08):
+    """Yield the dataset's shards in order, generated by ``workers`` processes."""
+    calls = [(seed, shard, rows, shard_rows, error_rate) for shard, rows in enumerate(_shard_sizes(n, shard_rows))]
+    yield from _ordered_map(generate_shard, calls, workers)
+
+
+def _encoded_shard(seed: int, shard: int, rows: int, shard_rows: int, error_rate: float, fmt: str):
+    """
+    One shard already encoded for writing (CSV text or an Arrow table) plus its
+    totals, so the formatting cost is spread over the workers too.
+    """
+    df = generate_shard(seed, shard, rows, shard_rows, error_rate)
+    totals = {
+        'rows': len(df),
+        'spend': float(df['actual_total_billed'].sum()),
+        'with_leakage': int(df['has_leakage'].sum()),
+        'leakage': float(df['leakage_amount'].sum()),
+    }
+    if fmt == "parquet":
+        import pyarrow as pa
+
+        return pa.Table.from_pandas(df, preserve_index=False), totals
+    return df.to_csv(index=False, header=shard == 0), totals
+
+
+def write_invoices(path: str, n: int, seed: int = 42, fmt: str = "csv", shard_rows: int = SHARD_ROWS,
+                   workers: int = 1, error_rate: float = 0.08) -> Dict[str, float]:
+    """
+    Stream the vectorized dataset to ``path`` shard by shard (CSV appends,
+    Parquet row groups) and return running totals for the printed summary.
+    """
+    if fmt not in OUTPUT_FORMATS:
+        raise ValueError(f"Unknown output format: {fmt!r} (expected one of {OUTPUT_FORMATS})")
+    calls = [
+        (seed, shard, rows, shard_rows, error_rate, fmt)
+        for shard, rows in enumerate(_shard_sizes(n, shard_rows))
+    ]
+    totals = {'rows': 0, 'spend': 0.0, 'with_leakage': 0, 'leakage': 0.0}
+    tmp = f"{path}.tmp"
+    out = open(tmp, "w", encoding="utf-8", newline="") if fmt == "csv" else None
+    writer = None
+    try:
+        for payload, shard_totals in _ordered_map(_encoded_shard, calls, workers):
+            if out is not None:
+                out.write(payload)
+            else:
+                import pyarrow.parquet as pq
+
+                if writer is None:
+                    writer = pq.ParquetWriter(tmp, payload.schema)
+                writer.write_table(payload)
+            for key, value in shard_totals.items():
+                totals[key] += value
+    finally:
+        if out is not None:
+            out.close()
+        if writer is not None:
+            writer.close()
+    os.replace(tmp, path)
+    return totals
+
 
 def main():
     parser = argparse.ArgumentParser(description="Generate synthetic freight invoices")
@@ -310,10 +586,28 @@ def main():
     parser.add_argument("--seed", type=int, default=42, help="Random seed")
     parser.add_argument("--n", type=int, default=10000, help="Number of invoices")
     parser.add_argument("--error-rate", type=float, default=0.08, help="Fraction of invoices with injected errors")
+    parser.add_argument("--engine", choices=["rows", "vectorized"], default="rows",
+                        help="rows: the original per-invoice generator; vectorized: NumPy shards streamed to --out")
+    parser.add_argument("--format", choices=OUTPUT_FORMATS, default="csv", help="Output format (vectorized engine)")
+    parser.add_argument("--shard-rows", type=int, default=SHARD_ROWS, help="Rows per shard (vectorized engine)")
+    parser.add_argument("--workers", type=int, default=1, help="Processes generating shards (vectorized engine)")
     args = parser.parse_args()
 
     print(f"Generating {args.n:,} synthetic freight invoices...")
 
+    if args.engine == "vectorized":
+        out_path = Path(args.out)
+        out_path.parent.mkdir(parents=True, exist_ok=True)
+        totals = write_invoices(str(out_path), args.n, args.seed, args.format, args.shard_rows,
+                                args.workers, args.error_rate)
+        print(f"Generated {totals['rows']} invoices")
+        print(f"Dataset saved to: {out_path}")
+        print(f"   Total freight spend: ${totals['spend']:,.2f}")
+        print(f"   Invoices with errors: {totals['with_leakage']} "
+              f"({totals['with_leakage'] / max(totals['rows'], 1) * 100:.1f}%)")
+        print(f"   Total leakage: ${totals['leakage']:,.2f}")
+        return
+
     generator = FreightInvoiceGenerator(seed=args.seed)
     df = generator.generate_invoices(n=args.n, error_rate=args.error_rate)
 
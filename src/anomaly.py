@@ -1,36 +1,465 @@
+"""
+Isolation Forest anomaly scoring: fit once, persist, score many.
+
+fit_anomaly_model trains on (a subsample of) history and save_anomaly_model
+writes it together with its feature list and ANOMALY_SCHEMA_VERSION. Nightly
+runs load the artifact and score_anomalies each batch in chunks; retraining is
+a separate, scheduled step:
+
+    PYTHONPATH=. python -m src.anomaly fit --data history.csv --model models/anomaly.joblib --max-samples 200000
+
+With segment_by, one forest is fitted per segment (carrier, distance band) in
+a process pool; segments too small to model fall back to the global forest.
+"""
+import argparse
+import importlib.util
+import os
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional, Tuple, Union
+
+import numpy as np
 import pandas as pd
-from sklearn.ensemble import IsolationForest
+
+from src.ingest import SYNTHETIC_TO_PIPELINE_MAP
+from src.rate_engine import DISTANCE_BANDS, distance_band_index
+
+
+def anomaly_available() -> bool:
+    """Whether scikit-learn is installed. Checked without importing it: the
+    import costs about a second, so it waits until a forest is fitted or loaded."""
+    return importlib.util.find_spec("sklearn") is not None
+
+
+# Bump when the feature list or its preprocessing changes; older artifacts
+# are then refused instead of silently scoring different inputs.
+ANOMALY_SCHEMA_VERSION = 1
+
+ANOMALY_FEATURES = [
+    "distance_miles",
+    "weight_lb",
+    "base_linehaul_amount",
+    "fuel_surcharge_amount",
+    "actual_billed_total",
+]
+
+SCORE_CHUNKSIZE = 100_000
+
+SEGMENT_KEYS = ("carrier", "distance_band")
+MIN_SEGMENT_ROWS = 1000
+GLOBAL_SEGMENT = "(global)"
+SCALE_SAMPLE_ROWS = 10_000
+
+_PIPELINE_TO_SYNTHETIC = {v: k for k, v in SYNTHETIC_TO_PIPELINE_MAP.items()}
+
+
+@dataclass
+class AnomalyModel:
+    model: "IsolationForest"
+    features: List[str] = field(default_factory=lambda: list(ANOMALY_FEATURES))
+    schema_version: int = ANOMALY_SCHEMA_VERSION
+    trained_rows: int = 0
+    # std of score_samples over the training rows; divides segment scores
+    score_scale: float = 1.0
+
+
+@dataclass
+class SegmentedAnomalyModel:
+    """
+    One forest per segment plus a global fallback.
+
+    Scores are normalized per segment as (score_samples - offset_) / score_scale,
+    so 0 is each segment's contamination threshold and the units are that
+    segment's spread, which makes them comparable across segments.
+    """
+    segment_by: str
+    global_model: AnomalyModel
+    segments: Dict[str, AnomalyModel] = field(default_factory=dict)
+    min_segment_rows: int = MIN_SEGMENT_ROWS
+
+    @property
+    def features(self) -> List[str]:
+        return self.global_model.features
+
+
+def _feature_column(df: pd.DataFrame, name: str) -> Optional[str]:
+    if name in df.columns:
+        return name
+    alias = _PIPELINE_TO_SYNTHETIC.get(name)
+    return alias if alias in df.columns else None
+
+
+def has_anomaly_features(df: pd.DataFrame, features: Optional[List[str]] = None) -> bool:
+    return all(_feature_column(df, f) is not None for f in (features or ANOMALY_FEATURES))
+
+
+def anomaly_features(df: pd.DataFrame, features: Optional[List[str]] = None) -> np.ndarray:
+    """
+    Feature matrix in ``features`` order. Pipeline or synthetic column names
+    are accepted; non-numeric values and gaps become 0.
+    """
+    features = features or ANOMALY_FEATURES
+    cols = []
+    for name in features:
+        col = _feature_column(df, name)
+        if col is None:
+            raise KeyError(f"Anomaly feature {name!r} missing from frame")
+        cols.append(pd.to_numeric(df[col], errors="coerce").to_numpy(dtype=np.float64, na_value=np.nan))
+    return np.nan_to_num(np.column_stack(cols), nan=0.0) if cols else np.empty((len(df), 0))
+
+
+def fit_anomaly_model(
+    df: pd.DataFrame,
+    n_estimators: int = 200,
+    contamination: float = 0.05,
+    max_samples: Optional[int] = None,
+    random_state: int = 42,
+    features: Optional[List[str]] = None,
+    n_jobs: Optional[int] = -1,
+) -> AnomalyModel:
+    """
+    Fit an Isolation Forest on ``df``.
+
+    max_samples: fit on at most this many rows, drawn without replacement, so
+    training cost stays flat as history grows. None fits on every row. Each
+    tree still draws its own small sample ("auto") from the training rows.
+    n_jobs: threads the trees are built in (IsolationForest's n_jobs; -1 uses
+    every core). The fitted forest is the same for any value.
+    """
+    features = list(features or ANOMALY_FEATURES)
+    return _fit_forest(
+        anomaly_features(df, features), features, n_estimators, contamination, max_samples, random_state, n_jobs=n_jobs
+    )
+
+
+def _fit_forest(
+    X: np.ndarray,
+    features: List[str],
+    n_estimators: int,
+    contamination: float,
+    max_samples: Optional[int],
+    random_state: int,
+    with_scale: bool = False,
+    n_jobs: Optional[int] = None,
+) -> AnomalyModel:
+    if not anomaly_available():
+        raise ImportError("scikit-learn is required for anomaly detection")
+    from sklearn.ensemble import IsolationForest
+
+    rng = np.random.default_rng(random_state)
+    if max_samples is not None and len(X) > max_samples:
+        X = X[np.sort(rng.choice(len(X), size=max_samples, replace=False))]
+    model = IsolationForest(
+        n_estimators=n_estimators, contamination=contamination, random_state=random_state, n_jobs=n_jobs
+    )
+    model.fit(X)
+    scale = 1.0
+    if with_scale:
+        # the spread is stable well before every training row is scored; a seeded
+        # random subset keeps it from following whatever order the history is in
+        sample = X
+        if len(X) > SCALE_SAMPLE_ROWS:
+            sample = X[rng.choice(len(X), size=SCALE_SAMPLE_ROWS, replace=False)]
+        scale = float(np.std(model.score_samples(sample))) or 1.0
+    return AnomalyModel(model=model, features=features, trained_rows=len(X), score_scale=scale)
+
+
+def segment_labels(df: pd.DataFrame, segment_by: str) -> np.ndarray:
+    """Segment name per row: the carrier, or the rate engine's distance band."""
+    if segment_by == "distance_band":
+        col = _feature_column(df, "distance_miles")
+        return DISTANCE_BANDS[distance_band_index(df[col])].astype(object)
+    if segment_by not in df.columns:
+        raise KeyError(f"Segment column {segment_by!r} missing from frame")
+    return df[segment_by].astype(str).to_numpy(dtype=object, na_value="nan")
+
+
+def _pool_map(fn, tasks: list, workers: int) -> list:
+    if workers <= 1 or len(tasks) <= 1:
+        return [fn(*t) for t in tasks]
+    with ProcessPoolExecutor(max_workers=min(workers, len(tasks))) as pool:
+        return list(pool.map(fn, *zip(*tasks)))
+
+
+def fit_segmented_anomaly_model(
+    df: pd.DataFrame,
+    segment_by: str,
+    n_estimators: int = 200,
+    contamination: float = 0.05,
+    max_samples: Optional[int] = None,
+    random_state: int = 42,
+    min_segment_rows: int = MIN_SEGMENT_ROWS,
+    workers: int = 1,
+    features: Optional[List[str]] = None,
+) -> SegmentedAnomalyModel:
+    """
+    Fit the global forest and one per segment with at least
+    ``min_segment_rows`` rows, ``workers`` fits at a time in a process pool.
+    max_samples applies to each fit separately. A single worker builds each
+    forest's trees on every core instead.
+    """
+    features = list(features or ANOMALY_FEATURES)
+    X = anomaly_features(df, features)
+    labels = segment_labels(df, segment_by)
+    names, codes, counts = np.unique(labels, return_inverse=True, return_counts=True)
+    big = [i for i, c in enumerate(counts) if c >= min_segment_rows]
+
+    params = (features, n_estimators, contamination, max_samples, random_state, True, -1 if workers <= 1 else 1)
+    tasks = [(X, *params)] + [(X[codes == i], *params) for i in big]
+    fitted = _pool_map(_fit_forest, tasks, workers)
+
+    return SegmentedAnomalyModel(
+        segment_by=segment_by,
+        global_model=fitted[0],
+        segments={str(names[i]): m for i, m in zip(big, fitted[1:])},
+        min_segment_rows=min_segment_rows,
+    )
+
+
+def _score_forest(model: AnomalyModel, X: np.ndarray) -> np.ndarray:
+    return model.model.score_samples(X)
+
+
+# the model a SegmentScorePool worker scores with, set once when the worker starts
+_worker_model: Optional[SegmentedAnomalyModel] = None
+
+
+def _init_score_worker(model: SegmentedAnomalyModel) -> None:
+    global _worker_model
+    _worker_model = model
+
+
+def _score_worker_segment(name: str, X: np.ndarray) -> np.ndarray:
+    return _score_forest(_worker_model.segments.get(name, _worker_model.global_model), X)
+
+
+class SegmentScorePool:
+    """
+    Process pool for scoring many batches with one SegmentedAnomalyModel.
+
+    Each worker is handed the model once, when it starts, and tasks carry only
+    a segment name and its feature rows. Chunked runs reuse one pool for every
+    chunk instead of starting processes and pickling every forest per chunk.
+    """
+
+    def __init__(self, model: SegmentedAnomalyModel, workers: int):
+        self.model = model
+        self._pool = ProcessPoolExecutor(
+            max_workers=max(1, workers), initializer=_init_score_worker, initargs=(model,)
+        )
+
+    def map(self, names: List[str], blocks: List[np.ndarray]) -> List[np.ndarray]:
+        return list(self._pool.map(_score_worker_segment, names, blocks))
+
+    def close(self) -> None:
+        self._pool.shutdown()
+
+    def __enter__(self) -> "SegmentScorePool":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+
+def score_anomalies(
+    model: Union[AnomalyModel, SegmentedAnomalyModel],
+    df: pd.DataFrame,
+    chunksize: int = SCORE_CHUNKSIZE,
+    workers: int = 1,
+) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    (anomaly_flag, anomaly_score) per row, scored ``chunksize`` rows at a time.
+
+    anomaly_score is IsolationForest.score_samples (lower is more anomalous);
+    a row is flagged when it falls below the model's contamination threshold.
+    For a SegmentedAnomalyModel the score is normalized per segment (see its
+    docstring) and segments are scored ``workers`` at a time, each in pieces of
+    at most ``chunksize`` rows.
+    """
+    if isinstance(model, SegmentedAnomalyModel):
+        flags, scores, _ = score_segmented_anomalies(model, df, workers=workers, chunksize=chunksize)
+        return flags, scores
+
+    scores = np.empty(len(df), dtype=np.float64)
+    for start in range(0, len(df), chunksize):
+        part = df.iloc[start:start + chunksize]
+        scores[start:start + len(part)] = model.model.score_samples(anomaly_features(part, model.features))
+    return scores < model.model.offset_, scores
+
+
+def score_segmented_anomalies(
+    model: SegmentedAnomalyModel,
+    df: pd.DataFrame,
+    workers: int = 1,
+    pool: Optional[SegmentScorePool] = None,
+    chunksize: int = SCORE_CHUNKSIZE,
+) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    (anomaly_flag, normalized anomaly_score, segment) per row; see SegmentedAnomalyModel.
+
+    Each segment's rows are scored in pieces of at most ``chunksize``.
+    pool: a SegmentScorePool over ``model`` to score in, kept across calls.
+    Without one, ``workers`` > 1 starts a process pool for this call only.
+    """
+    if pool is not None and pool.model is not model:
+        raise ValueError("SegmentScorePool was started for a different anomaly model")
+    X = anomaly_features(df, model.features)
+    labels = segment_labels(df, model.segment_by)
+    # rows of unseen or too-small segments go to the global forest
+    segment = np.where(pd.Series(labels).isin(list(model.segments)).to_numpy(), labels, GLOBAL_SEGMENT)
+
+    groups = []
+    for name in pd.unique(segment):
+        rows = np.flatnonzero(segment == name)
+        groups += [(name, rows[start:start + chunksize]) for start in range(0, len(rows), chunksize)]
+    forests = [model.segments.get(name, model.global_model) for name, _ in groups]
+    if pool is not None and len(groups) > 1:
+        raw = pool.map([name for name, _ in groups], [X[rows] for _, rows in groups])
+    else:
+        raw = _pool_map(_score_forest, [(m, X[rows]) for m, (_, rows) in zip(forests, groups)], workers)
+
+    scores = np.empty(len(df), dtype=np.float64)
+    for m, (_, rows), r in zip(forests, groups, raw):
+        scores[rows] = (r - m.model.offset_) / m.score_scale
+    return scores < 0, scores, segment.astype(object)
+
+
+def _model_payload(model: AnomalyModel) -> dict:
+    return {
+        "features": model.features,
+        "trained_rows": model.trained_rows,
+        "score_scale": model.score_scale,
+        "model": model.model,
+    }
+
+
+def _model_from_payload(payload: dict, version: int) -> AnomalyModel:
+    return AnomalyModel(
+        model=payload["model"],
+        features=list(payload["features"]),
+        schema_version=version,
+        trained_rows=payload.get("trained_rows", 0),
+        score_scale=payload.get("score_scale", 1.0),
+    )
+
+
+def save_anomaly_model(model: Union[AnomalyModel, SegmentedAnomalyModel], path: str) -> None:
+    import joblib
+
+    if isinstance(model, SegmentedAnomalyModel):
+        artifact = {
+            **_model_payload(model.global_model),
+            "segment_by": model.segment_by,
+            "min_segment_rows": model.min_segment_rows,
+            "segments": {name: _model_payload(m) for name, m in model.segments.items()},
+        }
+    else:
+        artifact = _model_payload(model)
+    artifact["schema_version"] = ANOMALY_SCHEMA_VERSION
+
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    tmp_path = path + ".tmp"
+    joblib.dump(artifact, tmp_path)
+    os.replace(tmp_path, path)
+
+
+def load_anomaly_model(path: str) -> Union[AnomalyModel, SegmentedAnomalyModel]:
+    import joblib
+
+    artifact = joblib.load(path)
+    version = artifact.get("schema_version")
+    if version != ANOMALY_SCHEMA_VERSION:
+        raise ValueError(
+            f"Anomaly model {path} has schema version {version}, expected {ANOMALY_SCHEMA_VERSION}; retrain it"
+        )
+    model = _model_from_payload(artifact, version)
+    if "segment_by" not in artifact:
+        return model
+    return SegmentedAnomalyModel(
+        segment_by=artifact["segment_by"],
+        global_model=model,
+        segments={name: _model_from_payload(p, version) for name, p in artifact["segments"].items()},
+        min_segment_rows=artifact["min_segment_rows"],
+    )
 
 
 def run_anomaly_detection(
     df: pd.DataFrame,
     contamination: float = 0.06,
     random_state: int = 42,
+    n_estimators: int = 250,
+    max_samples: Optional[int] = None,
+    n_jobs: Optional[int] = -1,
 ) -> pd.DataFrame:
-    x = df[
-        [
-            "distance_miles",
-            "weight_lbs",
-            "expected_linehaul",
-            "expected_fuel_surcharge",
-            "expected_accessorials",
-            "expected_total",
-            "actual_total_billed",
-        ]
-    ].copy()
-
-    x = x.apply(pd.to_numeric, errors="coerce").fillna(0.0)
-
-    model = IsolationForest(
-        n_estimators=250,
+    """Fit and score in one go; anomaly_score here is the decision function (negative = anomalous)."""
+    model = fit_anomaly_model(
+        df,
+        n_estimators=n_estimators,
         contamination=contamination,
+        max_samples=max_samples,
         random_state=random_state,
-        n_jobs=-1,
+        n_jobs=n_jobs,
     )
-    pred = model.fit_predict(x)
-    score = model.decision_function(x)
+    flags, scores = score_anomalies(model, df)
 
     out = df.copy()
-    out["anomaly_flag"] = (pred == -1)
-    out["anomaly_score"] = score
+    out["anomaly_flag"] = flags
+    out["anomaly_score"] = scores - model.model.offset_
     return out
+
+
+def main() -> None:
+    from src.ingest import load_invoice_data
+
+    parser = argparse.ArgumentParser(description="Train or score the anomaly model")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    fit_p = sub.add_parser("fit", help="Train on history and save the artifact")
+    fit_p.add_argument("--data", required=True)
+    fit_p.add_argument("--model", required=True, help="Path of the artifact to write")
+    fit_p.add_argument("--max-samples", type=int, default=None,
+                       help="Train on at most this many rows drawn from --data")
+    fit_p.add_argument("--n-estimators", type=int, default=200)
+    fit_p.add_argument("--contamination", type=float, default=0.05)
+    fit_p.add_argument("--seed", type=int, default=42)
+    fit_p.add_argument("--segment-by", choices=SEGMENT_KEYS, default=None,
+                       help="Fit one model per carrier or distance band")
+    fit_p.add_argument("--min-segment-rows", type=int, default=MIN_SEGMENT_ROWS,
+                       help="Smaller segments are scored by the global model")
+    fit_p.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+
+    score_p = sub.add_parser("score", help="Score a file with a saved artifact")
+    score_p.add_argument("--data", required=True)
+    score_p.add_argument("--model", required=True)
+    score_p.add_argument("--out", required=True, help="CSV of shipment_id, anomaly_flag, anomaly_score")
+    score_p.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+
+    args = parser.parse_args()
+    df = load_invoice_data(args.data)
+    if args.command == "fit":
+        params = dict(
+            n_estimators=args.n_estimators,
+            contamination=args.contamination,
+            max_samples=args.max_samples,
+            random_state=args.seed,
+        )
+        if args.segment_by:
+            model = fit_segmented_anomaly_model(
+                df, args.segment_by, min_segment_rows=args.min_segment_rows, workers=args.workers, **params
+            )
+            trained = f"{len(model.segments)} {args.segment_by} segments + global"
+        else:
+            model = fit_anomaly_model(df, **params)
+            trained = f"{model.trained_rows} rows"
+        save_anomaly_model(model, args.model)
+        print(f"Anomaly model trained ({trained}), written to: {args.model}")
+    else:
+        model = load_anomaly_model(args.model)
+        flags, scores = score_anomalies(model, df, workers=args.workers)
+        out = pd.DataFrame({"shipment_id": df["shipment_id"], "anomaly_flag": flags, "anomaly_score": scores})
+        out.to_csv(args.out, index=False)
+        print(f"Scored {len(out)} rows ({int(flags.sum())} flagged), written to: {args.out}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,360 @@
+"""
+Near-duplicate detection: re-bills that come back under a new shipment_id.
+
+Rows are blocked on a hash of the carrier and lane (block_on columns) plus the
+ship date, and only rows in the same block within window_days of each other
+become candidate pairs. Candidates are then scored on how close their billed
+amount and weight are. The exact POSSIBLE_DUPLICATE rule already covers
+repeated ids, so pairs sharing a shipment_id are skipped here.
+
+A DuplicateIndex keeps the blocking key, amount and weight of every row it has
+seen in one SQLite file, indexed on (block, day). Each batch is checked against
+itself and, with one range lookup per row, against that history:
+
+    PYTHONPATH=. python -m src.duplicates check --data today.csv --index reports/duplicates.db --add
+"""
+import argparse
+import json
+import os
+import sqlite3
+import time
+from contextlib import closing
+from dataclasses import dataclass
+from typing import Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+INDEX_TABLE = "duplicate_index"
+META_TABLE = "duplicate_meta"
+# Bump when the blocking hash or the stored columns change; older index files
+# are then refused rather than compared against keys built a different way.
+# 2: block columns are normalized before hashing, so int and float zips agree.
+DUPLICATE_INDEX_VERSION = 2
+
+DEFAULT_BLOCK_COLUMNS = ("carrier", "origin_zip", "destination_zip")
+ZIP_COLUMNS = ("origin_zip", "destination_zip")
+
+PAIR_COLUMNS = [
+    "shipment_id",
+    "duplicate_of",
+    "ship_date",
+    "duplicate_of_ship_date",
+    "day_gap",
+    "amount_diff_pct",
+    "weight_diff_pct",
+    "score",
+]
+
+
+@dataclass(frozen=True)
+class DuplicateConfig:
+    window_days: int = 3
+    amount_tolerance_pct: float = 1.0
+    weight_tolerance_pct: float = 2.0
+    # columns missing from a frame are left out of the block key
+    block_on: Tuple[str, ...] = DEFAULT_BLOCK_COLUMNS
+
+
+@dataclass
+class DuplicateStats:
+    """Counts and timings for one check, for tuning the blocking."""
+    batch_rows: int = 0
+    blocked_rows: int = 0
+    history_rows: int = 0
+    batch_candidates: int = 0
+    history_candidates: int = 0
+    matched_pairs: int = 0
+    block_s: float = 0.0
+    lookup_s: float = 0.0
+    score_s: float = 0.0
+
+    @property
+    def candidate_pairs(self) -> int:
+        return self.batch_candidates + self.history_candidates
+
+
+def _block_text(values: pd.Series, is_zip: bool = False) -> np.ndarray:
+    """
+    One block column as stripped text that doesn't depend on its dtype: whole
+    numbers lose any ".0" (zips read as float when one is missing), zips are
+    padded to five digits and missing values become "".
+    """
+    if pd.api.types.is_numeric_dtype(values) and not pd.api.types.is_bool_dtype(values):
+        numbers = pd.to_numeric(values)
+        if (numbers.dropna() % 1 == 0).all():
+            values = numbers.astype("Int64")
+    text = values.astype("string").str.strip()
+    if is_zip:
+        text = text.str.zfill(5)
+    return text.fillna("").to_numpy(dtype=object)
+
+
+def block_keys(df: pd.DataFrame, config: DuplicateConfig = DuplicateConfig()) -> pd.DataFrame:
+    """
+    Blocking key per row: block (int64 hash of the block_on columns), day
+    (days since epoch) plus the fields candidates are scored on. Rows without
+    a ship date can't be blocked and are dropped; ``row`` is their position in ``df``.
+    """
+    cols = [c for c in config.block_on if c in df.columns]
+    if cols:
+        parts = pd.DataFrame({c: _block_text(df[c], is_zip=c in ZIP_COLUMNS) for c in cols})
+        block = pd.util.hash_pandas_object(parts, index=False).to_numpy().view(np.int64)
+    else:
+        block = np.zeros(len(df), dtype=np.int64)
+    day = pd.to_datetime(df["ship_date"], errors="coerce").to_numpy().astype("datetime64[D]")
+    keys = pd.DataFrame(
+        {
+            "row": np.arange(len(df), dtype=np.int64),
+            "block": block,
+            "day": day.astype(np.int64),
+            "shipment_id": df["shipment_id"].astype(str).to_numpy(),
+            "amount": pd.to_numeric(df["actual_billed_total"], errors="coerce").to_numpy(dtype=np.float64),
+            "weight": pd.to_numeric(df["weight_lb"], errors="coerce").to_numpy(dtype=np.float64),
+        }
+    )
+    return keys[~np.isnat(day)].reset_index(drop=True)
+
+
+def _batch_candidates(keys: pd.DataFrame, window_days: int) -> pd.DataFrame:
+    """Pairs of rows in the same block at most window_days apart, each pair once."""
+    left = keys[["row", "block", "day"]]
+    pairs = []
+    for offset in range(window_days + 1):
+        right = left.assign(day=left["day"] - offset)
+        m = left.merge(right, on=["block", "day"], suffixes=("_a", "_b"))
+        if offset == 0:
+            m = m[m["row_a"] < m["row_b"]]
+        pairs.append(m[["row_a", "row_b"]])
+    return pd.concat(pairs, ignore_index=True)
+
+
+def _relative_diff(a: np.ndarray, b: np.ndarray) -> np.ndarray:
+    scale = np.maximum(np.maximum(np.abs(a), np.abs(b)), 0.01)
+    return np.abs(a - b) / scale
+
+
+def score_pairs(
+    new: pd.DataFrame,
+    old: pd.DataFrame,
+    config: DuplicateConfig = DuplicateConfig(),
+) -> pd.DataFrame:
+    """
+    PAIR_COLUMNS for aligned candidate rows (new[i] vs old[i]) that fall within
+    both tolerances. score is 1 for identical amount, weight and date and falls
+    towards 0 at the edge of the tolerances and the date window.
+    """
+    amount_diff = _relative_diff(new["amount"].to_numpy(), old["amount"].to_numpy())
+    weight_diff = _relative_diff(new["weight"].to_numpy(), old["weight"].to_numpy())
+    day_gap = np.abs(new["day"].to_numpy() - old["day"].to_numpy())
+    amount_tol = config.amount_tolerance_pct / 100.0
+    weight_tol = config.weight_tolerance_pct / 100.0
+
+    keep = (
+        (amount_diff <= amount_tol)
+        & (weight_diff <= weight_tol)
+        & (new["shipment_id"].to_numpy() != old["shipment_id"].to_numpy())
+    )
+    score = 1.0 - (
+        0.5 * amount_diff / max(amount_tol, 1e-12)
+        + 0.3 * weight_diff / max(weight_tol, 1e-12)
+        + 0.2 * day_gap / (config.window_days + 1)
+    )
+    return pd.DataFrame(
+        {
+            "shipment_id": new["shipment_id"].to_numpy()[keep],
+            "duplicate_of": old["shipment_id"].to_numpy()[keep],
+            "ship_date": new["day"].to_numpy()[keep].astype("datetime64[D]"),
+            "duplicate_of_ship_date": old["day"].to_numpy()[keep].astype("datetime64[D]"),
+            "day_gap": day_gap[keep],
+            "amount_diff_pct": np.round(amount_diff[keep] * 100.0, 4),
+            "weight_diff_pct": np.round(weight_diff[keep] * 100.0, 4),
+            "score": np.round(score[keep], 4),
+        },
+        columns=PAIR_COLUMNS,
+    )
+
+
+def sort_pairs(pairs: pd.DataFrame) -> pd.DataFrame:
+    return pairs.sort_values(
+        ["score", "shipment_id", "duplicate_of"], ascending=[False, True, True], kind="stable"
+    ).reset_index(drop=True)
+
+
+def _pairs_within(keys: pd.DataFrame, config: DuplicateConfig, stats: DuplicateStats) -> pd.DataFrame:
+    t0 = time.perf_counter()
+    cand = _batch_candidates(keys, config.window_days)
+    t1 = time.perf_counter()
+    by_row = keys.set_index("row")
+    first = np.minimum(cand["row_a"].to_numpy(), cand["row_b"].to_numpy())
+    later = np.maximum(cand["row_a"].to_numpy(), cand["row_b"].to_numpy())
+    pairs = score_pairs(by_row.loc[later].reset_index(), by_row.loc[first].reset_index(), config)
+    t2 = time.perf_counter()
+
+    stats.batch_candidates += len(cand)
+    stats.matched_pairs += len(pairs)
+    stats.block_s += t1 - t0
+    stats.score_s += t2 - t1
+    return pairs
+
+
+def _blocked(df: pd.DataFrame, config: DuplicateConfig, stats: DuplicateStats) -> pd.DataFrame:
+    t0 = time.perf_counter()
+    keys = block_keys(df, config)
+    stats.batch_rows += len(df)
+    stats.blocked_rows += len(keys)
+    stats.block_s += time.perf_counter() - t0
+    return keys
+
+
+def find_near_duplicates(
+    df: pd.DataFrame,
+    config: DuplicateConfig = DuplicateConfig(),
+    stats: Optional[DuplicateStats] = None,
+) -> pd.DataFrame:
+    """Near-duplicate pairs within one frame. The later row in ``df`` is the shipment_id."""
+    stats = stats if stats is not None else DuplicateStats()
+    return sort_pairs(_pairs_within(_blocked(df, config, stats), config, stats))
+
+
+class DuplicateIndex:
+    """Blocking keys of every row seen so far, in a single SQLite file."""
+
+    def __init__(self, path: str, config: DuplicateConfig = DuplicateConfig()):
+        self.path = path
+        self.config = config
+        self._settings = {"version": DUPLICATE_INDEX_VERSION, "block_on": list(config.block_on)}
+        with closing(sqlite3.connect(self.path)) as conn:
+            conn.execute(
+                f"CREATE TABLE IF NOT EXISTS {INDEX_TABLE} "
+                "(block INTEGER, day INTEGER, shipment_id TEXT, amount REAL, weight REAL, "
+                "UNIQUE (block, day, shipment_id, amount, weight))"
+            )
+            conn.execute(f"CREATE INDEX IF NOT EXISTS {INDEX_TABLE}_block_day ON {INDEX_TABLE} (block, day)")
+            conn.execute(f"CREATE TABLE IF NOT EXISTS {META_TABLE} (settings TEXT)")
+            row = conn.execute(f"SELECT settings FROM {META_TABLE}").fetchone()
+            if row is None:
+                conn.execute(f"INSERT INTO {META_TABLE} VALUES (?)", (json.dumps(self._settings),))
+            elif json.loads(row[0]) != self._settings:
+                raise ValueError(
+                    f"Duplicate index {path} was built with {json.loads(row[0])}, not {self._settings}; "
+                    "rebuild it by deleting the file and indexing the history again"
+                )
+            conn.commit()
+
+    def __len__(self) -> int:
+        with closing(sqlite3.connect(self.path)) as conn:
+            return conn.execute(f"SELECT COUNT(*) FROM {INDEX_TABLE}").fetchone()[0]
+
+    def _history_candidates(self, keys: pd.DataFrame) -> pd.DataFrame:
+        """History rows in the same block within window_days of each batch row (``row`` = batch row)."""
+        with closing(sqlite3.connect(self.path)) as conn:
+            conn.execute("CREATE TEMP TABLE probe (row INTEGER, block INTEGER, day INTEGER)")
+            conn.executemany(
+                "INSERT INTO probe VALUES (?, ?, ?)",
+                keys[["row", "block", "day"]].itertuples(index=False, name=None),
+            )
+            return pd.read_sql(
+                f"SELECT p.row AS row, h.block AS block, h.day AS day, h.shipment_id AS shipment_id, "
+                f"h.amount AS amount, h.weight AS weight "
+                f"FROM probe p JOIN {INDEX_TABLE} h "
+                f"ON h.block = p.block AND h.day BETWEEN p.day - ? AND p.day + ?",
+                conn,
+                params=(self.config.window_days, self.config.window_days),
+            )
+
+    def check(self, df: pd.DataFrame, stats: Optional[DuplicateStats] = None) -> pd.DataFrame:
+        """
+        Near-duplicate pairs for ``df``: within the batch, and each batch row
+        (shipment_id) against the history rows already indexed (duplicate_of).
+        """
+        stats = stats if stats is not None else DuplicateStats()
+        keys = _blocked(df, self.config, stats)
+        within = _pairs_within(keys, self.config, stats)
+
+        t0 = time.perf_counter()
+        hist = self._history_candidates(keys)
+        # rows of this batch indexed by an earlier run are compared within the batch already
+        hist = hist[~hist["shipment_id"].isin(keys["shipment_id"])]
+        t1 = time.perf_counter()
+        new = keys.set_index("row").loc[hist["row"].to_numpy()].reset_index()
+        against_history = score_pairs(new, hist, self.config)
+        t2 = time.perf_counter()
+
+        stats.history_rows = len(self)
+        stats.history_candidates += len(hist)
+        stats.matched_pairs += len(against_history)
+        stats.lookup_s += t1 - t0
+        stats.score_s += t2 - t1
+        return sort_pairs(pd.concat([within, against_history], ignore_index=True))
+
+    def add(self, df: pd.DataFrame) -> int:
+        """Index the rows of ``df``; rows already present are skipped. Returns rows added."""
+        keys = block_keys(df, self.config)
+        with closing(sqlite3.connect(self.path)) as conn:
+            before = conn.total_changes
+            conn.executemany(
+                f"INSERT OR IGNORE INTO {INDEX_TABLE} VALUES (?, ?, ?, ?, ?)",
+                keys[["block", "day", "shipment_id", "amount", "weight"]].itertuples(index=False, name=None),
+            )
+            conn.commit()
+            return conn.total_changes - before
+
+    def prune(self, keep_days: int) -> int:
+        """Drop rows more than keep_days older than the newest indexed day. Returns rows removed."""
+        with closing(sqlite3.connect(self.path)) as conn:
+            newest = conn.execute(f"SELECT MAX(day) FROM {INDEX_TABLE}").fetchone()[0]
+            if newest is None:
+                return 0
+            removed = conn.execute(f"DELETE FROM {INDEX_TABLE} WHERE day < ?", (newest - keep_days,)).rowcount
+            conn.commit()
+            return removed
+
+
+def format_stats(stats: DuplicateStats) -> str:
+    return (
+        f"{stats.blocked_rows}/{stats.batch_rows} rows blocked, {stats.history_rows} indexed; "
+        f"candidates {stats.batch_candidates} in batch + {stats.history_candidates} vs history; "
+        f"{stats.matched_pairs} near-duplicate pairs "
+        f"(block {stats.block_s:.3f}s, lookup {stats.lookup_s:.3f}s, score {stats.score_s:.3f}s)"
+    )
+
+
+def main() -> None:
+    from src.ingest import load_invoice_data
+
+    parser = argparse.ArgumentParser(description="Find near-duplicate invoices")
+    sub = parser.add_subparsers(dest="command", required=True)
+    check_p = sub.add_parser("check", help="Check a file against itself and the index")
+    check_p.add_argument("--data", required=True)
+    check_p.add_argument("--index", default=None, help="SQLite index of past rows (created if missing)")
+    check_p.add_argument("--add", action="store_true", help="Add the file's rows to the index afterwards")
+    check_p.add_argument("--out", default=None, help="CSV of near-duplicate pairs")
+    check_p.add_argument("--window-days", type=int, default=DuplicateConfig.window_days)
+    check_p.add_argument("--amount-tolerance-pct", type=float, default=DuplicateConfig.amount_tolerance_pct)
+    check_p.add_argument("--weight-tolerance-pct", type=float, default=DuplicateConfig.weight_tolerance_pct)
+    check_p.add_argument("--retain-days", type=int, default=None,
+                         help="After adding, drop indexed rows older than this many days")
+
+    args = parser.parse_args()
+    config = DuplicateConfig(args.window_days, args.amount_tolerance_pct, args.weight_tolerance_pct)
+    df = load_invoice_data(args.data)
+    stats = DuplicateStats()
+    if args.index:
+        index = DuplicateIndex(args.index, config)
+        pairs = index.check(df, stats)
+        if args.add:
+            index.add(df)
+            if args.retain_days is not None:
+                index.prune(args.retain_days)
+    else:
+        pairs = find_near_duplicates(df, config, stats)
+
+    print(format_stats(stats))
+    if args.out:
+        pairs.to_csv(args.out, index=False)
+        print(f"Near-duplicate pairs written to: {args.out}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,88 @@
+"""
+Fuel surcharge indexed to a weekly diesel price.
+
+Two tables make a schedule: a dated price series (effective_date, diesel_price,
+e.g. the weekly DOE on-highway average) and brackets mapping that price to a
+fuel percent (price_upper_bound, fuel_pct; the last bracket has an empty
+bound). A shipment takes the latest price effective on or before its
+ship_date. That is an as-of join, done with one searchsorted over the sorted
+dates. It then takes the bracket the price falls in, using the rate engine's
+tier rule: upper_bound[i-1] < price <= upper_bound[i].
+
+Shipments dated before the first price, or without a ship_date, get NaN and
+keep the rate engine's own fuel percent.
+"""
+import hashlib
+from dataclasses import dataclass
+
+import numpy as np
+import pandas as pd
+
+PRICE_COLUMNS = ["effective_date", "diesel_price"]
+BRACKET_COLUMNS = ["price_upper_bound", "fuel_pct"]
+
+
+def _datetime_ns(values) -> np.ndarray:
+    """int64 nanoseconds since the epoch; missing or unparseable dates become NaT (int64 min)."""
+    dates = pd.to_datetime(pd.Series(values), errors="coerce")
+    return dates.to_numpy(dtype="datetime64[ns]").view(np.int64)
+
+
+@dataclass(frozen=True)
+class FuelSchedule:
+    dates: np.ndarray  # int64 ns, sorted and unique
+    prices: np.ndarray  # diesel price effective from each date
+    breaks: np.ndarray  # bracket upper bounds, sorted
+    pcts: np.ndarray  # fuel fraction per bracket, len(breaks) + 1
+
+    def price_on(self, ship_dates) -> np.ndarray:
+        """Diesel price in effect on each ship date (NaN before the series starts)."""
+        when = _datetime_ns(ship_dates)
+        pos = np.searchsorted(self.dates, when, side="right") - 1
+        valid = (pos >= 0) & (when != np.iinfo(np.int64).min)
+        return np.where(valid, self.prices[np.maximum(pos, 0)], np.nan)
+
+    def fuel_pct(self, ship_dates) -> np.ndarray:
+        price = self.price_on(ship_dates)
+        pct = self.pcts[np.searchsorted(self.breaks, price, side="left")]
+        return np.where(np.isnan(price), np.nan, pct)
+
+    @property
+    def fingerprint(self) -> str:
+        digest = hashlib.sha256()
+        for arr in (self.dates, self.prices, self.breaks, self.pcts):
+            digest.update(np.ascontiguousarray(arr).tobytes())
+        return digest.hexdigest()[:16]
+
+
+def build_fuel_schedule(prices: pd.DataFrame, brackets: pd.DataFrame) -> FuelSchedule:
+    for name, table, columns in (("prices", prices, PRICE_COLUMNS), ("brackets", brackets, BRACKET_COLUMNS)):
+        missing = [c for c in columns if c not in table.columns]
+        if missing:
+            raise ValueError(f"Fuel {name} table is missing columns: {missing}")
+
+    dates = _datetime_ns(prices["effective_date"])
+    price = pd.to_numeric(prices["diesel_price"], errors="coerce").to_numpy(dtype=np.float64)
+    if (dates == np.iinfo(np.int64).min).any() or np.isnan(price).any():
+        raise ValueError("Every fuel price needs an effective_date and a numeric diesel_price")
+    order = np.argsort(dates, kind="stable")
+    dates, price = dates[order], price[order]
+    if (np.diff(dates) == 0).any():
+        raise ValueError("Fuel prices have more than one price for the same effective_date")
+
+    bound = pd.to_numeric(brackets["price_upper_bound"], errors="coerce").to_numpy(dtype=np.float64)
+    pct = pd.to_numeric(brackets["fuel_pct"], errors="coerce").to_numpy(dtype=np.float64)
+    order = np.argsort(np.where(np.isnan(bound), np.inf, bound), kind="stable")
+    bound, pct = bound[order], pct[order]
+    if np.isnan(pct).any():
+        raise ValueError("Every fuel bracket needs a numeric fuel_pct")
+    if len(bound) == 0 or not np.isnan(bound[-1]) or np.isnan(bound[:-1]).any():
+        raise ValueError("Exactly one fuel bracket (the last) must have an empty price_upper_bound")
+    if (np.diff(bound[:-1]) <= 0).any():
+        raise ValueError("Fuel bracket upper bounds must be distinct")
+
+    return FuelSchedule(dates=dates, prices=price, breaks=bound[:-1], pcts=pct)
+
+
+def load_fuel_schedule(prices_path: str, brackets_path: str) -> FuelSchedule:
+    return build_fuel_schedule(pd.read_csv(prices_path), pd.read_csv(brackets_path))
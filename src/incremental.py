@@ -0,0 +1,151 @@
+"""
+Incremental (delta) runs keyed on shipment_id.
+
+A SQLite state store keeps one row per shipment from the previous run: a hash
+of the ingested row plus the per-row results (underbilled amount, flag mask,
+explanation). The next run reprocesses only rows that are new, changed, or
+whose cross-row rules (e.g. POSSIBLE_DUPLICATE) flipped, and reuses the rest.
+"""
+import json
+import os
+import sqlite3
+from contextlib import closing
+from typing import Optional
+
+import numpy as np
+import pandas as pd
+
+STATE_TABLE = "shipment_state"
+META_TABLE = "state_meta"
+# Bump when row_hashes changes what it hashes; state stored under another
+# version is discarded instead of every row silently missing its hash.
+ROW_HASH_VERSION = 2
+
+STATE_COLUMNS = [
+    "row_key",
+    "row_hash",
+    "underbilled_amount",
+    "flag_mask",
+    "explanation",
+    "model",
+    "used_llm",
+]
+
+
+def row_keys(df: pd.DataFrame) -> pd.Series:
+    """shipment_id plus its occurrence number, so repeated ids get distinct keys."""
+    ids = df["shipment_id"].astype(str)
+    return ids + "#" + ids.groupby(ids, sort=False).cumcount().astype(str)
+
+
+def _canonical_values(values: pd.Series, kind) -> np.ndarray:
+    """
+    ``values`` as numbers and booleans in float64, dates in int64 nanoseconds
+    and anything else as objects with None for missing, whatever ``kind`` of
+    column (NumPy, nullable, Arrow) they were stored in.
+    """
+    if pd.api.types.is_datetime64_any_dtype(kind):
+        return pd.to_datetime(values).astype("datetime64[ns]").to_numpy().view(np.int64)
+    if pd.api.types.is_bool_dtype(kind) or pd.api.types.is_numeric_dtype(kind):
+        return values.to_numpy(dtype=np.float64, na_value=np.nan)
+    values = values.to_numpy(dtype=object)
+    return np.where(pd.isna(values), None, values)
+
+
+def _column_hash(col: pd.Series) -> np.ndarray:
+    """
+    uint64 hash of each value of ``col`` that depends on the value, not the
+    dtype: a categorical hashes like its decoded column, a float32 like its
+    float64 value. Strings and categoricals are hashed once per distinct value.
+    """
+    if isinstance(col.dtype, pd.CategoricalDtype):
+        codes, uniques = col.cat.codes.to_numpy(), col.cat.categories
+    elif pd.api.types.is_object_dtype(col.dtype) or pd.api.types.is_string_dtype(col.dtype):
+        codes, uniques = pd.factorize(col)
+    else:
+        return pd.util.hash_array(_canonical_values(col, col.dtype))
+    # a missing value appended last, where code -1 lands
+    distinct = pd.Series(uniques).reindex(range(len(uniques) + 1))
+    return pd.util.hash_array(_canonical_values(distinct, uniques.dtype))[codes]
+
+
+def row_hashes(df: pd.DataFrame) -> np.ndarray:
+    """
+    Content hash of each ingested row, stored as int64 (SQLite's integer type).
+
+    Built from _column_hash, so the same rows hash the same with or without
+    --compact, Arrow-backed dtypes or a per-run downcast.
+    """
+    hashes = np.zeros(len(df), dtype=np.uint64)
+    for col in df.columns:
+        hashes = hashes * np.uint64(1_000_003) ^ _column_hash(df[col])
+    return hashes.view(np.int64)
+
+
+class StateStore:
+    """Per-shipment results of the last run, in a single SQLite file."""
+
+    def __init__(self, path: str):
+        self.path = path
+
+    def load(self, settings: dict) -> Optional[pd.DataFrame]:
+        """
+        Prior state indexed by row_key, or None when there is none to reuse.
+
+        State written under different settings (rule set, explanation model)
+        is ignored, since every stored result would be stale.
+        """
+        if not os.path.exists(self.path):
+            return None
+        with closing(sqlite3.connect(self.path)) as conn:
+            tables = {r[0] for r in conn.execute("SELECT name FROM sqlite_master WHERE type='table'")}
+            if STATE_TABLE not in tables or META_TABLE not in tables:
+                return None
+            row = conn.execute(f"SELECT settings FROM {META_TABLE}").fetchone()
+            if row is None or json.loads(row[0]) != settings:
+                return None
+            prior = pd.read_sql(f"SELECT * FROM {STATE_TABLE}", conn)
+        # SQLite hands back 0/1 (or NULL for unflagged rows) as floats
+        prior["used_llm"] = prior["used_llm"].astype("boolean")
+        return prior.set_index("row_key")
+
+    def save(self, state: pd.DataFrame, settings: dict) -> None:
+        tmp_path = self.path + ".tmp"
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        with closing(sqlite3.connect(tmp_path)) as conn:
+            state[STATE_COLUMNS].to_sql(STATE_TABLE, conn, index=False, chunksize=50_000)
+            conn.execute(f"CREATE TABLE {META_TABLE} (settings TEXT)")
+            conn.execute(f"INSERT INTO {META_TABLE} VALUES (?)", (json.dumps(settings, sort_keys=True),))
+            conn.commit()
+        # swap in whole so an interrupted run leaves the previous state intact
+        os.replace(tmp_path, self.path)
+
+
+def plan_delta(
+    keys: pd.Series,
+    hashes: np.ndarray,
+    cross_mask: np.ndarray,
+    cross_bits: int,
+    prior: Optional[pd.DataFrame],
+) -> np.ndarray:
+    """
+    Boolean array of rows that can reuse prior results.
+
+    A row is reusable when its key existed, its content hash is unchanged and
+    its cross-row rule bits (evaluated over the current snapshot) still match.
+    """
+    if prior is None or prior.empty:
+        return np.zeros(len(keys), dtype=bool)
+
+    # positional take rather than reindex: a reindex with missing keys would
+    # turn the int64 hashes into float64 and lose their low bits
+    pos = prior.index.get_indexer(keys.to_numpy())
+    known = pos >= 0
+    safe_pos = np.where(known, pos, 0)
+    prior_hash = prior["row_hash"].to_numpy(dtype=np.int64)[safe_pos]
+    prior_mask = prior["flag_mask"].to_numpy(dtype=np.int64)[safe_pos].astype(np.uint64)
+
+    same_hash = prior_hash == hashes
+    same_cross = (prior_mask & np.uint64(cross_bits)) == cross_mask.astype(np.uint64)
+    return known & same_hash & same_cross
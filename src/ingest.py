@@ -1,5 +1,27 @@
+import io
+import os
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Iterator, List, Optional, Set, Union
+
+import numpy as np
 import pandas as pd
-from .schema import REQUIRED_COLUMNS
+from .schema import (
+    BOOLEAN_COLUMNS,
+    BOOLEAN_TRUE_VALUES,
+    COLUMN_DTYPES,
+    COMPACT_CATEGORICAL_COLUMNS,
+    COMPACT_MAX_UNIQUE_RATIO,
+    DATE_COLUMNS,
+    DATE_FORMAT,
+    NON_MONETARY_NUMERIC_COLUMNS,
+    OPTIONAL_COLUMNS,
+    PIPELINE_COLUMNS,
+    REQUIRED_COLUMNS,
+)
+
+PARQUET_SUFFIXES = {".parquet", ".pq"}
+INPUT_FORMATS = ("csv", "parquet", "jsonl")
 
 SYNTHETIC_TO_PIPELINE_MAP = {
     "invoice_id": "shipment_id",
@@ -11,11 +33,230 @@ SYNTHETIC_TO_PIPELINE_MAP = {
     "actual_total_billed": "actual_billed_total",
 }
 
-def load_invoice_data(csv_path: str) -> pd.DataFrame:
-    """Load invoice CSV, accept either pipeline schema or synthetic generator schema, and normalize types."""
-    df = pd.read_csv(csv_path)
+def _renames_synthetic(columns) -> bool:
+    return "invoice_id" in columns and "shipment_id" not in columns
+
+def _csv_read_options(header: List[str]) -> dict:
+    """read_csv dtype/date arguments for a header, keyed by source column names."""
+    rename = SYNTHETIC_TO_PIPELINE_MAP if _renames_synthetic(header) else {}
+    dtype, parse_dates = {}, []
+    for src in header:
+        col = rename.get(src, src)
+        if col in COLUMN_DTYPES:
+            dtype[src] = COLUMN_DTYPES[col]
+        elif col in DATE_COLUMNS:
+            parse_dates.append(src)
+
+    options = {"dtype": dtype}
+    if parse_dates:
+        options.update(parse_dates=parse_dates, date_format=DATE_FORMAT)
+    return options
+
+def _iter_csv_chunks(
+    path: Union[str, bytes],
+    chunksize: Optional[int],
+    columns: Optional[List[str]] = None,
+    arrow_dtypes: bool = False,
+) -> Iterator[pd.DataFrame]:
+    """
+    Read a CSV (a path, or the bytes of one) with the typed schema, one frame
+    (chunksize=None) or several.
+
+    If a value doesn't fit its declared dtype, the remaining rows are re-read
+    with pandas inference and normalize_invoice_frame coerces them as before.
+    """
+    source = (lambda: io.BytesIO(path)) if isinstance(path, bytes) else (lambda: path)
+    kwargs = {"usecols": columns}
+    if arrow_dtypes:
+        kwargs["dtype_backend"] = "pyarrow"
+    header = columns if columns is not None else list(pd.read_csv(source(), nrows=0).columns)
+
+    done = 0
+    try:
+        reader = pd.read_csv(source(), chunksize=chunksize, **kwargs, **_csv_read_options(header))
+        for chunk in ([reader] if chunksize is None else reader):
+            yield chunk
+            done += len(chunk)
+        return
+    except (ValueError, TypeError):
+        pass
+
+    reader = pd.read_csv(source(), chunksize=chunksize, skiprows=range(1, done + 1), **kwargs)
+    yield from ([reader] if chunksize is None else reader)
+
+def _is_parquet(path: str) -> bool:
+    return Path(path).suffix.lower() in PARQUET_SUFFIXES
+
+def _source_columns(path: str) -> List[str]:
+    if _is_parquet(path):
+        import pyarrow.parquet as pq
+
+        return list(pq.read_schema(path).names)
+    return list(pd.read_csv(path, nrows=0).columns)
+
+def _projected_columns(path: str) -> List[str]:
+    """Columns of a Parquet file the pipeline can use, in file order."""
+    wanted = set(REQUIRED_COLUMNS) | set(OPTIONAL_COLUMNS) | set(PIPELINE_COLUMNS) | set(SYNTHETIC_TO_PIPELINE_MAP)
+    return [c for c in _source_columns(path) if c in wanted]
+
+def _iter_raw_chunks(
+    path: str,
+    chunksize: int,
+    columns: Optional[List[str]] = None,
+    arrow_dtypes: bool = False,
+) -> Iterator[pd.DataFrame]:
+    if _is_parquet(path):
+        import pyarrow.parquet as pq
+
+        types_mapper = pd.ArrowDtype if arrow_dtypes else None
+        source = pq.ParquetFile(path)
+        if source.metadata.num_rows == 0:
+            # one typed empty chunk, as read_csv gives for a header-only CSV
+            yield source.schema_arrow.empty_table().select(columns or source.schema_arrow.names).to_pandas(
+                types_mapper=types_mapper
+            )
+            return
+        for batch in source.iter_batches(batch_size=chunksize, columns=columns):
+            yield batch.to_pandas(types_mapper=types_mapper)
+    else:
+        yield from _iter_csv_chunks(path, chunksize, columns=columns, arrow_dtypes=arrow_dtypes)
+
+def load_invoice_data(path: str, arrow_dtypes: bool = False, compact: bool = False) -> pd.DataFrame:
+    """
+    Load invoice CSV or Parquet, accept either pipeline schema or synthetic generator schema, and normalize types.
+
+    CSV is parsed straight to the dtypes in schema.COLUMN_DTYPES with a fixed
+    date format. Parquet reads only the columns the pipeline uses. arrow_dtypes=True keeps
+    Arrow-backed dtypes instead of converting to NumPy.
+    """
+    if _is_parquet(path):
+        kwargs = {"dtype_backend": "pyarrow"} if arrow_dtypes else {}
+        df = pd.read_parquet(path, columns=_projected_columns(path), **kwargs)
+    else:
+        df = next(_iter_csv_chunks(path, None, arrow_dtypes=arrow_dtypes))
+    df = normalize_invoice_frame(df)
+    return compact_invoice_frame(df) if compact else df
+
+def iter_invoice_chunks(
+    path: str,
+    chunksize: int,
+    arrow_dtypes: bool = False,
+    compact: bool = False,
+) -> Iterator[pd.DataFrame]:
+    """Stream the invoice file in chunks of at most ``chunksize`` rows, each normalized like load_invoice_data."""
+    columns = _projected_columns(path) if _is_parquet(path) else None
+    for chunk in _iter_raw_chunks(path, chunksize, columns=columns, arrow_dtypes=arrow_dtypes):
+        chunk = normalize_invoice_frame(chunk)
+        yield compact_invoice_frame(chunk) if compact else chunk
+
+@dataclass(frozen=True)
+class InvoiceShard:
+    """A contiguous slice of the input: CSV byte offsets or Parquet row groups, [start, stop)."""
+
+    index: int
+    start: int
+    stop: int
+
+
+def plan_invoice_shards(path: str, n: int) -> List[InvoiceShard]:
+    """
+    Split the input into at most ``n`` contiguous shards of similar size.
+
+    CSV shards are cut at line starts, so quoted fields must not contain line
+    breaks. Parquet shards are runs of whole row groups.
+    """
+    if _is_parquet(path):
+        import pyarrow.parquet as pq
 
-    if "invoice_id" in df.columns and "shipment_id" not in df.columns:
+        groups = pq.ParquetFile(path).num_row_groups
+        bounds = sorted({round(groups * k / n) for k in range(n + 1)})
+    else:
+        size = os.path.getsize(path)
+        with open(path, "rb") as f:
+            f.readline()
+            bounds = [f.tell()]
+            for k in range(1, n):
+                target = bounds[0] + (size - bounds[0]) * k // n
+                if target <= bounds[-1]:
+                    continue
+                f.seek(target - 1)
+                f.readline()
+                if f.tell() < size and f.tell() > bounds[-1]:
+                    bounds.append(f.tell())
+        bounds.append(size)
+    return [InvoiceShard(i, a, b) for i, (a, b) in enumerate(zip(bounds, bounds[1:])) if b > a]
+
+
+def load_invoice_shard(
+    path: str,
+    shard: InvoiceShard,
+    arrow_dtypes: bool = False,
+    compact: bool = False,
+) -> pd.DataFrame:
+    """One shard of plan_invoice_shards, read and normalized like load_invoice_data."""
+    if _is_parquet(path):
+        import pyarrow.parquet as pq
+
+        table = pq.ParquetFile(path).read_row_groups(
+            range(shard.start, shard.stop), columns=_projected_columns(path)
+        )
+        df = table.to_pandas(types_mapper=pd.ArrowDtype if arrow_dtypes else None)
+    else:
+        with open(path, "rb") as f:
+            header = f.readline()
+            f.seek(shard.start)
+            body = f.read(shard.stop - shard.start)
+        df = next(_iter_csv_chunks(header + body, None, arrow_dtypes=arrow_dtypes))
+    df = normalize_invoice_frame(df)
+    return compact_invoice_frame(df) if compact else df
+
+
+def read_invoice_bytes(data: bytes, fmt: str, arrow_dtypes: bool = False) -> pd.DataFrame:
+    """An in-memory batch (one of INPUT_FORMATS), read and normalized like load_invoice_data."""
+    if fmt == "csv":
+        df = next(_iter_csv_chunks(data, None, arrow_dtypes=arrow_dtypes))
+    elif fmt == "parquet":
+        kwargs = {"dtype_backend": "pyarrow"} if arrow_dtypes else {}
+        df = pd.read_parquet(io.BytesIO(data), **kwargs)
+    elif fmt == "jsonl":
+        # keep raw values; normalize_invoice_frame applies the schema types
+        df = pd.read_json(io.BytesIO(data), lines=True, dtype=False, convert_dates=False)
+    else:
+        raise ValueError(f"Unknown input format {fmt!r}; expected one of {INPUT_FORMATS}")
+    return normalize_invoice_frame(df)
+
+
+def _id_column(columns) -> str:
+    """The id column apply_leakage_rules will dedupe on once the frame is normalized."""
+    return "invoice_id" if "invoice_id" in columns and "shipment_id" in columns else "shipment_id"
+
+def scan_duplicate_ids(path: str, chunksize: int) -> Set:
+    """
+    Single pass over the id column only, returning every id that appears more than once.
+
+    Lets chunked runs flag POSSIBLE_DUPLICATE on all copies of an id, including
+    copies that landed in an earlier chunk. Memory grows with distinct ids, not rows.
+    """
+    header = _source_columns(path)
+    dedupe_col = _id_column(header)
+    raw_col = dedupe_col if dedupe_col in header else "invoice_id"
+
+    seen, dupes = set(), set()
+    for chunk in _iter_raw_chunks(path, chunksize, columns=[raw_col]):
+        ids = chunk[raw_col]
+        if dedupe_col == "shipment_id":
+            ids = ids.astype(str).str.strip()
+        dupes.update(ids[ids.duplicated()].unique())
+        for v in ids.unique():
+            if v in seen:
+                dupes.add(v)
+            else:
+                seen.add(v)
+    return dupes
+
+def normalize_invoice_frame(df: pd.DataFrame) -> pd.DataFrame:
+    """Map a raw invoice frame onto the pipeline schema and normalize types."""
+    if _renames_synthetic(df.columns):
         df = df.rename(columns=SYNTHETIC_TO_PIPELINE_MAP)
 
     if "customer_id" not in df.columns:
@@ -43,16 +284,10 @@ def load_invoice_data(csv_path: str) -> pd.DataFrame:
         raise ValueError(f"Missing required columns: {missing}")
 
     # Normalize booleans
-    df["liftgate_required"] = (
-        df["liftgate_required"]
-        .astype(str)
-        .str.lower()
-        .isin(["true", "1", "yes", "y"])
-        if df["liftgate_required"].dtype != bool
-        else df["liftgate_required"]
-    )
-
-    # Normalize numerics
+    for col in BOOLEAN_COLUMNS:
+        df[col] = _normalize_bool(df[col])
+
+    # Normalize numerics (a no-op when the typed reader already produced them)
     numeric_cols = [
         "distance_miles",
         "weight_lb",
@@ -62,15 +297,67 @@ def load_invoice_data(csv_path: str) -> pd.DataFrame:
         "actual_billed_total",
     ]
     for col in numeric_cols:
-        if col in df.columns:
+        if col in df.columns and not pd.api.types.is_numeric_dtype(df[col]):
             df[col] = pd.to_numeric(df[col], errors="coerce")
 
     # Normalize date
-    if "ship_date" in df.columns:
-        df["ship_date"] = pd.to_datetime(df["ship_date"], errors="coerce")
+    for col in DATE_COLUMNS:
+        if col in df.columns and not pd.api.types.is_datetime64_any_dtype(df[col]):
+            df[col] = pd.to_datetime(df[col], errors="coerce")
 
     # Cleanup ids
-    df["shipment_id"] = df["shipment_id"].astype(str).str.strip()
-    df["customer_id"] = df["customer_id"].astype(str).str.strip()
+    df["shipment_id"] = _strip_ids(df["shipment_id"])
+    df["customer_id"] = _strip_ids(df["customer_id"])
 
     return df
+
+def _normalize_bool(s: pd.Series) -> pd.Series:
+    """Map a column onto bool using the schema vocabulary, one string op per distinct value."""
+    if s.dtype == bool:
+        return s
+    codes, uniques = pd.factorize(s)
+    truth = pd.Index(uniques).astype(str).str.lower().isin(BOOLEAN_TRUE_VALUES)
+    # missing values (code -1) read as "nan", which is not in the vocabulary
+    return pd.Series(np.where(codes >= 0, truth[codes], False), index=s.index, name=s.name)
+
+def _strip_ids(s: pd.Series) -> pd.Series:
+    if isinstance(s.dtype, pd.CategoricalDtype) and not s.isna().any():
+        stripped = s.cat.categories.astype(str).str.strip()
+        if stripped.is_unique:
+            return s.cat.rename_categories(stripped)
+    return s.astype(str).str.strip()
+
+def compact_invoice_frame(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    Shrink a normalized invoice frame in place without changing any value.
+
+    Low-cardinality strings become categoricals. Non-monetary numerics are
+    downcast to the smallest int, or to float32, only where every value
+    round-trips exactly. Money columns stay float64.
+    """
+    for col in COMPACT_CATEGORICAL_COLUMNS:
+        if col not in df.columns or isinstance(df[col].dtype, pd.CategoricalDtype):
+            continue
+        if df[col].nunique(dropna=True) <= COMPACT_MAX_UNIQUE_RATIO * len(df):
+            df[col] = df[col].astype("category")
+
+    for col in NON_MONETARY_NUMERIC_COLUMNS:
+        if col in df.columns:
+            df[col] = _downcast_lossless(df[col])
+
+    return df
+
+def _downcast_lossless(s: pd.Series) -> pd.Series:
+    if not pd.api.types.is_numeric_dtype(s) or pd.api.types.is_bool_dtype(s) or isinstance(s.dtype, pd.ArrowDtype):
+        return s
+    values = s.to_numpy()
+    if pd.api.types.is_float_dtype(values.dtype):
+        if not np.isnan(values).any() and np.array_equal(values, np.trunc(values)):
+            as_int = pd.to_numeric(pd.Series(values.astype(np.int64), index=s.index), downcast="integer")
+            if np.array_equal(as_int.to_numpy(), values):
+                return as_int.rename(s.name)
+        as_f32 = values.astype(np.float32)
+        if np.array_equal(as_f32.astype(values.dtype), values, equal_nan=True):
+            return pd.Series(as_f32, index=s.index, name=s.name)
+        return s
+    return pd.to_numeric(s, downcast="integer")
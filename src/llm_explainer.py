@@ -1,10 +1,24 @@
 from __future__ import annotations
 
+import hashlib
+import os
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
 from dataclasses import dataclass
-from typing import Optional
+from functools import lru_cache
+from typing import List, Optional, Sequence
 
+import numpy as np
 import pandas as pd
 
+PROMPT_TEMPLATE = "Rewrite this as a short professional logistics audit explanation:\n\n{text}"
+MAX_OUTPUT_TOKENS = 120
+
+DEFAULT_CACHE_DIR = os.path.join(".cache", "llm_explanations")
+DEFAULT_CACHE_MAX_BYTES = 64 * 2**20
+
 
 @dataclass(frozen=True)
 class Explanation:
@@ -52,21 +66,328 @@ def build_rule_explanation(row: pd.Series) -> str:
     return " ".join(parts).strip()
 
 
+def _text_column(df: pd.DataFrame, name: str) -> pd.Series:
+    """str(value) per row, as build_rule_explanation's str(row.get(...)) gives it."""
+    if name not in df.columns:
+        return pd.Series("", index=df.index, dtype=object)
+    s = df[name]
+    if isinstance(s.dtype, pd.CategoricalDtype):
+        # code -1 (missing) picks the trailing "nan"
+        texts = np.asarray([str(c) for c in s.cat.categories] + ["nan"], dtype=object)
+        return pd.Series(texts[s.cat.codes.to_numpy()], index=df.index)
+    if pd.api.types.is_string_dtype(s.dtype):
+        return pd.Series(s.to_numpy(dtype=object, na_value="nan"), index=df.index)
+    return pd.Series([str(v) for v in s.to_numpy(dtype=object)], index=df.index, dtype=object)
+
+
+def _number_column(df: pd.DataFrame, *names: str) -> np.ndarray:
+    """
+    float(row.get(name, fallback) or 0.0) per row: the first column present
+    wins, missing values stay NaN and -0.0 becomes 0.0 (it's falsy).
+    """
+    for name in names:
+        if name in df.columns:
+            values = pd.to_numeric(df[name]).to_numpy(dtype=np.float64, na_value=np.nan)
+            return np.where(values == 0, 0.0, values)
+    return np.zeros(len(df))
+
+
+def _money(values: np.ndarray, spec: str = ",.2f") -> np.ndarray:
+    return np.asarray([format(v, spec) for v in values.tolist()], dtype=object)
+
+
+def build_rule_explanations(df: pd.DataFrame) -> pd.Series:
+    """
+    Column-wise build_rule_explanation: same text, one pass per part instead
+    of one Series per row. Fuel and liftgate sentences are only rendered for
+    the rows whose flag_reason names them.
+    """
+    carrier = _text_column(df, "carrier").str.strip().to_numpy(dtype=object)
+    actual_total = _number_column(df, "actual_billed_total", "actual_total_billed")
+    expected_total = _number_column(df, "expected_billed_total", "expected_total")
+    underbilled = _number_column(df, "underbilled_amount")
+    reasons = _text_column(df, "flag_reason").str.strip().to_numpy(dtype=object)
+
+    has_carrier = carrier != ""
+    text = np.full(len(df), "", dtype=object)
+    text[has_carrier] = "Carrier: " + carrier[has_carrier] + ". "
+    text = (
+        text
+        + "Actual billed total: $" + _money(actual_total)
+        + ". Expected total: $" + _money(expected_total) + "."
+    )
+
+    has_reasons = reasons != ""
+    text[has_reasons] = text[has_reasons] + " Flags: " + reasons[has_reasons] + "."
+
+    positive = underbilled > 0
+    text[positive] = text[positive] + " Estimated underbilling: $" + _money(underbilled[positive]) + "."
+    text[~positive] = text[~positive] + " No positive underbilling amount calculated."
+
+    # substring tests once per distinct flag_reason, not once per row
+    codes, uniques = pd.factorize(reasons)
+    fuel = np.asarray(["MISSING_FUEL_SURCHARGE" in u for u in uniques], dtype=bool)[codes]
+    liftgate = np.asarray(["LIFTGATE_NOT_CHARGED" in u for u in uniques], dtype=bool)[codes]
+
+    if fuel.any():
+        sub = df.iloc[np.flatnonzero(fuel)]
+        text[fuel] = (
+            text[fuel]
+            + " Fuel looks missing for a " + _money(_number_column(sub, "distance_miles"), ",.0f")
+            + " mile move (billed fuel: $" + _money(_number_column(sub, "fuel_surcharge_amount", "actual_billed_fuel"))
+            + ", expected fuel: $" + _money(_number_column(sub, "expected_fuel_surcharge")) + ")."
+        )
+
+    if liftgate.any():
+        sub = df.iloc[np.flatnonzero(liftgate)]
+        if "liftgate_required" in sub.columns:
+            required = np.asarray([str(bool(v)) for v in sub["liftgate_required"].to_numpy(dtype=object)], dtype=object)
+        else:
+            required = np.full(len(sub), "False", dtype=object)
+        text[liftgate] = (
+            text[liftgate]
+            + " Liftgate required: " + required
+            + ". Liftgate fee billed: $" + _money(_number_column(sub, "liftgate_fee_charged")) + "."
+        )
+
+    return pd.Series(text, index=df.index, dtype=object).str.strip()
+
+
+def llm_prompt(text: str) -> str:
+    return PROMPT_TEMPLATE.format(text=text)
+
+
+class ExplanationCache:
+    """
+    Content-addressed on-disk cache of LLM rewrites.
+
+    Entries are files named by sha256(model, prompt). Reads bump the file's
+    mtime, and trim() evicts the least recently used files once the total
+    size passes max_bytes. The total is counted with one directory walk per
+    instance and then kept up to date by put(), so trim() only walks the
+    directory again when there is something to evict.
+    """
+
+    def __init__(self, root: str = DEFAULT_CACHE_DIR, max_bytes: int = DEFAULT_CACHE_MAX_BYTES):
+        self.root = root
+        self.max_bytes = max_bytes
+        self._total_bytes: Optional[int] = None
+        self._size_lock = threading.Lock()
+
+    def _path(self, model: str, prompt: str) -> str:
+        digest = hashlib.sha256(f"{model}\0{prompt}".encode("utf-8")).hexdigest()
+        return os.path.join(self.root, digest[:2], digest + ".txt")
+
+    def get(self, model: str, prompt: str) -> Optional[str]:
+        path = self._path(model, prompt)
+        try:
+            with open(path, encoding="utf-8") as f:
+                text = f.read()
+        except FileNotFoundError:
+            return None
+        os.utime(path)
+        return text
+
+    def put(self, model: str, prompt: str, text: str) -> None:
+        path = self._path(model, prompt)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            f.write(text)
+        try:
+            replaced = os.stat(path).st_size
+        except FileNotFoundError:
+            replaced = 0
+        os.replace(tmp_path, path)
+        with self._size_lock:
+            if self._total_bytes is not None:
+                self._total_bytes += os.stat(path).st_size - replaced
+
+    def _entries(self) -> list:
+        """(mtime, size, path) of every entry on disk."""
+        entries = []
+        for dirpath, _, filenames in os.walk(self.root):
+            for name in filenames:
+                if name.endswith(".txt"):
+                    st = os.stat(os.path.join(dirpath, name))
+                    entries.append((st.st_mtime, st.st_size, os.path.join(dirpath, name)))
+        return entries
+
+    def total_bytes(self) -> int:
+        with self._size_lock:
+            if self._total_bytes is None:
+                self._total_bytes = sum(size for _, size, _ in self._entries())
+            return self._total_bytes
+
+    def trim(self) -> int:
+        """Evict least recently used entries down to max_bytes; returns how many were removed."""
+        if self.total_bytes() <= self.max_bytes:
+            return 0
+        with self._size_lock:
+            entries = self._entries()
+            total = sum(size for _, size, _ in entries)
+            removed = 0
+            for _, size, path in sorted(entries):
+                if total <= self.max_bytes:
+                    break
+                os.remove(path)
+                total -= size
+                removed += 1
+            self._total_bytes = total
+        return removed
+
+
+@lru_cache(maxsize=None)
+def get_client(api_key: str, base_url: Optional[str] = None):
+    """
+    One OpenAI client per (key, base_url), shared across calls and threads.
+
+    The SDK's own retries are off; LLMExplainer retries with its own backoff.
+    base_url defaults to OPENAI_BASE_URL, which is how a local stub server is
+    swapped in.
+    """
+    from openai import OpenAI
+
+    return OpenAI(api_key=api_key, base_url=base_url, max_retries=0)
+
+
+def _create_response(client, model: str, prompt: str) -> Optional[str]:
+    resp = client.responses.create(model=model, input=prompt, max_output_tokens=MAX_OUTPUT_TOKENS)
+    out = (resp.output_text or "").strip()
+    return out or None
+
+
+def _is_retryable(e: Exception) -> bool:
+    import openai
+
+    return isinstance(e, (openai.RateLimitError, openai.APIConnectionError, openai.InternalServerError))
+
+
+class _RateLimiter:
+    """Spaces request starts so they stay under requests_per_minute."""
+
+    def __init__(self, requests_per_minute: Optional[float]):
+        self.interval = 60.0 / requests_per_minute if requests_per_minute else 0.0
+        self._next = 0.0
+        self._lock = threading.Lock()
+
+    def wait(self) -> None:
+        if not self.interval:
+            return
+        with self._lock:
+            now = time.monotonic()
+            slot = max(now, self._next)
+            self._next = slot + self.interval
+        if slot > now:
+            time.sleep(slot - now)
+
+
+class LLMExplainer:
+    """
+    Rewrites rule explanations through the LLM in bulk.
+
+    Identical prompts are sent once. Prompts already in the cache make no call.
+    The rest run on a thread pool of max_concurrency workers, with exponential
+    backoff on rate-limit, connection and 5xx errors, and request starts paced
+    to requests_per_minute. A non-retryable error (e.g. a bad key) stops further
+    calls for the batch, and those rows keep their rule text.
+    """
+
+    def __init__(
+        self,
+        model: str,
+        api_key: Optional[str] = None,
+        cache: Optional[ExplanationCache] = None,
+        max_concurrency: int = 8,
+        max_retries: int = 3,
+        requests_per_minute: Optional[float] = None,
+        backoff_base: float = 0.5,
+        base_url: Optional[str] = None,
+    ):
+        self.model = model
+        self.api_key = api_key if api_key is not None else os.getenv("OPENAI_API_KEY")
+        self.cache = cache
+        self.max_concurrency = max(1, max_concurrency)
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.base_url = base_url
+        self._limiter = _RateLimiter(requests_per_minute)
+        self._lock = threading.Lock()
+        self.calls = 0
+        self.cache_hits = 0
+
+    def _call(self, client, prompt: str, stop: threading.Event, errors: set) -> Optional[str]:
+        for attempt in range(self.max_retries + 1):
+            if stop.is_set():
+                return None
+            self._limiter.wait()
+            try:
+                with self._lock:
+                    self.calls += 1
+                return _create_response(client, self.model, prompt)
+            except Exception as e:
+                retryable = _is_retryable(e)
+                if not retryable or attempt == self.max_retries:
+                    if not retryable:
+                        stop.set()
+                    with self._lock:
+                        errors.add(type(e).__name__)
+                    return None
+                delay = self.backoff_base * 2**attempt
+                retry_after = getattr(getattr(e, "response", None), "headers", {}).get("retry-after")
+                if retry_after:
+                    try:
+                        delay = max(delay, float(retry_after))
+                    except ValueError:
+                        pass
+                time.sleep(delay * (1 + random.random() / 4))
+        return None
+
+    def explain_many(self, texts: Sequence[str]) -> List[Optional[str]]:
+        """LLM rewrite for each text, or None where none is available."""
+        if not self.api_key:
+            return [None] * len(texts)
+
+        prompts = [llm_prompt(t) for t in texts]
+        results = {}
+        pending = []
+        for prompt in dict.fromkeys(prompts):
+            hit = self.cache.get(self.model, prompt) if self.cache is not None else None
+            if hit is not None:
+                results[prompt] = hit
+                self.cache_hits += 1
+            else:
+                pending.append(prompt)
+
+        if pending:
+            stop = threading.Event()
+            errors = set()
+            try:
+                client = get_client(self.api_key, self.base_url)
+            except Exception as e:
+                print(f"[LLM disabled] {type(e).__name__}")
+                client = None
+            if client is not None:
+                with ThreadPoolExecutor(max_workers=min(self.max_concurrency, len(pending))) as pool:
+                    outs = list(pool.map(lambda p: self._call(client, p, stop, errors), pending))
+                for prompt, out in zip(pending, outs):
+                    results[prompt] = out
+                    if out is not None and self.cache is not None:
+                        self.cache.put(self.model, prompt, out)
+                for name in sorted(errors):
+                    print(f"[LLM disabled] {name}")
+            if self.cache is not None:
+                self.cache.trim()
+
+        return [results.get(p) for p in prompts]
+
+
 def llm_explain(text: str, model: str, api_key: Optional[str]) -> Optional[str]:
     if not api_key:
         return None
 
     try:
-        from openai import OpenAI
-
-        client = OpenAI(api_key=api_key)
-        resp = client.responses.create(
-            model=model,
-            input=f"Rewrite this as a short professional logistics audit explanation:\n\n{text}",
-            max_output_tokens=120,
-        )
-        out = (resp.output_text or "").strip()
-        return out or None
+        return _create_response(get_client(api_key), model, llm_prompt(text))
 
     except Exception as e:
         print(f"[LLM disabled] {type(e).__name__}")
@@ -1,5 +1,18 @@
+import numpy as np
 import pandas as pd
 
+# Tier tables: a value falls in tier i when breaks[i-1] < value <= breaks[i];
+# anything above the last break (or NaN) lands in the final tier.
+DISTANCE_BREAKS = np.array([300.0, 1000.0])
+DISTANCE_BANDS = np.array(["local", "regional", "longhaul"])
+BAND_RATE_PER_LB = np.array([0.20, 0.32, 0.48])
+BAND_FUEL_PCT = np.array([0.05, 0.10, 0.15])
+
+CLASS_BREAKS = np.array([60.0, 70.0, 85.0])
+CLASS_MULTIPLIERS = np.array([1.00, 1.10, 1.20, 1.35])
+
+LIFTGATE_FEE = 75.0
+
 def _distance_band(miles: float) -> str:
     if miles <= 300:
         return "local"
@@ -26,38 +39,51 @@ def _lane_rate_per_lb(distance_band: str) -> float:
     else:
         return 0.48
 
-def compute_expected_billing(df: pd.DataFrame) -> pd.DataFrame:
-    df = df.copy()
+def _tier_index(values, breaks: np.ndarray) -> np.ndarray:
+    """Vectorized equivalent of an ``if x <= b0 / elif x <= b1 / else`` chain."""
+    x = pd.to_numeric(pd.Series(values), errors="coerce").to_numpy(dtype="float64", na_value=np.nan)
+    return np.searchsorted(breaks, x, side="left")
 
-    est_linehaul = []
-    for _, row in df.iterrows():
-        band = _distance_band(row["distance_miles"])
-        per_lb = _lane_rate_per_lb(band)
-        class_mult = _class_multiplier(row["freight_class"])
-        linehaul_est = per_lb * class_mult * row["weight_lb"]
-        est_linehaul.append(linehaul_est)
+def distance_band_index(miles) -> np.ndarray:
+    """Band position (0=local, 1=regional, 2=longhaul) for each distance."""
+    return _tier_index(miles, DISTANCE_BREAKS)
 
-    df["expected_linehaul_amount"] = est_linehaul
+def compute_expected_billing(
+    df: pd.DataFrame, copy: bool = True, rate_index=None, fuel_schedule=None
+) -> pd.DataFrame:
+    """
+    Add expected_* pricing columns. copy=False writes them onto ``df`` itself.
+    rate_index (a src.rate_index.RateIndex) prices from contract schedules
+    instead of the built-in tiers. fuel_schedule (a src.fuel_schedule.FuelSchedule)
+    sets the fuel percent from the diesel price on each ship_date; rows it has
+    no price for keep the distance-band percent.
+    """
+    if copy:
+        df = df.copy()
 
-    expected_fuel = []
-    for _, row in df.iterrows():
-        band = _distance_band(row["distance_miles"])
-        if band == "local":
-            pct = 0.05
-        elif band == "regional":
-            pct = 0.10
-        else:
-            pct = 0.15
-        fuel_est = row["expected_linehaul_amount"] * pct
-        expected_fuel.append(fuel_est)
+    if rate_index is not None:
+        priced = rate_index.price(df)
+        linehaul, fuel, liftgate = priced["linehaul"], priced["fuel"], priced["liftgate"]
+    else:
+        band_idx = distance_band_index(df["distance_miles"])
+        per_lb = BAND_RATE_PER_LB[band_idx]
+        class_mult = CLASS_MULTIPLIERS[_tier_index(df["freight_class"], CLASS_BREAKS)]
+        weight = pd.to_numeric(df["weight_lb"], errors="coerce").to_numpy(dtype="float64", na_value=np.nan)
 
-    df["expected_fuel_amount"] = expected_fuel
+        linehaul = per_lb * class_mult * weight
+        fuel = linehaul * BAND_FUEL_PCT[band_idx]
 
-    # flat fee if liftgate required
-    df["expected_liftgate_fee"] = df["liftgate_required"].apply(
-        lambda need: 75.0 if need else 0.0
-    )
+        # flat fee if liftgate required
+        needs_liftgate = df["liftgate_required"].astype(bool).to_numpy()
+        liftgate = np.where(needs_liftgate, LIFTGATE_FEE, 0.0)
+
+    if fuel_schedule is not None:
+        fuel_pct = fuel_schedule.fuel_pct(df["ship_date"])
+        fuel = np.where(np.isnan(fuel_pct), fuel, linehaul * fuel_pct)
 
+    df["expected_linehaul_amount"] = linehaul
+    df["expected_fuel_amount"] = fuel
+    df["expected_liftgate_fee"] = liftgate
     df["expected_billed_total"] = (
         df["expected_linehaul_amount"]
         + df["expected_fuel_amount"]
@@ -0,0 +1,371 @@
+"""
+Compiled contract rate index.
+
+A contract table lists, per (customer_id, origin_zip3, dest_zip3), tiered
+schedules: rate per lb by distance, a weight-break multiplier, a freight-class
+multiplier and a fuel percent by distance, plus a flat liftgate fee. "*" is a
+wildcard. Long format, one row per tier:
+
+    customer_id,origin_zip3,dest_zip3,schedule,upper_bound,value
+    *,*,*,rate_per_lb,300,0.20
+    *,*,*,rate_per_lb,,0.48            <- empty upper_bound: the last tier
+    CUST_A,100,900,weight_multiplier,500,1.00
+
+A shipment takes the most specific contract of (customer, lane), (customer),
+(lane), (*). A schedule a contract leaves out comes from the (*) contract,
+which is required. Tiers follow the rate engine's convention: a value is in
+tier i when upper_bound[i-1] < value <= upper_bound[i], and NaN falls in the
+last tier.
+
+compile_rate_index turns the table into plain arrays: a sorted array of int64
+key hashes and, per schedule, a [contracts, breaks] matrix of upper bounds
+padded with +inf. Pricing a batch is then a few searchsorted calls and array
+gathers, and save/load is a single .npz that needs no rebuilding:
+
+    PYTHONPATH=. python -m src.rate_index compile --contracts data/contract_rates_sample.csv --out models/rates.npz
+"""
+import argparse
+import hashlib
+import time
+from dataclasses import dataclass
+from functools import lru_cache
+from typing import Dict, Optional
+
+import numpy as np
+import pandas as pd
+
+from src.rate_engine import (
+    BAND_FUEL_PCT,
+    BAND_RATE_PER_LB,
+    CLASS_BREAKS,
+    CLASS_MULTIPLIERS,
+    DISTANCE_BREAKS,
+    LIFTGATE_FEE,
+)
+from src.schema import zip3
+
+# Bump when the array layout or key hashing changes; older files are refused.
+RATE_INDEX_VERSION = 1
+
+WILDCARD = "*"
+KEY_COLUMNS = ["customer_id", "origin_zip3", "dest_zip3"]
+CONTRACT_COLUMNS = KEY_COLUMNS + ["schedule", "upper_bound", "value"]
+
+# tiered schedule -> invoice column its tiers break on
+SCHEDULES = {
+    "rate_per_lb": "distance_miles",
+    "weight_multiplier": "weight_lb",
+    "class_multiplier": "freight_class",
+    "fuel_pct": "distance_miles",
+}
+SCALARS = ("liftgate_fee",)
+
+# which key parts a contract pins, most specific first
+MATCH_LEVELS = (
+    (True, True, True),
+    (True, False, False),
+    (False, True, True),
+    (False, False, False),
+)
+
+
+def _numeric(values) -> np.ndarray:
+    return pd.to_numeric(pd.Series(values), errors="coerce").to_numpy(dtype="float64", na_value=np.nan)
+
+
+# odd multipliers mixing the three per-part hashes into one key hash
+_KEY_MIX = (np.uint64(0x9E3779B97F4A7C15), np.uint64(0xC2B2AE3D27D4EB4F), np.uint64(0x165667B19E3779F9))
+
+
+def _strip(labels: pd.Series) -> pd.Series:
+    return labels.astype(str).str.strip()
+
+
+def _part_hashes(values, normalize=_strip) -> np.ndarray:
+    """uint64 hash per value; strings are normalized and hashed once per distinct value."""
+    codes, uniques = pd.factorize(values)
+    labels = normalize(pd.Series(uniques)).to_numpy(dtype=object)
+    # missing values (code -1) hash like an empty label, which no contract has
+    hashes = pd.util.hash_array(np.append(labels, ""))
+    return hashes[codes]
+
+
+def _key_hashes(customer: np.ndarray, origin3: np.ndarray, dest3: np.ndarray) -> np.ndarray:
+    with np.errstate(over="ignore"):
+        mixed = (customer * _KEY_MIX[0]) ^ (origin3 * _KEY_MIX[1]) ^ (dest3 * _KEY_MIX[2])
+    return mixed.view(np.int64)
+
+
+def default_contract_table() -> pd.DataFrame:
+    """The rate engine's built-in tiers as a single (*) contract."""
+    rows = []
+
+    def tiers(schedule, breaks, values):
+        bounds = list(breaks) + [np.nan]
+        rows.extend((WILDCARD, WILDCARD, WILDCARD, schedule, b, float(v)) for b, v in zip(bounds, values))
+
+    tiers("rate_per_lb", DISTANCE_BREAKS, BAND_RATE_PER_LB)
+    tiers("weight_multiplier", [], [1.0])
+    tiers("class_multiplier", CLASS_BREAKS, CLASS_MULTIPLIERS)
+    tiers("fuel_pct", DISTANCE_BREAKS, BAND_FUEL_PCT)
+    tiers("liftgate_fee", [], [LIFTGATE_FEE])
+    return pd.DataFrame(rows, columns=CONTRACT_COLUMNS)
+
+
+def load_contract_table(path: str) -> pd.DataFrame:
+    table = pd.read_csv(path, dtype={c: str for c in KEY_COLUMNS + ["schedule"]})
+    missing = [c for c in CONTRACT_COLUMNS if c not in table.columns]
+    if missing:
+        raise ValueError(f"Contract table {path} is missing columns: {missing}")
+    return table[CONTRACT_COLUMNS]
+
+
+@dataclass
+class RateIndex:
+    key_hashes: np.ndarray  # sorted int64
+    key_contracts: np.ndarray  # contract position for each key hash
+    levels: np.ndarray  # [n_levels, 3] bool, MATCH_LEVELS present in the table
+    contract_keys: np.ndarray  # [contracts, 3] str, for reporting
+    breaks: Dict[str, np.ndarray]  # schedule -> [contracts, max_breaks], +inf padded
+    values: Dict[str, np.ndarray]  # schedule -> [contracts, max_breaks + 1]
+    tiers: Dict[str, np.ndarray]  # schedule -> tiers per contract
+    scalars: Dict[str, np.ndarray]  # scalar -> [contracts]
+    fingerprint: str = ""
+
+    @property
+    def n_contracts(self) -> int:
+        return len(self.contract_keys)
+
+    def contract_ids(self, df: pd.DataFrame) -> np.ndarray:
+        """Position of the contract pricing each row (most specific match wins)."""
+        if self.n_contracts == 1:
+            return np.zeros(len(df), dtype=np.int64)
+        wild = np.full(len(df), _part_hashes(np.array([WILDCARD], dtype=object))[0])
+        pinned = self.levels.any(axis=0)
+        parts = (
+            _part_hashes(df["customer_id"]) if pinned[0] else wild,
+            _part_hashes(df["origin_zip"], zip3) if pinned[1] else wild,
+            _part_hashes(df["destination_zip"], zip3) if pinned[2] else wild,
+        )
+        out = np.full(len(df), -1, dtype=np.int64)
+        for pins in self.levels:
+            todo = out < 0
+            if not todo.any():
+                break
+            key = _key_hashes(*(p[todo] if pin else wild[todo] for p, pin in zip(parts, pins)))
+            pos = np.searchsorted(self.key_hashes, key)
+            pos = np.minimum(pos, len(self.key_hashes) - 1)
+            hit = self.key_hashes[pos] == key
+            idx = np.flatnonzero(todo)
+            out[idx[hit]] = self.key_contracts[pos[hit]]
+        return out
+
+    def tier(self, schedule: str, contract: np.ndarray, x: np.ndarray) -> np.ndarray:
+        breaks = self.breaks[schedule]
+        if self.n_contracts == 1:
+            return np.searchsorted(breaks[0, : self.tiers[schedule][0] - 1], x, side="left")
+        # breaks strictly below x, i.e. searchsorted(side="left") within each contract's row
+        t = np.zeros(len(x), dtype=np.int64)
+        for j in range(breaks.shape[1]):
+            t += breaks[contract, j] < x
+        nan = np.isnan(x)
+        t[nan] = self.tiers[schedule][contract[nan]] - 1
+        return t
+
+    def lookup(self, schedule: str, contract: np.ndarray, values) -> np.ndarray:
+        x = _numeric(values)
+        return self.values[schedule][contract, self.tier(schedule, contract, x)]
+
+    def price(self, df: pd.DataFrame) -> Dict[str, np.ndarray]:
+        """expected linehaul, fuel and liftgate amounts for every row, in one pass."""
+        contract = self.contract_ids(df)
+        weight = _numeric(df["weight_lb"])
+        per_lb = self.lookup("rate_per_lb", contract, df["distance_miles"])
+        weight_mult = self.lookup("weight_multiplier", contract, weight)
+        class_mult = self.lookup("class_multiplier", contract, df["freight_class"])
+        linehaul = per_lb * weight_mult * class_mult * weight
+        needs_liftgate = df["liftgate_required"].astype(bool).to_numpy()
+        return {
+            "linehaul": linehaul,
+            "fuel": linehaul * self.lookup("fuel_pct", contract, df["distance_miles"]),
+            "liftgate": np.where(needs_liftgate, self.scalars["liftgate_fee"][contract], 0.0),
+        }
+
+    def save(self, path: str) -> None:
+        arrays = {
+            "version": np.array(RATE_INDEX_VERSION),
+            "fingerprint": np.array(self.fingerprint),
+            "key_hashes": self.key_hashes,
+            "key_contracts": self.key_contracts,
+            "levels": self.levels,
+            "contract_keys": self.contract_keys,
+        }
+        for name in SCHEDULES:
+            arrays[f"breaks.{name}"] = self.breaks[name]
+            arrays[f"values.{name}"] = self.values[name]
+            arrays[f"tiers.{name}"] = self.tiers[name]
+        for name in SCALARS:
+            arrays[f"scalar.{name}"] = self.scalars[name]
+        with open(path, "wb") as f:
+            np.savez(f, **arrays)
+
+
+def load_rate_index(path: str) -> RateIndex:
+    """A saved index (.npz), or a contract table (.csv) compiled on the spot."""
+    if path.lower().endswith(".csv"):
+        return compile_rate_index(load_contract_table(path))
+    with np.load(path, allow_pickle=False) as z:
+        if int(z["version"]) != RATE_INDEX_VERSION:
+            raise ValueError(
+                f"Rate index {path} has version {int(z['version'])}, expected {RATE_INDEX_VERSION}; recompile it"
+            )
+        return RateIndex(
+            key_hashes=z["key_hashes"],
+            key_contracts=z["key_contracts"],
+            levels=z["levels"],
+            contract_keys=z["contract_keys"],
+            breaks={n: z[f"breaks.{n}"] for n in SCHEDULES},
+            values={n: z[f"values.{n}"] for n in SCHEDULES},
+            tiers={n: z[f"tiers.{n}"] for n in SCHEDULES},
+            scalars={n: z[f"scalar.{n}"] for n in SCALARS},
+            fingerprint=str(z["fingerprint"]),
+        )
+
+
+def _schedule_tiers(bound: np.ndarray, value: np.ndarray, contract: np.ndarray, contract_keys: np.ndarray, name: str):
+    """
+    (breaks [contracts, width], values [contracts, width + 1], tiers per contract)
+    from one schedule's rows; contracts without rows get the default's tiers.
+    """
+    open_ended = np.isnan(bound)
+    order = np.lexsort((np.where(open_ended, np.inf, bound), contract))
+    contract, bound, value, open_ended = contract[order], bound[order], value[order], open_ended[order]
+
+    n_contracts = len(contract_keys)
+    counts = np.bincount(contract, minlength=n_contracts)
+    if counts[0] == 0:
+        raise ValueError(f"Default contract has no {name} schedule")
+    first = np.cumsum(counts) - counts
+    position = np.arange(len(contract)) - first[contract]
+    last = position == counts[contract] - 1
+    where = lambda mask: [tuple(k) for k in contract_keys[np.unique(contract[mask])[:3]].tolist()]  # noqa: E731
+    if np.isnan(value).any():
+        raise ValueError(f"{name}: every tier needs a numeric value (contracts {where(np.isnan(value))})")
+    if (open_ended != last).any():
+        raise ValueError(
+            f"{name}: exactly one tier (the last) must have an empty upper_bound (contracts {where(open_ended != last)})"
+        )
+    repeated = np.zeros(len(bound), dtype=bool)
+    repeated[1:] = (contract[1:] == contract[:-1]) & (bound[1:] == bound[:-1])
+    if repeated.any():
+        raise ValueError(f"{name}: upper bounds must be distinct (contracts {where(repeated)})")
+
+    width = counts.max() - 1
+    breaks = np.full((n_contracts, width), np.inf)
+    values = np.full((n_contracts, width + 1), np.nan)
+    breaks[contract[~last], position[~last]] = bound[~last]
+    values[contract, position] = value
+    inherit = counts == 0
+    breaks[inherit] = breaks[0]
+    values[inherit] = values[0]
+    return breaks, values, np.where(inherit, counts[0], counts)
+
+
+def compile_rate_index(table: pd.DataFrame) -> RateIndex:
+    schedule = table["schedule"].astype(str).str.strip().to_numpy(dtype=object)
+    unknown = set(schedule) - set(SCHEDULES) - set(SCALARS)
+    if unknown:
+        raise ValueError(f"Unknown schedules in contract table: {sorted(unknown)}")
+
+    # contract per row: factorize each key part, then the (customer, o3, d3) code triples
+    codes, labels = [], []
+    for c in KEY_COLUMNS:
+        part = table[c].astype(object).fillna(WILDCARD).astype(str).str.strip()
+        if c != "customer_id":
+            part = part.where(part == WILDCARD, part.str.zfill(3))
+        part_codes, part_labels = pd.factorize(part.to_numpy(dtype=object))
+        codes.append(part_codes)
+        labels.append(np.asarray(part_labels, dtype=str))
+    combined = np.ravel_multi_index(codes, [len(lab) for lab in labels])
+    unique_keys, contract = np.unique(combined, return_inverse=True)
+    contract_keys = np.stack(
+        [lab[idx] for lab, idx in zip(labels, np.unravel_index(unique_keys, [len(lab) for lab in labels]))], axis=1
+    )
+    # the default contract first, the rest in key order
+    is_default = (contract_keys == WILDCARD).all(axis=1)
+    if not is_default.any():
+        raise ValueError("Contract table needs a default contract (*, *, *)")
+    order = np.lexsort((contract_keys[:, 2], contract_keys[:, 1], contract_keys[:, 0], ~is_default))
+    rank = np.empty_like(order)
+    rank[order] = np.arange(len(order))
+    contract_keys, contract = contract_keys[order], rank[contract]
+
+    pins = {tuple(p) for p in np.unique(contract_keys != WILDCARD, axis=0).tolist()}
+    bad = sorted(pins - set(MATCH_LEVELS))
+    if bad:
+        raise ValueError(f"Contracts must pin customer, lane, both or neither; got patterns {bad}")
+
+    bound = pd.to_numeric(table["upper_bound"], errors="coerce").to_numpy(dtype=np.float64)
+    value = pd.to_numeric(table["value"], errors="coerce").to_numpy(dtype=np.float64)
+    breaks, values, tiers, scalars = {}, {}, {}, {}
+    for name in list(SCHEDULES) + list(SCALARS):
+        mask = schedule == name
+        b, v, t = _schedule_tiers(bound[mask], value[mask], contract[mask], contract_keys, name)
+        if name in SCALARS:
+            if b.shape[1]:
+                raise ValueError(f"{name} takes a single value per contract")
+            scalars[name] = v[:, 0]
+        else:
+            breaks[name], values[name], tiers[name] = b, v, t
+
+    hashes = _key_hashes(*(_part_hashes(col.astype(object)) for col in contract_keys.T))
+    if len(np.unique(hashes)) != len(hashes):
+        raise ValueError("Contract key hash collision; rename a customer or lane")
+    order = np.argsort(hashes)
+
+    digest = hashlib.sha256()
+    for arr in [contract_keys.astype("U"), *breaks.values(), *values.values(), *scalars.values()]:
+        digest.update(np.ascontiguousarray(arr).tobytes())
+
+    return RateIndex(
+        key_hashes=hashes[order],
+        key_contracts=order.astype(np.int64),
+        levels=np.array([lvl for lvl in MATCH_LEVELS if lvl in pins], dtype=bool).reshape(-1, 3),
+        contract_keys=contract_keys,
+        breaks=breaks,
+        values=values,
+        tiers=tiers,
+        scalars=scalars,
+        fingerprint=digest.hexdigest()[:16],
+    )
+
+
+@lru_cache(maxsize=1)
+def default_rate_index() -> RateIndex:
+    return compile_rate_index(default_contract_table())
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Compile a contract rate table")
+    sub = parser.add_subparsers(dest="command", required=True)
+    compile_p = sub.add_parser("compile", help="Compile a contract table CSV into a .npz index")
+    compile_p.add_argument("--contracts", default=None, help="Contract table CSV (default: the built-in rates)")
+    compile_p.add_argument("--out", required=True)
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    table = load_contract_table(args.contracts) if args.contracts else default_contract_table()
+    index = compile_rate_index(table)
+    index.save(args.out)
+    compiled_s = time.perf_counter() - start
+
+    start = time.perf_counter()
+    load_rate_index(args.out)
+    print(
+        f"Compiled {index.n_contracts} contracts in {compiled_s:.3f}s, written to: {args.out} "
+        f"(loads in {(time.perf_counter() - start) * 1000:.1f} ms, fingerprint {index.fingerprint})"
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -1,26 +1,118 @@
 import pandas as pd
+from dataclasses import dataclass
 from difflib import SequenceMatcher
 import numpy as np
 from pathlib import Path
+from typing import Optional, Tuple
+
+from src.rate_index import WILDCARD
+from src.schema import zip3
+from src.similarity import StringIndex, default_codebook, ratio
 
 def fuzzy_ratio(a: str, b: str) -> float:
     if pd.isna(a) or pd.isna(b):
         return 0.0
     return SequenceMatcher(None, str(a).lower(), str(b).lower()).ratio()
 
-def match_lane(invoice_row: pd.Series, rate_table: pd.DataFrame):
-    inv_lane = f"{invoice_row['origin']}->{invoice_row['destination']}".lower()
-    rate_table = rate_table.copy()
-    rate_table["lane_key"] = (rate_table["origin"] + "->" + rate_table["destination"]).str.lower()
-    rate_table["lane_sim"] = rate_table["lane_key"].apply(lambda x: fuzzy_ratio(inv_lane, x))
-    best_idx = rate_table["lane_sim"].idxmax()
-    return rate_table.loc[best_idx], float(rate_table.loc[best_idx, "lane_sim"])
+def _lane_keys(rate_table: pd.DataFrame) -> pd.Series:
+    return (rate_table["origin"] + "->" + rate_table["destination"]).str.lower()
+
+class LaneIndex:
+    """
+    Prebuilt lane lookup over a contract rate table.
+
+    Exact "origin->destination" keys resolve through a hash map. Misses go to a
+    similarity.StringIndex over the lane keys, which runs SequenceMatcher only
+    on lanes whose quick_ratio bound can still beat the best ratio found so
+    far. The result is the same lane and score as a full scan, with ties going
+    to the first lane in table order.
+    """
+
+    def __init__(self, rate_table: pd.DataFrame, max_candidates: Optional[int] = None):
+        self.rate_table = rate_table
+        self.max_candidates = max_candidates
+
+        keys = _lane_keys(rate_table)
+        valid = keys.notna().to_numpy()
+        keys = [k if isinstance(k, str) else "" for k in keys]
+
+        self._exact = {}
+        for pos, key in enumerate(keys):
+            if valid[pos]:
+                self._exact.setdefault(key, pos)
+        self._strings = StringIndex(keys, valid=valid, max_candidates=max_candidates)
+        self._cache = {}
+
+    def lookup(self, origin, destination) -> Tuple[int, float]:
+        """Return (row position in rate_table, lane similarity) for one invoice lane."""
+        inv_lane = f"{origin}->{destination}".lower()
+        hit = self._cache.get(inv_lane)
+        if hit is None:
+            hit = self._search(inv_lane)
+            self._cache[inv_lane] = hit
+        return hit
+
+    def lookup_many(self, origins: pd.Series, destinations: pd.Series) -> Tuple[np.ndarray, np.ndarray]:
+        """Vectorized lookup: one search per distinct lane, broadcast back to every row."""
+        codes, firsts = _pair_codes(origins, destinations)
+        hits = [self.lookup(o, d) for o, d in firsts]
+        positions = np.array([h[0] for h in hits], dtype=np.int64)
+        scores = np.array([h[1] for h in hits], dtype=np.float64)
+        return positions[codes], scores[codes]
+
+    def _search(self, inv_lane: str) -> Tuple[int, float]:
+        pos = self._exact.get(inv_lane)
+        if pos is not None:
+            return pos, 1.0
+        return self._strings.best(inv_lane)
+
+def _pair_codes(a: pd.Series, b: pd.Series):
+    """Group codes for (a, b) pairs plus the first occurrence of each pair, in order of appearance."""
+    pairs = pd.DataFrame({"a": np.asarray(a, dtype=object), "b": np.asarray(b, dtype=object)})
+    codes = pairs.groupby(["a", "b"], sort=False, dropna=False).ngroup().to_numpy()
+    firsts = pairs.drop_duplicates()
+    return codes, list(zip(firsts["a"], firsts["b"]))
+
+def build_lane_index(rate_table: pd.DataFrame, max_candidates: Optional[int] = None) -> LaneIndex:
+    return LaneIndex(rate_table, max_candidates=max_candidates)
+
+def match_lane(invoice_row: pd.Series, rate_table: pd.DataFrame, lane_index: Optional[LaneIndex] = None):
+    if lane_index is None:
+        lane_index = build_lane_index(rate_table)
+    pos, score = lane_index.lookup(invoice_row["origin"], invoice_row["destination"])
+    return lane_index.rate_table.iloc[pos], score
+
+RECONCILIATION_FLAGS = [
+    "RATE_OVER_CONTRACT",
+    "FUEL_SURCHARGE_OVER_CONTRACT",
+    "UNRECOGNIZED_ACCESSORIAL_DESC",
+    "ACCESSORIAL_OVER_CAP",
+]
+
+def _flag_text(flags) -> np.ndarray:
+    """flags text for every combination of the bits of ``flags``, indexed by mask"""
+    return np.array(
+        [
+            ";".join(f for bit, f in enumerate(flags) if mask & (1 << bit)) or "OK"
+            for mask in range(1 << len(flags))
+        ],
+        dtype=object,
+    )
+
+_FLAG_TEXT = _flag_text(RECONCILIATION_FLAGS)
+
+def _summarize(df: pd.DataFrame) -> dict:
+    return {
+        "total_invoices": len(df),
+        "pct_flagged": round((df["flags"] != "OK").sum() / len(df) * 100, 2) if len(df) else 0,
+        "total_recoverable_usd": round(df["recoverable_amount_est"].sum(), 2),
+    }
 
-def reconcile_invoices(invoices_df: pd.DataFrame, rates_df: pd.DataFrame, rate_tolerance_pct: float = 2.0):
+def _reconcile_rows(invoices_df: pd.DataFrame, rates_df: pd.DataFrame, rate_tolerance_pct: float, lane_index: LaneIndex):
+    codebook = default_codebook()
     results = []
     for _, inv in invoices_df.iterrows():
-        best_contract, lane_score = match_lane(inv, rates_df)
-
+        best_contract, lane_score = match_lane(inv, rates_df, lane_index)
         expected_rate = best_contract["contract_rate_per_mile"]
         expected_fuel_pct = best_contract["allowed_fuel_surcharge_pct"]
         expected_accessorial = best_contract["allowed_accessorial_desc"]
@@ -59,18 +151,342 @@ def reconcile_invoices(invoices_df: pd.DataFrame, rates_df: pd.DataFrame, rate_t
             "rate_diff_pct": round(rate_diff_pct, 2),
             "fuel_diff_pct_points": round(fuel_diff_pct_points, 2),
             "accessorial_similarity": round(accessorial_sim, 3),
+            "accessorial_code": codebook.code(inv["accessorial_desc"]),
             "flags": ";".join(flags) if flags else "OK",
             "confidence_score": round(confidence_score, 3),
             "recoverable_amount_est": round(recoverable_amount, 2),
         })
 
-    df = pd.DataFrame(results)
-    summary = {
-        "total_invoices": len(df),
-        "pct_flagged": round((df["flags"] != "OK").sum() / len(df) * 100, 2) if len(df) else 0,
-        "total_recoverable_usd": round(df["recoverable_amount_est"].sum(), 2),
+    return pd.DataFrame(results)
+
+def _reconcile_batch(invoices_df: pd.DataFrame, rates_df: pd.DataFrame, rate_tolerance_pct: float, lane_index: LaneIndex):
+    positions, lane_score = lane_index.lookup_many(invoices_df["origin"], invoices_df["destination"])
+    contracts = lane_index.rate_table.iloc[positions]
+
+    expected_rate = contracts["contract_rate_per_mile"].to_numpy(dtype="float64")
+    expected_fuel_pct = contracts["allowed_fuel_surcharge_pct"].to_numpy(dtype="float64")
+    expected_accessorial_cap = contracts["allowed_accessorial_cap"].to_numpy(dtype="float64")
+
+    billed_rate = invoices_df["rate_billed_per_mile"].to_numpy(dtype="float64")
+    fuel_pct = invoices_df["fuel_surcharge_pct"].to_numpy(dtype="float64")
+    miles = invoices_df["miles_billed"].to_numpy(dtype="float64")
+
+    rate_diff_pct = ((billed_rate - expected_rate) / expected_rate) * 100
+    fuel_diff_pct_points = fuel_pct - expected_fuel_pct
+    accessorial_over_cap = invoices_df["accessorial_amount"].to_numpy(dtype="float64") - expected_accessorial_cap
+
+    # one lookup per distinct (billed desc, contract desc) pair, and the pair
+    # cache spans batches, so SequenceMatcher only sees pairs it hasn't scored
+    codes, pairs = _pair_codes(invoices_df["accessorial_desc"], contracts["allowed_accessorial_desc"])
+    pair_sims = [ratio(a, b) for a, b in pairs]
+    accessorial_sim = np.array(pair_sims, dtype=np.float64)[codes]
+    # the row path rounds these Python floats with builtin round, not numpy's
+    accessorial_sim_rounded = np.array([round(v, 3) for v in pair_sims], dtype=np.float64)[codes]
+
+    fuel_over_contract = fuel_pct > expected_fuel_pct
+    mask = (
+        (rate_diff_pct > rate_tolerance_pct).astype(np.uint8)
+        | (fuel_over_contract.astype(np.uint8) << 1)
+        | ((accessorial_sim < 0.75).astype(np.uint8) << 2)
+        | ((accessorial_over_cap > 0).astype(np.uint8) << 3)
+    )
+
+    confidence_score = (lane_score + accessorial_sim) / 2
+
+    rate_over = billed_rate - expected_rate
+    per_mile_over = np.where(rate_over > 0, rate_over, 0.0) * miles
+    fuel_base = expected_rate * miles
+    fuel_over = np.where(fuel_over_contract, fuel_base * ((fuel_pct - expected_fuel_pct) / 100), 0.0)
+    accessorial_over = np.where(accessorial_over_cap > 0, accessorial_over_cap, 0.0)
+    recoverable_amount = per_mile_over + fuel_over + accessorial_over
+
+    return pd.DataFrame(
+        {
+            "invoice_id": invoices_df["invoice_id"].to_numpy(),
+            "load_id": invoices_df["load_id"].to_numpy(),
+            "origin": invoices_df["origin"].to_numpy(),
+            "destination": invoices_df["destination"].to_numpy(),
+            "rate_diff_pct": np.round(rate_diff_pct, 2),
+            "fuel_diff_pct_points": np.round(fuel_diff_pct_points, 2),
+            "accessorial_similarity": accessorial_sim_rounded,
+            "accessorial_code": default_codebook().codes(invoices_df["accessorial_desc"]),
+            "flags": _FLAG_TEXT[mask],
+            "confidence_score": np.round(confidence_score, 3),
+            "recoverable_amount_est": np.round(recoverable_amount, 2),
+        }
+    )
+
+def reconcile_invoices(
+    invoices_df: pd.DataFrame,
+    rates_df: pd.DataFrame,
+    rate_tolerance_pct: float = 2.0,
+    lane_index: Optional[LaneIndex] = None,
+    batch: bool = True,
+):
+    """
+    Reconcile billed invoices against contract rates.
+
+    batch=True joins every invoice to its matched contract once and computes all
+    columns with array operations. batch=False is the original row-by-row path;
+    both return the same frame and summary.
+    """
+    if lane_index is None:
+        lane_index = build_lane_index(rates_df)
+
+    if batch:
+        df = _reconcile_batch(invoices_df, rates_df, rate_tolerance_pct, lane_index)
+    else:
+        df = _reconcile_rows(invoices_df, rates_df, rate_tolerance_pct, lane_index)
+    return df, _summarize(df)
+
+# Shipment reconciliation: the pipeline schema (load_invoice_data) against
+# carrier contracts keyed by carrier and zip3 lane. A lane of "*" is the
+# carrier's default contract. Empty max_fuel_pct / accessorial_cap mean no cap.
+CARRIER_CONTRACT_COLUMNS = [
+    "carrier",
+    "origin_zip3",
+    "dest_zip3",
+    "rate_per_mile",
+    "min_charge",
+    "max_fuel_pct",
+    "accessorial_cap",
+]
+
+SHIPMENT_RECONCILIATION_FLAGS = [
+    "RATE_OVER_CONTRACT",
+    "FUEL_SURCHARGE_OVER_CONTRACT",
+    "ACCESSORIAL_OVER_CAP",
+    "NO_CONTRACT",
+]
+
+_SHIPMENT_FLAG_TEXT = _flag_text(SHIPMENT_RECONCILIATION_FLAGS)
+
+# billed amounts: the generator's actual_billed_* columns, else the pipeline schema's
+BILLED_COLUMNS = {
+    "linehaul": ("actual_billed_linehaul", "base_linehaul_amount"),
+    "fuel": ("actual_billed_fuel", "fuel_surcharge_amount"),
+    "accessorials": ("actual_billed_accessorials", "liftgate_fee_charged"),
+}
+
+SHIPMENT_RECONCILIATION_COLUMNS = [
+    "shipment_id",
+    "carrier",
+    "origin_zip",
+    "destination_zip",
+    "contract_match",
+    "contract_linehaul",
+    "rate_over",
+    "fuel_over",
+    "accessorial_over",
+    "flags",
+    "recoverable_amount_est",
+    "underbilled_amount",
+]
+
+def _carrier_name(values: pd.Series) -> pd.Series:
+    return values.astype(str).str.strip().str.lower()
+
+def _label_codes(values, labels: pd.Index, normalize) -> np.ndarray:
+    """Position of each normalized value in ``labels`` (-1 if absent), normalizing each distinct value once."""
+    codes, uniques = pd.factorize(values)
+    found = labels.get_indexer(normalize(pd.Series(uniques)))
+    return np.append(found, -1)[codes]
+
+@dataclass(frozen=True)
+class CarrierContracts:
+    """
+    A carrier contract table prepared once and reused for every batch. Each
+    contract's (carrier, origin zip3, destination zip3) codes are packed into
+    one int64 key, so a batch is matched with two hash lookups: its lane, then
+    its carrier's default.
+    """
+    carriers: pd.Index  # normalized carrier names
+    zip3s: pd.Index  # zip3 prefixes named by some contract; code len(zip3s) is the wildcard
+    keys: pd.Index  # int64 key per contract
+    lane_level: np.ndarray  # bool per contract, False for a carrier default
+    rate_per_mile: np.ndarray
+    min_charge: np.ndarray
+    max_fuel_pct: np.ndarray  # inf when uncapped
+    accessorial_cap: np.ndarray  # inf when uncapped
+
+    def _key(self, carrier, origin, dest) -> np.ndarray:
+        width = len(self.zip3s) + 1
+        return (np.asarray(carrier, dtype=np.int64) * width + origin) * width + dest
+
+    def lookup(self, df: pd.DataFrame) -> np.ndarray:
+        """Contract position per shipment: its lane's, else its carrier's default, else -1."""
+        carrier = _label_codes(df["carrier"], self.carriers, _carrier_name)
+        origin = _label_codes(df["origin_zip"], self.zip3s, zip3)
+        dest = _label_codes(df["destination_zip"], self.zip3s, zip3)
+
+        pos = np.full(len(df), -1, dtype=np.int64)
+        lane = (carrier >= 0) & (origin >= 0) & (dest >= 0)
+        pos[lane] = self.keys.get_indexer(self._key(carrier[lane], origin[lane], dest[lane]))
+        rest = (carrier >= 0) & (pos < 0)
+        wild = len(self.zip3s)
+        pos[rest] = self.keys.get_indexer(self._key(carrier[rest], wild, wild))
+        return pos
+
+def prepare_carrier_contracts(table: pd.DataFrame) -> CarrierContracts:
+    missing = [c for c in CARRIER_CONTRACT_COLUMNS if c not in table.columns]
+    if missing:
+        raise ValueError(f"Carrier contract table is missing columns: {missing}")
+    if table["carrier"].isna().any():
+        raise ValueError("Every carrier contract needs a carrier")
+
+    carrier = _carrier_name(table["carrier"])
+    lanes = []
+    for c in ["origin_zip3", "dest_zip3"]:
+        part = table[c].astype(object).fillna(WILDCARD).astype(str).str.strip()
+        lanes.append(part.where(part == WILDCARD, part.str.zfill(3)))
+    origin, dest = lanes
+    if ((origin == WILDCARD) != (dest == WILDCARD)).any():
+        raise ValueError("A carrier contract names both lane ends or neither ('*')")
+
+    carriers = pd.Index(carrier.unique())
+    zip3s = pd.Index(sorted(set(origin[origin != WILDCARD]) | set(dest[dest != WILDCARD])))
+    wild = len(zip3s)
+    width = wild + 1
+    codes = [
+        carriers.get_indexer(carrier),
+        np.where(origin == WILDCARD, wild, zip3s.get_indexer(origin)),
+        np.where(dest == WILDCARD, wild, zip3s.get_indexer(dest)),
+    ]
+    keys = pd.Index((codes[0].astype(np.int64) * width + codes[1]) * width + codes[2])
+    if keys.has_duplicates:
+        raise ValueError("Carrier contract table has more than one contract for the same carrier and lane")
+
+    def number(column: str, empty: float) -> np.ndarray:
+        return pd.to_numeric(table[column], errors="coerce").fillna(empty).to_numpy(dtype=np.float64)
+
+    rate = pd.to_numeric(table["rate_per_mile"], errors="coerce").to_numpy(dtype=np.float64)
+    if np.isnan(rate).any():
+        raise ValueError("Every carrier contract needs a numeric rate_per_mile")
+    return CarrierContracts(
+        carriers=carriers,
+        zip3s=zip3s,
+        keys=keys,
+        lane_level=(origin != WILDCARD).to_numpy(),
+        rate_per_mile=rate,
+        min_charge=number("min_charge", 0.0),
+        max_fuel_pct=number("max_fuel_pct", np.inf),
+        accessorial_cap=number("accessorial_cap", np.inf),
+    )
+
+def load_carrier_contracts(path: str) -> CarrierContracts:
+    table = pd.read_csv(path, dtype={"carrier": str, "origin_zip3": str, "dest_zip3": str})
+    return prepare_carrier_contracts(table)
+
+def _billed(df: pd.DataFrame, columns: Tuple[str, str]) -> np.ndarray:
+    col = next((c for c in columns if c in df.columns), None)
+    if col is None:
+        raise ValueError(f"Shipment reconciliation needs one of the columns {list(columns)}")
+    return pd.to_numeric(df[col], errors="coerce").to_numpy(dtype=np.float64, na_value=np.nan)
+
+def reconcile_shipments(
+    df: pd.DataFrame,
+    contracts: CarrierContracts,
+    rate_tolerance_pct: float = 2.0,
+) -> pd.DataFrame:
+    """
+    SHIPMENT_RECONCILIATION_COLUMNS for every row of ``df``, keeping its index.
+
+    Overages follow reconcile_invoices: linehaul over max(miles * rate,
+    min_charge), the billed fuel percent over max_fuel_pct applied to the
+    contract linehaul, and accessorials over accessorial_cap. All of them count
+    toward recoverable_amount_est; RATE_OVER_CONTRACT is flagged past
+    ``rate_tolerance_pct``. underbilled_amount is copied from the rules when
+    they have run.
+    """
+    missing = [c for c in ["shipment_id", "carrier", "origin_zip", "destination_zip", "distance_miles"] if c not in df.columns]
+    if missing:
+        raise ValueError(f"Shipment reconciliation is missing columns: {missing}")
+
+    pos = contracts.lookup(df)
+    matched = pos >= 0
+    take = np.maximum(pos, 0)
+
+    def term(values: np.ndarray) -> np.ndarray:
+        return np.where(matched, values[take], np.nan)
+
+    miles = pd.to_numeric(df["distance_miles"], errors="coerce").to_numpy(dtype=np.float64, na_value=np.nan)
+    linehaul, fuel, accessorials = (_billed(df, cols) for cols in BILLED_COLUMNS.values())
+    max_fuel_pct = term(contracts.max_fuel_pct)
+    accessorial_cap = term(contracts.accessorial_cap)
+
+    with np.errstate(invalid="ignore", divide="ignore"):
+        contract_linehaul = np.fmax(miles * term(contracts.rate_per_mile), term(contracts.min_charge))
+        rate_over = np.where(linehaul > contract_linehaul, linehaul - contract_linehaul, 0.0)
+        fuel_pct = np.where(linehaul > 0, fuel / linehaul * 100, np.nan)
+        fuel_over_contract = fuel_pct > max_fuel_pct
+        fuel_over = np.where(fuel_over_contract, contract_linehaul * ((fuel_pct - max_fuel_pct) / 100), 0.0)
+        accessorial_over_cap = accessorials > accessorial_cap
+        accessorial_over = np.where(accessorial_over_cap, accessorials - accessorial_cap, 0.0)
+        rate_over_contract = linehaul > contract_linehaul * (1 + rate_tolerance_pct / 100)
+
+    mask = (
+        rate_over_contract.astype(np.uint8)
+        | (fuel_over_contract.astype(np.uint8) << 1)
+        | (accessorial_over_cap.astype(np.uint8) << 2)
+        | ((~matched).astype(np.uint8) << 3)
+    )
+    underbilled = (
+        pd.to_numeric(df["underbilled_amount"]).to_numpy(dtype=np.float64, na_value=np.nan)
+        if "underbilled_amount" in df.columns
+        else np.full(len(df), np.nan)
+    )
+    return pd.DataFrame(
+        {
+            "shipment_id": df["shipment_id"],
+            "carrier": df["carrier"],
+            "origin_zip": df["origin_zip"],
+            "destination_zip": df["destination_zip"],
+            "contract_match": np.where(matched, np.where(contracts.lane_level[take], "lane", "carrier"), ""),
+            "contract_linehaul": np.round(contract_linehaul, 2),
+            "rate_over": np.round(rate_over, 2),
+            "fuel_over": np.round(fuel_over, 2),
+            "accessorial_over": np.round(accessorial_over, 2),
+            "flags": _SHIPMENT_FLAG_TEXT[mask],
+            "recoverable_amount_est": np.round(rate_over + fuel_over + accessorial_over, 2),
+            "underbilled_amount": underbilled,
+        },
+        index=df.index,
+        columns=SHIPMENT_RECONCILIATION_COLUMNS,
+    )
+
+def reconciliation_partials(rows: pd.DataFrame) -> dict:
+    """Additive totals of reconcile_shipments rows; merge chunks with merge_reconciliation_partials."""
+    return {
+        "total_shipments": len(rows),
+        "matched_shipments": int((rows["contract_match"] != "").sum()),
+        "flagged_shipments": int((rows["flags"] != "OK").sum()),
+        "recoverable_usd": float(rows["recoverable_amount_est"].sum()),
+        "underbilled_usd": float(rows["underbilled_amount"].clip(lower=0).sum()),
+    }
+
+def empty_reconciliation_partials() -> dict:
+    """reconciliation_partials of no rows, to merge chunks into."""
+    return {
+        "total_shipments": 0,
+        "matched_shipments": 0,
+        "flagged_shipments": 0,
+        "recoverable_usd": 0.0,
+        "underbilled_usd": 0.0,
+    }
+
+def merge_reconciliation_partials(a: dict, b: dict) -> dict:
+    return {k: a[k] + b[k] for k in a}
+
+def finalize_reconciliation_summary(partials: dict) -> dict:
+    n = partials["total_shipments"]
+    return {
+        "total_shipments": n,
+        "pct_matched": round(partials["matched_shipments"] / n * 100, 2) if n else 0,
+        "flagged_shipments": partials["flagged_shipments"],
+        "pct_flagged": round(partials["flagged_shipments"] / n * 100, 2) if n else 0,
+        "total_recoverable_usd": round(partials["recoverable_usd"], 2),
+        "total_underbilled_usd": round(partials["underbilled_usd"], 2),
     }
-    return df, summary
 
 def main():
     root = Path(__file__).resolve().parents[1]
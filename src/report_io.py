@@ -0,0 +1,215 @@
+"""Tabular report writers for the pipeline's CSV and Parquet output formats."""
+import os
+import tempfile
+from typing import List, Optional
+
+import numpy as np
+import pandas as pd
+
+REPORT_FORMATS = ("csv", "parquet")
+
+
+def report_path(out_dir: str, name: str, fmt: str) -> str:
+    if fmt not in REPORT_FORMATS:
+        raise ValueError(f"Unknown report format: {fmt!r} (expected one of {REPORT_FORMATS})")
+    return os.path.join(out_dir, f"{name}.{fmt}")
+
+
+def write_report(df: pd.DataFrame, path: str, fmt: str) -> None:
+    if fmt == "parquet":
+        df.to_parquet(path, index=False)
+    else:
+        df.to_csv(path, index=False)
+
+
+class ReportAppender:
+    """
+    Incrementally writes one report from a sequence of frames with the same columns.
+
+    CSV frames are appended to the file. Parquet frames are written as row groups
+    through a single pyarrow ParquetWriter. Empty frames are held back until a
+    non-empty one fixes the Parquet schema, so the first chunk having no flagged
+    rows does not leave untyped columns.
+    """
+
+    def __init__(self, path: str, fmt: str):
+        if fmt not in REPORT_FORMATS:
+            raise ValueError(f"Unknown report format: {fmt!r} (expected one of {REPORT_FORMATS})")
+        self.path = path
+        self.fmt = fmt
+        self._wrote_any = False
+        self._empty: Optional[pd.DataFrame] = None
+        self._writer = None
+
+    def append(self, df: pd.DataFrame) -> None:
+        if df.empty:
+            if self._empty is None:
+                self._empty = df
+            return
+
+        if self.fmt == "parquet":
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+
+            if self._writer is None:
+                table = pa.Table.from_pandas(df, preserve_index=False)
+                self._writer = pq.ParquetWriter(self.path, table.schema)
+            else:
+                table = pa.Table.from_pandas(df, schema=self._writer.schema, preserve_index=False)
+            self._writer.write_table(table)
+        else:
+            df.to_csv(self.path, mode="a" if self._wrote_any else "w", header=not self._wrote_any, index=False)
+        self._wrote_any = True
+
+    def close(self) -> None:
+        if self._writer is not None:
+            self._writer.close()
+            self._writer = None
+        if not self._wrote_any and self._empty is not None:
+            write_report(self._empty, self.path, self.fmt)
+            self._wrote_any = True
+
+    def __enter__(self) -> "ReportAppender":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+
+class SortedReportWriter:
+    """
+    Writes one report sorted on column ``by`` from frames that arrive in any
+    order, without holding them all in memory.
+
+    Each appended frame is sorted and spilled to a temporary directory as a run
+    of pickled blocks of ``block_rows`` rows. close() merges the runs,
+    ``fan_in`` at a time, so at most fan_in blocks are in memory; runs beyond
+    that are merged into longer runs first. The output is the stable sort of
+    all appended frames in append order (missing values last).
+    """
+
+    def __init__(
+        self,
+        path: str,
+        fmt: str,
+        by: str,
+        ascending: bool = True,
+        block_rows: int = 65_536,
+        fan_in: int = 16,
+    ):
+        if fan_in < 2:
+            raise ValueError("fan_in must be at least 2")
+        self._out = ReportAppender(path, fmt)
+        self.by = by
+        self.ascending = ascending
+        self.block_rows = max(1, block_rows)
+        self.fan_in = fan_in
+        self._tmp = tempfile.TemporaryDirectory(prefix="sorted_report_")
+        self._runs: List[List[str]] = []
+        self._n_blocks = 0
+        self._empty: Optional[pd.DataFrame] = None
+        self._closed = False
+
+    def _keys(self, df: pd.DataFrame) -> np.ndarray:
+        """Ascending float key per row: NaN (and missing) last."""
+        values = pd.to_numeric(df[self.by]).to_numpy(dtype=np.float64, na_value=np.nan)
+        if not self.ascending:
+            values = -values
+        return np.where(np.isnan(values), np.inf, values)
+
+    def _spill(self, blocks) -> List[str]:
+        run = []
+        for block in blocks:
+            path = os.path.join(self._tmp.name, f"{self._n_blocks:08d}.pkl")
+            block.to_pickle(path)
+            run.append(path)
+            self._n_blocks += 1
+        return run
+
+    def _split(self, df: pd.DataFrame):
+        for start in range(0, len(df), self.block_rows):
+            yield df.iloc[start:start + self.block_rows]
+
+    def append(self, df: pd.DataFrame) -> None:
+        if df.empty:
+            if self._empty is None:
+                self._empty = df
+            return
+        order = np.argsort(self._keys(df), kind="stable")
+        self._runs.append(self._spill(self._split(df.iloc[order].reset_index(drop=True))))
+
+    def _read(self, run: List[str]):
+        for path in run:
+            block = pd.read_pickle(path)
+            os.remove(path)
+            yield block
+
+    def _merge(self, runs: List[List[str]]):
+        """Frames of the merged runs, in order, each at most about fan_in blocks long."""
+        readers = [self._read(run) for run in runs]
+        buffers = [next(reader, None) for reader in readers]
+        keys = [None if b is None else self._keys(b) for b in buffers]
+        while True:
+            live = [i for i, b in enumerate(buffers) if b is not None]
+            if not live:
+                return
+            # rows order by (key, run, position); every row at or before the smallest
+            # buffered tail is final, since unread rows of each run sort after its tail
+            tail_key, tail_run = min((keys[i][-1], i) for i in live)
+            pieces, piece_keys = [], []
+            for i in live:
+                if i == tail_run:
+                    n = len(keys[i])
+                else:
+                    n = int(np.searchsorted(keys[i], tail_key, side="right" if i < tail_run else "left"))
+                if n:
+                    pieces.append(buffers[i].iloc[:n])
+                    piece_keys.append(keys[i][:n])
+                if n == len(keys[i]):
+                    buffers[i] = next(readers[i], None)
+                    keys[i] = None if buffers[i] is None else self._keys(buffers[i])
+                else:
+                    buffers[i] = buffers[i].iloc[n:]
+                    keys[i] = keys[i][n:]
+            order = np.argsort(np.concatenate(piece_keys), kind="stable")
+            yield pd.concat(pieces, ignore_index=True).iloc[order]
+
+    def _rebatch(self, frames):
+        """frames cut into blocks of block_rows rows."""
+        pending = []
+        size = 0
+        for frame in frames:
+            pending.append(frame)
+            size += len(frame)
+            while size >= self.block_rows:
+                merged = pd.concat(pending, ignore_index=True)
+                yield merged.iloc[:self.block_rows]
+                pending, size = [merged.iloc[self.block_rows:]], size - self.block_rows
+        if size:
+            yield pd.concat(pending, ignore_index=True)
+
+    def close(self) -> None:
+        if self._closed:
+            return
+        self._closed = True
+        try:
+            runs = self._runs
+            while len(runs) > self.fan_in:
+                runs = [
+                    self._spill(self._rebatch(self._merge(runs[i:i + self.fan_in])))
+                    for i in range(0, len(runs), self.fan_in)
+                ]
+            for frame in self._merge(runs):
+                self._out.append(frame.reset_index(drop=True))
+            if self._empty is not None:
+                self._out.append(self._empty)
+            self._out.close()
+        finally:
+            self._runs = []
+            self._tmp.cleanup()
+
+    def __enter__(self) -> "SortedReportWriter":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
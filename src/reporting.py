@@ -1,19 +1,183 @@
+"""
+Leakage summary and rollups from mergeable partial states.
+
+leakage_partials makes one pass over the flagged rows of a batch. It groups
+them by every rollup dimension at once (customer, carrier, zip3 lane, flag
+combination, ship week) plus a log-scale bucket of underbilled_amount, keeping
+a count and sums per cell. Every rollup comes from that cell table without
+going back to the rows:
+
+- counts and sums by any dimension are sums over cells;
+- quantiles of underbilled_amount come from the bucket counts (a
+  DDSketch-style histogram; estimates are within SKETCH_ALPHA relative error);
+- the largest underbilled shipments are kept as a top-k list.
+
+Partials from chunks, shards or earlier runs combine with
+merge_leakage_partials, and save/load_leakage_partials keep them between runs:
+
+    PYTHONPATH=. python -m src.reporting rollup day1/leakage_partials.json day2/leakage_partials.json --outdir week
+"""
+import argparse
+import heapq
+import json
+import math
+import os
+from typing import Dict, List, Optional, Sequence
+
+import numpy as np
 import pandas as pd
 
-def summarize_leakage(df: pd.DataFrame) -> dict:
-    flagged = df[df["flag_reason"] != ""].copy()
+from src.schema import zip3
+
+TOP_SHIPMENTS = 20
+ROLLUP_TOP_K = 10
+ROLLUP_QUANTILES = (0.5, 0.9, 0.99)
+
+SKETCH_ALPHA = 0.01
+_GAMMA = (1 + SKETCH_ALPHA) / (1 - SKETCH_ALPHA)
+_LOG_GAMMA = math.log(_GAMMA)
+# keeps bucket magnitudes positive down to amounts of 1e-9, so the sign can mark negatives
+_BUCKET_BIAS = 4096
+
+CELL_VALUES = ["shipments", "underbilled_usd", "leakage_usd"]
+
+def _week_start(dates: pd.Series) -> pd.Series:
+    """Monday of each ship date's week as YYYY-MM-DD (missing if the date is)."""
+    days = pd.to_datetime(dates, errors="coerce").dt.normalize()
+    return (days - pd.to_timedelta(days.dt.dayofweek, unit="D")).dt.strftime("%Y-%m-%d")
+
+def _per_distinct(fn, *columns: pd.Series) -> pd.Series:
+    """fn(*columns) computed on the distinct rows of ``columns`` only and spread back to every row."""
+    combined = np.zeros(len(columns[0]), dtype=np.int64)
+    for col in columns:
+        codes, uniques = pd.factorize(col, use_na_sentinel=False)
+        combined = combined * len(uniques) + codes
+    group, distinct = pd.factorize(combined)
+    _, first = np.unique(group, return_index=True)
+    values = fn(*(col.iloc[first] for col in columns))
+    return pd.Series(np.asarray(values, dtype=object)[group], index=columns[0].index)
 
-    total_shipments = len(df)
-    flagged_shipments = len(flagged)
+def _rollup_lane_keys(origin_zips: pd.Series, destination_zips: pd.Series) -> pd.Series:
+    """zip3 lane per row; zip3 runs once per distinct zip and the join once per distinct lane."""
+    prefix_codes = []
+    for zips in (origin_zips, destination_zips):
+        codes, uniques = pd.factorize(zips, use_na_sentinel=False)
+        prefix, prefixes = pd.factorize(zip3(pd.Series(uniques)).to_numpy(dtype=object))
+        prefix_codes.append((prefix[codes], prefixes))
+    (origin, origins), (destination, destinations) = prefix_codes
+    lane, distinct = pd.factorize(origin * len(destinations) + destination)
+    labels = origins[distinct // len(destinations)] + "->" + destinations[distinct % len(destinations)]
+    return pd.Series(labels[lane], index=origin_zips.index)
+
+def _rollup_keys(flagged: pd.DataFrame) -> Dict[str, pd.Series]:
+    """Value of each available dimension per flagged row, as plain objects."""
+    keys = {}
+    if "customer_id" in flagged.columns:
+        keys["customer"] = flagged["customer_id"].astype(object)
+    if "carrier" in flagged.columns:
+        keys["carrier"] = flagged["carrier"].astype(object)
+    if "origin_zip" in flagged.columns and "destination_zip" in flagged.columns:
+        keys["lane"] = _rollup_lane_keys(flagged["origin_zip"], flagged["destination_zip"])
+    keys["flag"] = _per_distinct(lambda reasons: reasons.astype(str), flagged["flag_reason"])
+    if "ship_date" in flagged.columns:
+        keys["week"] = _per_distinct(_week_start, flagged["ship_date"])
+    return keys
+
+def _sketch_buckets(amounts: np.ndarray) -> np.ndarray:
+    """Signed log-scale bucket per amount; 0 holds zero (and missing) amounts."""
+    x = np.nan_to_num(amounts, nan=0.0)
+    magnitude = np.ceil(np.log(np.maximum(np.abs(x), 1e-9)) / _LOG_GAMMA) + _BUCKET_BIAS
+    return (np.sign(x) * magnitude).astype(np.int64)
+
+def _bucket_values(buckets: np.ndarray) -> np.ndarray:
+    """Representative amount of each bucket, within SKETCH_ALPHA of every amount in it."""
+    magnitude = np.abs(buckets) - _BUCKET_BIAS
+    return np.sign(buckets) * 2.0 * np.power(_GAMMA, magnitude) / (_GAMMA + 1.0)
+
+def _compact(cells: pd.DataFrame, dimensions: Sequence[str]) -> pd.DataFrame:
+    keys = list(dimensions) + ["bucket"]
+    return cells.groupby(keys, sort=False, dropna=False, as_index=False)[CELL_VALUES].sum()
+
+def leakage_partials(df: pd.DataFrame) -> dict:
+    """
+    Mergeable aggregates behind summarize_leakage and leakage_rollups for one
+    batch of rule output.
+
+    Partials from separate chunks combine with merge_leakage_partials and turn
+    into the summary dict with finalize_leakage_summary.
+    """
+    is_flagged = df["flag_reason"] != ""
+    flagged = df.loc[is_flagged]
+    underbilled = pd.to_numeric(flagged["underbilled_amount"]).to_numpy(dtype=np.float64, na_value=np.nan)
+
+    keys = _rollup_keys(flagged)
+    cells = pd.DataFrame(keys, index=flagged.index)
+    cells["bucket"] = _sketch_buckets(underbilled)
+    cells["shipments"] = 1
+    cells["underbilled_usd"] = underbilled
+    cells["leakage_usd"] = np.clip(underbilled, 0, None)
+
+    ids = flagged["shipment_id"].astype(str).to_numpy() if "shipment_id" in flagged.columns else flagged.index.astype(str)
+    # every row tied with the k-th largest amount stays a candidate, so ties break on id as they do after a merge
+    amounts = np.nan_to_num(underbilled, nan=-np.inf)
+    cutoff = -np.partition(-amounts, TOP_SHIPMENTS - 1)[TOP_SHIPMENTS - 1] if len(amounts) > TOP_SHIPMENTS else -np.inf
+    top = heapq.nlargest(
+        TOP_SHIPMENTS,
+        ((float(underbilled[i]), str(ids[i])) for i in np.flatnonzero((amounts >= cutoff) & ~np.isnan(underbilled))),
+    )
+
+    cells = _compact(cells.reset_index(drop=True), list(keys))
+    return {
+        "total_shipments": len(df),
+        "flagged_shipments": len(flagged),
+        "leakage_usd": float(pd.Series(underbilled).clip(lower=0).sum()),
+        "dimensions": list(keys),
+        "cells": cells,
+        "compacted_cells": len(cells),
+        "top_shipments": top,
+    }
 
-    leakage_series = flagged["underbilled_amount"].clip(lower=0)
-    total_leakage_usd = round(float(leakage_series.sum()), 2)
+def empty_leakage_partials() -> dict:
+    """Partials of no rows: the starting point to merge chunks into, and what an empty input summarizes to."""
+    empty = pd.DataFrame({"flag_reason": pd.Series(dtype=object), "underbilled_amount": pd.Series(dtype=np.float64)})
+    return leakage_partials(empty)
 
-    if "customer_id" in df.columns:
+def merge_leakage_partials(a: dict, b: dict) -> dict:
+    # partials of no rows hold no cells, so they merge with any dimensions
+    if not a["total_shipments"]:
+        return b
+    if not b["total_shipments"]:
+        return a
+    if a["dimensions"] != b["dimensions"]:
+        raise ValueError(f"Can't merge leakage partials over {a['dimensions']} and {b['dimensions']}")
+
+    cells = pd.concat([a["cells"], b["cells"]], ignore_index=True)
+    compacted = max(a["compacted_cells"], b["compacted_cells"])
+    # regrouping is linear in the table, so only do it once the table has doubled
+    if len(cells) > 2 * compacted + 100_000:
+        cells = _compact(cells, a["dimensions"])
+        compacted = len(cells)
+
+    return {
+        "total_shipments": a["total_shipments"] + b["total_shipments"],
+        "flagged_shipments": a["flagged_shipments"] + b["flagged_shipments"],
+        "leakage_usd": a["leakage_usd"] + b["leakage_usd"],
+        "dimensions": a["dimensions"],
+        "cells": cells,
+        "compacted_cells": compacted,
+        "top_shipments": heapq.nlargest(TOP_SHIPMENTS, a["top_shipments"] + b["top_shipments"]),
+    }
+
+def finalize_leakage_summary(partials: dict) -> dict:
+    total_shipments = partials["total_shipments"]
+    flagged_shipments = partials["flagged_shipments"]
+
+    if "customer" in partials["dimensions"]:
+        # ties break on customer id, so merged partials rank like one frame
         top_customers = (
-            flagged.groupby("customer_id")["underbilled_amount"]
-            .sum()
-            .sort_values(ascending=False)
+            partials["cells"].groupby("customer")["underbilled_usd"].sum()
+            .sort_index()
+            .sort_values(ascending=False, kind="stable")
             .head(5)
         ).to_dict()
     else:
@@ -22,7 +186,130 @@ def summarize_leakage(df: pd.DataFrame) -> dict:
     return {
         "total_shipments": total_shipments,
         "flagged_shipments": flagged_shipments,
-        "flag_rate_pct": round((flagged_shipments / total_shipments) * 100.0, 2),
-        "estimated_revenue_leakage_usd": total_leakage_usd,
+        "flag_rate_pct": round((flagged_shipments / total_shipments) * 100.0, 2) if total_shipments else 0.0,
+        "estimated_revenue_leakage_usd": round(partials["leakage_usd"], 2),
         "top_customers_by_leakage_usd": top_customers
     }
+
+def summarize_leakage(df: pd.DataFrame) -> dict:
+    return finalize_leakage_summary(leakage_partials(df))
+
+def _quantiles(buckets: pd.Series, counts: pd.Series, quantiles: Sequence[float]) -> Dict[str, Optional[float]]:
+    """Nearest-rank quantiles of the amounts behind a bucket histogram."""
+    hist = counts.groupby(buckets.to_numpy()).sum()
+    values = _bucket_values(hist.index.to_numpy())
+    order = np.argsort(values, kind="stable")
+    cumulative = np.cumsum(hist.to_numpy()[order])
+    out = {}
+    for q in quantiles:
+        name = f"p{q * 100:g}"
+        if not len(cumulative) or cumulative[-1] == 0:
+            out[name] = None
+            continue
+        rank = max(1, math.ceil(q * cumulative[-1]))
+        out[name] = round(float(values[order][np.searchsorted(cumulative, rank)]), 2)
+    return out
+
+def _rollup(cells: pd.DataFrame, dimension: str, top_k: int, quantiles: Sequence[float]) -> List[dict]:
+    # the (key, bucket) histogram is all a rollup needs, and far smaller than the cells
+    hist = cells.groupby([dimension, "bucket"], sort=False, dropna=False, as_index=False)[CELL_VALUES].sum()
+    if dimension == "flag":
+        # a row with several flags counts once under each of them
+        hist = hist.assign(flag=hist["flag"].str.split("; ")).explode("flag")
+    totals = hist.groupby(dimension, sort=False, dropna=False)[CELL_VALUES].sum()
+    if dimension == "week":
+        totals = totals.sort_index()
+    else:
+        totals = totals.sort_index().sort_values("underbilled_usd", ascending=False, kind="stable").head(top_k)
+
+    selected = hist[hist[dimension].isin(totals.index)]
+    sketches = dict(list(selected.groupby(dimension, sort=False, dropna=False)))
+    rows = []
+    for key, total in totals.iterrows():
+        sketch = sketches[key]
+        rows.append(
+            {
+                dimension: None if pd.isna(key) else key,
+                "shipments": int(total["shipments"]),
+                "underbilled_usd": round(float(total["underbilled_usd"]), 2),
+                "leakage_usd": round(float(total["leakage_usd"]), 2),
+                **_quantiles(sketch["bucket"], sketch["shipments"], quantiles),
+            }
+        )
+    return rows
+
+def leakage_rollups(
+    partials: dict,
+    top_k: int = ROLLUP_TOP_K,
+    quantiles: Sequence[float] = ROLLUP_QUANTILES,
+) -> dict:
+    """
+    Flagged shipments, underbilled sums and underbilled_amount quantiles by
+    each dimension in the partials (the top_k by underbilled sum, every week),
+    plus the largest underbilled shipments.
+    """
+    cells = partials["cells"]
+    out = {
+        "flagged_shipments": partials["flagged_shipments"],
+        "underbilled_quantiles": _quantiles(cells["bucket"], cells["shipments"], quantiles),
+        "top_shipments": [
+            {"shipment_id": shipment_id, "underbilled_amount": round(amount, 2)}
+            for amount, shipment_id in partials["top_shipments"]
+        ],
+    }
+    for dimension in partials["dimensions"]:
+        out[f"by_{dimension}"] = _rollup(cells, dimension, top_k, quantiles)
+    return out
+
+def save_leakage_partials(partials: dict, path: str) -> None:
+    """JSON copy of ``partials`` (cells compacted) that load_leakage_partials reads back."""
+    cells = _compact(partials["cells"], partials["dimensions"])
+    columns = {c: cells[c].astype(object).where(cells[c].notna(), None).tolist() for c in cells.columns}
+    doc = {k: v for k, v in partials.items() if k not in ("cells", "compacted_cells")}
+    doc["cells"] = columns
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(doc, f)
+    os.replace(tmp_path, path)
+
+def load_leakage_partials(path: str) -> dict:
+    with open(path, encoding="utf-8") as f:
+        doc = json.load(f)
+    cells = pd.DataFrame(doc.pop("cells"))
+    for dimension in doc["dimensions"]:
+        cells[dimension] = cells[dimension].astype(object)
+    cells = cells.astype({"bucket": "int64", "shipments": "int64", "underbilled_usd": "float64", "leakage_usd": "float64"})
+    doc["top_shipments"] = [tuple(t) for t in doc["top_shipments"]]
+    return {**doc, "cells": cells, "compacted_cells": len(cells)}
+
+def write_leakage_rollups(partials: dict, out_dir: str, top_k: int = ROLLUP_TOP_K) -> str:
+    path = os.path.join(out_dir, "leakage_rollups.json")
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(leakage_rollups(partials, top_k=top_k), f, indent=2)
+    return path
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Merge saved leakage partials and write their summary and rollups")
+    sub = parser.add_subparsers(dest="command", required=True)
+    rollup = sub.add_parser("rollup")
+    rollup.add_argument("partials", nargs="+", help="leakage_partials.json files from earlier runs")
+    rollup.add_argument("--outdir", required=True)
+    rollup.add_argument("--top-k", type=int, default=ROLLUP_TOP_K)
+    args = parser.parse_args()
+
+    partials = empty_leakage_partials()
+    for path in args.partials:
+        partials = merge_leakage_partials(partials, load_leakage_partials(path))
+
+    os.makedirs(args.outdir, exist_ok=True)
+    summary_path = os.path.join(args.outdir, "summary_metrics.json")
+    with open(summary_path, "w", encoding="utf-8") as f:
+        json.dump(finalize_leakage_summary(partials), f, indent=2)
+    save_leakage_partials(partials, os.path.join(args.outdir, "leakage_partials.json"))
+    rollups_path = write_leakage_rollups(partials, args.outdir, top_k=args.top_k)
+    print(f"Merged {len(args.partials)} partials ({partials['total_shipments']} shipments)")
+    print(f"Summary metrics written to: {summary_path}")
+    print(f"Leakage rollups written to: {rollups_path}")
+
+if __name__ == "__main__":
+    main()
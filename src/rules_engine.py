@@ -1,8 +1,166 @@
+from dataclasses import dataclass
+from typing import Callable, Dict, List, Optional, Set, Tuple
+
+import numpy as np
 import pandas as pd
 
-def apply_leakage_rules(df: pd.DataFrame) -> pd.DataFrame:
-    df = df.copy()
 
+@dataclass(frozen=True)
+class RuleContext:
+    """What a rule predicate can see besides the frame itself."""
+    # role -> concrete column name, e.g. "expected_total" -> "expected_billed_total"
+    columns: Dict[str, str]
+    duplicate_ids: Optional[Set] = None
+
+    def col(self, name: str) -> str:
+        return self.columns.get(name, name)
+
+
+@dataclass(frozen=True)
+class LeakageRule:
+    """
+    One leakage rule.
+
+    name: text used in flag_reason, and the rule's bit position is its
+    registration order.
+    requires: columns (or column roles from RuleContext) the predicate reads.
+    If any is missing from the frame the rule is false for every row.
+    predicate: vectorized test returning a boolean per row.
+    column: optional boolean column to keep on the output frame.
+    cross_row: the result for a row depends on other rows (e.g. duplicates),
+    so incremental runs re-evaluate it over the full snapshot.
+    """
+    name: str
+    requires: Tuple[str, ...]
+    predicate: Callable[[pd.DataFrame, RuleContext], pd.Series]
+    column: Optional[str] = None
+    cross_row: bool = False
+
+
+RULES: List[LeakageRule] = []
+
+
+def register_rule(rule: LeakageRule) -> LeakageRule:
+    if any(r.name == rule.name for r in RULES):
+        raise ValueError(f"Rule already registered: {rule.name}")
+    if len(RULES) >= 64:
+        raise ValueError("At most 64 rules fit in the flag mask")
+    RULES.append(rule)
+    return rule
+
+
+def _contains_text(s: pd.Series, text: str) -> pd.Series:
+    """Case-insensitive substring test; categoricals are tested once per category."""
+    if isinstance(s.dtype, pd.CategoricalDtype):
+        hits = s.cat.categories.astype(str).str.contains(text, case=False, regex=False)
+        codes = s.cat.codes.to_numpy()
+        return pd.Series(np.where(codes >= 0, hits[codes], False), index=s.index)
+    return s.fillna("").str.contains(text, case=False, regex=False)
+
+
+# --- Built-in rules (registration order == flag_reason order) ---
+
+def _is_underbilled(df: pd.DataFrame, ctx: RuleContext) -> pd.Series:
+    # Flag only if meaningful leakage (avoid rounding noise)
+    # (both an absolute floor and a % floor)
+    pct_floor = 0.05
+    abs_floor = 5.0
+    flagged = df["underbilled_amount"] > (pct_floor * df[ctx.col("expected_total")]).fillna(0.0)
+    return flagged & (df["underbilled_amount"] > abs_floor)
+
+
+def _is_missing_fuel(df: pd.DataFrame, ctx: RuleContext) -> pd.Series:
+    # If expected fuel > $1 but actual fuel nearly zero, flag it.
+    return (df[ctx.col("expected_fuel")].fillna(0.0) > 1.0) & (df[ctx.col("actual_fuel")].fillna(0.0) <= 0.01)
+
+
+def _is_liftgate_dropped(df: pd.DataFrame, ctx: RuleContext) -> pd.Series:
+    wants_liftgate = _contains_text(df["accessorial_services"], "liftgate")
+    expected_acc = pd.to_numeric(df["expected_accessorials"], errors="coerce").fillna(0.0)
+    actual_acc = pd.to_numeric(df["actual_billed_accessorials"], errors="coerce").fillna(0.0)
+    return wants_liftgate & ((expected_acc - actual_acc) > 5.0)
+
+
+def _is_duplicate(df: pd.DataFrame, ctx: RuleContext) -> pd.Series:
+    id_col = ctx.col("id")
+    if ctx.duplicate_ids is None:
+        return df.duplicated(subset=[id_col], keep=False)
+    return df[id_col].isin(ctx.duplicate_ids)
+
+
+register_rule(LeakageRule("UNDERBILLED", ("underbilled_amount", "expected_total"), _is_underbilled, "is_underbilled"))
+register_rule(LeakageRule("MISSING_FUEL_SURCHARGE", ("expected_fuel", "actual_fuel"), _is_missing_fuel, "is_missing_fuel"))
+register_rule(
+    LeakageRule(
+        "LIFTGATE_NOT_CHARGED",
+        ("accessorial_services", "expected_accessorials", "actual_billed_accessorials"),
+        _is_liftgate_dropped,
+        "is_liftgate_dropped",
+    )
+)
+register_rule(LeakageRule("POSSIBLE_DUPLICATE", ("id",), _is_duplicate, "is_duplicate", cross_row=True))
+
+
+def _mask_dtype(n_rules: int):
+    for dtype in (np.uint8, np.uint16, np.uint32, np.uint64):
+        if n_rules <= np.iinfo(dtype).bits:
+            return dtype
+    raise ValueError("At most 64 rules fit in the flag mask")
+
+
+def evaluate_rules(
+    df: pd.DataFrame,
+    ctx: RuleContext,
+    rules: Optional[List[LeakageRule]] = None,
+    where: Optional[Callable[[LeakageRule], bool]] = None,
+) -> np.ndarray:
+    """
+    Run every rule and pack the results into one unsigned bit mask per row.
+
+    where: only evaluate rules it accepts; the others leave their bit at 0
+    and don't write their column. Bit positions never change.
+    """
+    rules = RULES if rules is None else rules
+    dtype = _mask_dtype(len(rules))
+    mask = np.zeros(len(df), dtype=dtype)
+    for bit, rule in enumerate(rules):
+        if where is not None and not where(rule):
+            continue
+        if all(ctx.col(c) in df.columns for c in rule.requires):
+            hit = np.asarray(rule.predicate(df, ctx), dtype=bool)
+        else:
+            hit = np.zeros(len(df), dtype=bool)
+        if rule.column is not None:
+            df[rule.column] = hit
+        mask |= hit.astype(dtype) << dtype(bit)
+    return mask
+
+
+def render_flag_reasons(mask: np.ndarray, rules: Optional[List[LeakageRule]] = None) -> Tuple[np.ndarray, List[str]]:
+    """
+    Decode bit masks to flag_reason text.
+
+    Returns (codes, texts) where texts[codes[i]] is row i's flag_reason. Text is
+    built once per distinct mask, so cost follows the combinations present, not
+    the row count or the number of rules.
+    """
+    rules = RULES if rules is None else rules
+    uniques, codes = np.unique(mask, return_inverse=True)
+    texts = [
+        "; ".join(rule.name for bit, rule in enumerate(rules) if (int(m) >> bit) & 1)
+        for m in uniques
+    ]
+    return codes.reshape(-1), texts
+
+
+def rule_mask_bits(where: Callable[[LeakageRule], bool], rules: Optional[List[LeakageRule]] = None) -> int:
+    """Mask with the bits of the rules ``where`` accepts."""
+    rules = RULES if rules is None else rules
+    return sum(1 << bit for bit, rule in enumerate(rules) if where(rule))
+
+
+def rule_context(df: pd.DataFrame, duplicate_ids: Optional[Set] = None) -> RuleContext:
+    """Resolve the column roles rules refer to against the columns ``df`` has."""
     expected_total_col = "expected_total" if "expected_total" in df.columns else "expected_billed_total"
     actual_total_col = "actual_total_billed" if "actual_total_billed" in df.columns else "actual_billed_total"
 
@@ -11,45 +169,59 @@ def apply_leakage_rules(df: pd.DataFrame) -> pd.DataFrame:
 
     id_col = "invoice_id" if "invoice_id" in df.columns else "shipment_id"
 
+    return RuleContext(
+        columns={
+            "expected_total": expected_total_col,
+            "actual_total": actual_total_col,
+            "expected_fuel": expected_fuel_col,
+            "actual_fuel": actual_fuel_col,
+            "id": id_col,
+        },
+        duplicate_ids=duplicate_ids,
+    )
+
+
+def apply_leakage_rules(
+    df: pd.DataFrame,
+    duplicate_ids: Optional[Set] = None,
+    copy: bool = True,
+    compact: bool = False,
+) -> pd.DataFrame:
+    """
+    Evaluate the registered leakage rules and build flag_mask / flag_reason.
+
+    duplicate_ids: ids known to repeat across the whole input (see
+    ingest.scan_duplicate_ids). When given, POSSIBLE_DUPLICATE is decided
+    against it instead of within ``df`` alone, so chunked runs stay correct.
+
+    compact: store flag_reason as a categorical over the flag combinations
+    present, so the text exists once per combination instead of once per row.
+    """
+    if copy:
+        df = df.copy()
+
+    ctx = rule_context(df, duplicate_ids)
+
     # Coerce numeric
-    for c in [expected_total_col, actual_total_col, expected_fuel_col, actual_fuel_col]:
+    for role in ["expected_total", "actual_total", "expected_fuel", "actual_fuel"]:
+        c = ctx.col(role)
         if c in df.columns:
             df[c] = pd.to_numeric(df[c], errors="coerce")
 
     # --- Core leakage calc ---
-    df["underbilled_amount"] = (df[expected_total_col] - df[actual_total_col]).fillna(0.0)
+    df["underbilled_amount"] = (df[ctx.col("expected_total")] - df[ctx.col("actual_total")]).fillna(0.0)
 
-    # Flag only if meaningful leakage (avoid rounding noise)
-    # (both an absolute floor and a % floor)
-    pct_floor = 0.05
-    abs_floor = 5.0
-    df["is_underbilled"] = df["underbilled_amount"] > (pct_floor * df[expected_total_col]).fillna(0.0)
-    df["is_underbilled"] &= df["underbilled_amount"] > abs_floor
+    df["flag_mask"] = evaluate_rules(df, ctx)
 
-    # --- Fuel surcharge missing ---
-    # If expected fuel > $1 but actual fuel nearly zero, flag it.
-    df["is_missing_fuel"] = False
-    if expected_fuel_col in df.columns and actual_fuel_col in df.columns:
-        df["is_missing_fuel"] = (df[expected_fuel_col].fillna(0.0) > 1.0) & (df[actual_fuel_col].fillna(0.0) <= 0.01)
-
-    df["is_liftgate_dropped"] = False
-    if "accessorial_services" in df.columns and "expected_accessorials" in df.columns and "actual_billed_accessorials" in df.columns:
-        wants_liftgate = df["accessorial_services"].fillna("").str.contains("liftgate", case=False, regex=False)
-        expected_acc = pd.to_numeric(df["expected_accessorials"], errors="coerce").fillna(0.0)
-        actual_acc = pd.to_numeric(df["actual_billed_accessorials"], errors="coerce").fillna(0.0)
-        df["is_liftgate_dropped"] = wants_liftgate & ((expected_acc - actual_acc) > 5.0)
-
-    # --- Duplicate id ---
-    df["is_duplicate"] = df.duplicated(subset=[id_col], keep=False)
-
-    # --- Build flag_reason (vectorized) ---
-    df["flag_reason"] = ""
-    df.loc[df["is_underbilled"], "flag_reason"] = "UNDERBILLED"
-    df.loc[df["is_missing_fuel"], "flag_reason"] = df["flag_reason"].where(df["flag_reason"] == "", df["flag_reason"] + "; ") + "MISSING_FUEL_SURCHARGE"
-    df.loc[df["is_liftgate_dropped"], "flag_reason"] = df["flag_reason"].where(df["flag_reason"] == "", df["flag_reason"] + "; ") + "LIFTGATE_NOT_CHARGED"
-    df.loc[df["is_duplicate"], "flag_reason"] = df["flag_reason"].where(df["flag_reason"] == "", df["flag_reason"] + "; ") + "POSSIBLE_DUPLICATE"
+    # --- Render flag_reason once per distinct mask ---
+    codes, texts = render_flag_reasons(df["flag_mask"].to_numpy())
+    if compact:
+        # keep "" as a category so fillna("") / comparisons work when every row is flagged
+        df["flag_reason"] = pd.Categorical.from_codes(codes, categories=texts if "" in texts else texts + [""])
+    else:
+        df["flag_reason"] = pd.Series(np.asarray(texts, dtype=object)[codes], index=df.index, dtype=str)
 
     # column for reporting
-    df["is_flagged"] = df["flag_reason"] != ""
+    df["is_flagged"] = df["flag_mask"].to_numpy() != 0
 
-    return df
\ No newline at end of file
+    return df
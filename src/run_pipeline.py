@@ -1,99 +1,710 @@
 import argparse
 import json
 import os
+from contextlib import ExitStack
+from dataclasses import dataclass
+from typing import FrozenSet, Optional, Sequence, Union
 
+import numpy as np
 import pandas as pd
 
-from src.ingest import load_invoice_data
+from src.incremental import ROW_HASH_VERSION, StateStore, plan_delta, row_hashes, row_keys
+from src.duplicates import DuplicateConfig, DuplicateIndex, DuplicateStats, format_stats, sort_pairs
+from src.anomaly import (
+    MIN_SEGMENT_ROWS,
+    SEGMENT_KEYS,
+    AnomalyModel,
+    SegmentedAnomalyModel,
+    SegmentScorePool,
+    fit_anomaly_model,
+    anomaly_available,
+    fit_segmented_anomaly_model,
+    has_anomaly_features,
+    load_anomaly_model,
+    save_anomaly_model,
+    score_anomalies,
+    score_segmented_anomalies,
+)
+from src.ingest import iter_invoice_chunks, load_invoice_data, scan_duplicate_ids
+from src.llm_explainer import DEFAULT_CACHE_DIR, ExplanationCache, LLMExplainer, build_rule_explanations
 from src.rate_engine import compute_expected_billing
-from src.rules_engine import apply_leakage_rules
-from src.reporting import summarize_leakage
-
-try:
-    from sklearn.ensemble import IsolationForest
-except Exception:
-    IsolationForest = None
-
-
-def _write_anomaly_report(df: pd.DataFrame, out_path: str, seed: int) -> bool:
-    if IsolationForest is None:
-        return False
-
-    df = df.copy()
-    num_cols = [
-        "distance_miles",
-        "weight_lb",
-        "base_linehaul_amount",
-        "fuel_surcharge_amount",
-        "actual_billed_total",
-    ]
-    for c in num_cols:
-        if c not in df.columns:
-            return False
-
-    X = df[num_cols].apply(pd.to_numeric, errors="coerce").fillna(0.0)
-    model = IsolationForest(n_estimators=200, contamination=0.05, random_state=seed)
-    pred = model.fit_predict(X)
-    scores = model.score_samples(X)
-
-    out = df.copy()
-    out["anomaly_flag"] = (pred == -1)
+from src.fuel_schedule import FuelSchedule, load_fuel_schedule
+from src.rate_index import RateIndex, load_rate_index
+from src.reconciliation import (
+    CarrierContracts,
+    empty_reconciliation_partials,
+    finalize_reconciliation_summary,
+    load_carrier_contracts,
+    merge_reconciliation_partials,
+    reconcile_shipments,
+    reconciliation_partials,
+)
+from src.sharding import process_shards
+from src.stage_metrics import StageRecorder
+from src.rules_engine import (
+    RULES,
+    apply_leakage_rules,
+    evaluate_rules,
+    render_flag_reasons,
+    rule_context,
+    rule_mask_bits,
+)
+from src.report_io import REPORT_FORMATS, ReportAppender, SortedReportWriter, report_path, write_report
+from src.reporting import (
+    empty_leakage_partials,
+    finalize_leakage_summary,
+    leakage_partials,
+    merge_leakage_partials,
+    save_leakage_partials,
+    write_leakage_rollups,
+)
+
+ANOMALY_REPORT_COLUMNS = ["shipment_id", "carrier", "actual_billed_total", "anomaly_flag", "anomaly_score"]
+
+# Outputs a run can be limited to (--stages). The rate engine and rules only
+# run when one of RULE_STAGES is selected; anomaly scores and near-duplicate
+# checks read ingested columns only.
+STAGES = ("rules", "summary", "explanations", "anomaly", "near_duplicates", "reconcile")
+RULE_STAGES = frozenset({"rules", "summary", "explanations", "reconcile"})
+
+
+@dataclass(frozen=True)
+class AnomalyOptions:
+    # saved model to score with; the model fitted on this run is saved here if missing
+    model_path: Optional[str] = None
+    # fit one forest per carrier / distance band instead of a single global one
+    segment_by: Optional[str] = None
+    workers: int = 1
+    min_segment_rows: int = MIN_SEGMENT_ROWS
+
+
+def _anomaly_model(
+    df: Optional[pd.DataFrame],
+    options: AnomalyOptions,
+    seed: int,
+) -> Optional[Union[AnomalyModel, SegmentedAnomalyModel]]:
+    """
+    Saved model at ``options.model_path`` if there is one. Otherwise fit on
+    ``df`` (when given) and, if a path was given, save it there for later runs.
+    """
+    if options.model_path and os.path.exists(options.model_path):
+        model = load_anomaly_model(options.model_path)
+        saved_by = getattr(model, "segment_by", None)
+        if options.segment_by and saved_by != options.segment_by:
+            raise ValueError(
+                f"Anomaly model {options.model_path} is segmented by {saved_by!r}, not {options.segment_by!r}"
+            )
+        return model
+    if df is None or df.empty or not anomaly_available() or not has_anomaly_features(df):
+        return None
+    if options.segment_by:
+        model = fit_segmented_anomaly_model(
+            df,
+            options.segment_by,
+            random_state=seed,
+            min_segment_rows=options.min_segment_rows,
+            workers=options.workers,
+        )
+    else:
+        model = fit_anomaly_model(df, random_state=seed)
+    if options.model_path:
+        save_anomaly_model(model, options.model_path)
+    return model
+
+
+def _anomaly_stage(
+    df: Optional[pd.DataFrame],
+    options: AnomalyOptions,
+    seed: int,
+    metrics: StageRecorder,
+) -> Optional[Union[AnomalyModel, SegmentedAnomalyModel]]:
+    """_anomaly_model timed as anomaly_load or anomaly_fit, whichever it does."""
+    saved = bool(options.model_path) and os.path.exists(options.model_path)
+    if df is None and not saved:
+        return None
+    name = "anomaly_load" if saved else "anomaly_fit"
+    with metrics.stage(name, rows_in=None if df is None else len(df)):
+        return _anomaly_model(df, options, seed)
+
+
+def _anomaly_rows(
+    df: pd.DataFrame,
+    model: Union[AnomalyModel, SegmentedAnomalyModel],
+    workers: int = 1,
+    pool: Optional[SegmentScorePool] = None,
+) -> pd.DataFrame:
+    cols = [c for c in ANOMALY_REPORT_COLUMNS[:3] if c in df.columns]
+    out = df[cols].copy()
+    if isinstance(model, SegmentedAnomalyModel):
+        flags, scores, segment = score_segmented_anomalies(model, df, workers=workers, pool=pool)
+        out["anomaly_segment"] = segment
+    else:
+        flags, scores = score_anomalies(model, df)
+    out["anomaly_flag"] = flags
     out["anomaly_score"] = scores
+    return out
+
+
+def _write_anomaly_report(rows: pd.DataFrame, out_path: str, fmt: str = "csv") -> None:
+    write_report(rows.sort_values("anomaly_score", ascending=True, kind="stable"), out_path, fmt)
+
 
-    cols = ["shipment_id", "carrier", "actual_billed_total", "anomaly_flag", "anomaly_score"]
-    cols = [c for c in cols if c in out.columns]
-    out.sort_values("anomaly_score", ascending=True)[cols].to_csv(out_path, index=False)
-    return True
+EXPLANATION_COLUMNS = ["shipment_id", "flag_reason", "underbilled_amount", "explanation", "model", "used_llm"]
+
+
+def _explanation_frame(df: pd.DataFrame, explainer: Optional[LLMExplainer]) -> pd.DataFrame:
+    """EXPLANATION_COLUMNS for each flagged row of ``df``, keeping its index."""
+    flagged = df[df["flag_reason"].fillna("") != ""]
+
+    base = build_rule_explanations(flagged)
+    explanation = base.to_numpy(dtype=object)
+    used_llm = np.zeros(len(flagged), dtype=bool)
+    if explainer is not None:
+        upgraded = np.asarray(explainer.explain_many(explanation.tolist()), dtype=object)
+        used_llm = np.asarray([u is not None for u in upgraded], dtype=bool)
+        explanation = np.where(used_llm, upgraded, explanation)
+
+    underbilled = pd.to_numeric(flagged["underbilled_amount"]).to_numpy(dtype=np.float64, na_value=np.nan)
+    return pd.DataFrame(
+        {
+            "shipment_id": flagged["shipment_id"].astype(str).str.strip(),
+            "flag_reason": flagged["flag_reason"].astype(str),
+            "underbilled_amount": underbilled,
+            "explanation": explanation,
+            "model": np.where(used_llm, explainer.model if explainer is not None else "", "rules"),
+            "used_llm": used_llm,
+        },
+        index=flagged.index,
+        columns=EXPLANATION_COLUMNS,
+    )
+
+
+def _write_jsonl(explanations: pd.DataFrame, f) -> None:
+    columns = [explanations[c].tolist() for c in EXPLANATION_COLUMNS]
+    for values in zip(*columns):
+        f.write(json.dumps(dict(zip(EXPLANATION_COLUMNS, values)), ensure_ascii=False) + "\n")
 
 
 def _write_explanations(
     df: pd.DataFrame,
     out_dir: str,
-    use_llm: bool,
-    llm_model: str,
+    explainer: Optional[LLMExplainer],
+    fmt: str = "csv",
+    metrics: Optional[StageRecorder] = None,
 ) -> None:
-    from src.llm_explainer import build_rule_explanation, llm_explain
-
-    api_key = os.getenv("OPENAI_API_KEY")
-    flagged = df[df["flag_reason"].fillna("") != ""].copy()
-
-    explanations = []
-    for _, row in flagged.iterrows():
-        shipment_id = str(row.get("shipment_id", "")).strip()
-        base = build_rule_explanation(row)
-
-        final_text = base
-        used_llm = False
-        used_model = "rules"
-
-        if use_llm:
-            upgraded = llm_explain(base, model=llm_model, api_key=api_key)
-            if upgraded:
-                final_text = upgraded
-                used_llm = True
-                used_model = llm_model
-
-        explanations.append(
-            {
-                "shipment_id": shipment_id,
-                "flag_reason": str(row.get("flag_reason", "")),
-                "underbilled_amount": float(row.get("underbilled_amount", 0.0) or 0.0),
-                "explanation": final_text,
-                "model": used_model,
-                "used_llm": used_llm,
-            }
+    metrics = metrics or StageRecorder()
+    with metrics.stage("explanations", rows_in=len(df)) as st:
+        explanations = _explanation_frame(df, explainer)
+        st.rows_out = len(explanations)
+
+    exp_table = report_path(out_dir, "explanations", fmt)
+    exp_jsonl = os.path.join(out_dir, "explanations.jsonl")
+
+    with metrics.stage("write_explanations", rows_in=len(explanations)):
+        write_report(explanations, exp_table, fmt)
+        with open(exp_jsonl, "w", encoding="utf-8") as f:
+            _write_jsonl(explanations, f)
+
+    print(f"Explanations written to: {exp_table} and {exp_jsonl}")
+
+
+def _near_duplicates(df: pd.DataFrame, index: DuplicateIndex, metrics: StageRecorder) -> pd.DataFrame:
+    """Check ``df`` against itself and the index, then add it to the index."""
+    with metrics.stage("near_duplicates", rows_in=len(df)) as st:
+        stats = DuplicateStats()
+        pairs = index.check(df, stats)
+        index.add(df)
+        st.rows_out = len(pairs)
+        st.counters.update(
+            batch_candidates=stats.batch_candidates,
+            history_candidates=stats.history_candidates,
+            candidate_pairs=stats.candidate_pairs,
         )
+    print(f"Near duplicates: {format_stats(stats)}")
+    return pairs
+
+
+def _write_near_duplicates(pairs: pd.DataFrame, out_dir: str, fmt: str, metrics: StageRecorder) -> None:
+    out_path = report_path(out_dir, "near_duplicate_report", fmt)
+    with metrics.stage("near_duplicate_report", rows_in=len(pairs)):
+        write_report(sort_pairs(pairs), out_path, fmt)
+    print(f"Near-duplicate report written to: {out_path}")
+
+
+def _reconcile(
+    df: pd.DataFrame,
+    contracts: CarrierContracts,
+    rate_tolerance_pct: float,
+    metrics: StageRecorder,
+):
+    """Flagged reconciliation rows of ``df`` and the partial totals over all of them."""
+    with metrics.stage("reconcile", rows_in=len(df)) as st:
+        rows = reconcile_shipments(df, contracts, rate_tolerance_pct)
+        partial = reconciliation_partials(rows)
+        flagged = rows[rows["flags"] != "OK"]
+        st.rows_out = len(flagged)
+    return flagged, partial
+
+
+def _write_reconciliation_summary(partials: dict, out_dir: str, metrics: StageRecorder) -> None:
+    summary_path = os.path.join(out_dir, "reconciliation_summary.json")
+    with metrics.stage("reconciliation_summary"):
+        summary = finalize_reconciliation_summary(partials)
+        with open(summary_path, "w", encoding="utf-8") as f:
+            json.dump(summary, f, indent=2)
+    print(
+        f"Contract reconciliation: {summary['flagged_shipments']} flagged ({summary['pct_flagged']}%), "
+        f"est. recoverable $: {summary['total_recoverable_usd']}, {summary['pct_matched']}% on a contract"
+    )
+    print(f"Reconciliation summary written to: {summary_path}")
+
+
+def _write_reconciliation(
+    df: pd.DataFrame,
+    contracts: CarrierContracts,
+    rate_tolerance_pct: float,
+    out_dir: str,
+    fmt: str,
+    metrics: StageRecorder,
+) -> None:
+    flagged, partials = _reconcile(df, contracts, rate_tolerance_pct, metrics)
+    out_path = report_path(out_dir, "reconciliation_report", fmt)
+    with metrics.stage("reconciliation_report", rows_in=len(flagged)):
+        write_report(flagged, out_path, fmt)
+    print(f"Reconciliation report written to: {out_path}")
+    _write_reconciliation_summary(partials, out_dir, metrics)
+
+
+def _write_summary(partials: dict, summary_metrics_path: str) -> dict:
+    """summary_metrics.json plus, next to it, leakage_rollups.json and the partials they came from."""
+    out_dir = os.path.dirname(summary_metrics_path)
+    summary = finalize_leakage_summary(partials)
+    with open(summary_metrics_path, "w", encoding="utf-8") as f:
+        json.dump(summary, f, indent=2)
+    write_leakage_rollups(partials, out_dir)
+    # merged across days by `python -m src.reporting rollup`
+    save_leakage_partials(partials, os.path.join(out_dir, "leakage_partials.json"))
+    return summary
+
 
-    exp_df = pd.DataFrame(explanations)
-    exp_csv = os.path.join(out_dir, "explanations.csv")
+def _print_summary(
+    summary: Optional[dict],
+    leakage_report_path: Optional[str],
+    summary_metrics_path: str,
+) -> None:
+    """Summary lines for whichever of the summary and leakage report this run wrote."""
+    if summary is not None:
+        print("=== PIPELINE SUMMARY ===")
+        print(f"Total shipments: {summary['total_shipments']}")
+        print(f"Flagged shipments: {summary['flagged_shipments']} ({summary['flag_rate_pct']}%)")
+        print(f"Est. leakage $: {summary['estimated_revenue_leakage_usd']}")
+    if leakage_report_path is not None:
+        print(f"Leakage report written to: {leakage_report_path}")
+    if summary is not None:
+        print(f"Summary metrics written to: {summary_metrics_path}")
+        print(f"Leakage rollups written to: {os.path.join(os.path.dirname(summary_metrics_path), 'leakage_rollups.json')}")
+
+
+def _run_pipeline_chunked(
+    data_path: str,
+    out_dir: str,
+    chunksize: int,
+    explainer: Optional[LLMExplainer],
+    fmt: str,
+    arrow_dtypes: bool,
+    compact: bool,
+    anomaly: AnomalyOptions = AnomalyOptions(),
+    metrics: Optional[StageRecorder] = None,
+    duplicate_index: Optional[DuplicateIndex] = None,
+    rate_index: Optional[RateIndex] = None,
+    fuel_schedule: Optional[FuelSchedule] = None,
+    stages: FrozenSet[str] = frozenset(STAGES),
+    contracts: Optional[CarrierContracts] = None,
+    rate_tolerance_pct: float = 2.0,
+) -> None:
+    """
+    Streaming run: ingest -> rate engine -> rules per chunk, appending reports as it goes.
+
+    Peak memory follows the chunk size plus the set of repeated ids used for
+    POSSIBLE_DUPLICATE. Fitting the anomaly model needs the whole dataset, so
+    the anomaly report is only written when a saved model exists at
+    ``anomaly.model_path``; chunks are then scored as they stream, spilled to
+    disk in sorted runs and merged into the report at the end. Near-duplicate
+    pairs are appended per chunk, so that report is sorted within each chunk.
+    """
+    leakage_report_path = report_path(out_dir, "leakage_report", fmt)
+    summary_metrics_path = os.path.join(out_dir, "summary_metrics.json")
+    exp_table = report_path(out_dir, "explanations", fmt)
     exp_jsonl = os.path.join(out_dir, "explanations.jsonl")
 
-    exp_df.to_csv(exp_csv, index=False)
-    with open(exp_jsonl, "w", encoding="utf-8") as f:
-        for r in explanations:
-            f.write(json.dumps(r, ensure_ascii=False) + "\n")
+    metrics = metrics or StageRecorder()
+    with metrics.stage("scan_duplicates"):
+        duplicate_ids = scan_duplicate_ids(data_path, chunksize)
+    anomaly_model = _anomaly_stage(None, anomaly, 0, metrics) if "anomaly" in stages else None
+
+    partials = empty_leakage_partials()
+    reconciliation = empty_reconciliation_partials()
+    score_pool = None
+    with ExitStack() as outputs:
+        if "rules" in stages:
+            leakage_out = outputs.enter_context(ReportAppender(leakage_report_path, fmt))
+        if contracts is not None:
+            reconciliation_path = report_path(out_dir, "reconciliation_report", fmt)
+            reconciliation_out = outputs.enter_context(ReportAppender(reconciliation_path, fmt))
+        if "explanations" in stages:
+            exp_out = outputs.enter_context(ReportAppender(exp_table, fmt))
+            jsonl_out = outputs.enter_context(open(exp_jsonl, "w", encoding="utf-8"))
+        if duplicate_index is not None:
+            near_duplicate_path = report_path(out_dir, "near_duplicate_report", fmt)
+            near_duplicate_out = outputs.enter_context(ReportAppender(near_duplicate_path, fmt))
+        if anomaly_model is not None:
+            anomaly_report_path = report_path(out_dir, "anomaly_report", fmt)
+            # the merge holds at most fan_in (16) blocks, about one chunk of rows
+            anomaly_out = outputs.enter_context(
+                SortedReportWriter(anomaly_report_path, fmt, by="anomaly_score", block_rows=max(1024, chunksize // 16))
+            )
+            if isinstance(anomaly_model, SegmentedAnomalyModel) and anomaly.workers > 1:
+                # one pool for the run: workers load the forests once, not once per chunk
+                score_pool = outputs.enter_context(SegmentScorePool(anomaly_model, anomaly.workers))
+        chunks = iter_invoice_chunks(data_path, chunksize, arrow_dtypes=arrow_dtypes, compact=compact)
+        while True:
+            with metrics.stage("ingest") as st:
+                chunk = next(chunks, None)
+                st.rows_out = 0 if chunk is None else len(chunk)
+            if chunk is None:
+                break
+
+            if stages & RULE_STAGES:
+                with metrics.stage("rate_engine", rows_in=len(chunk)) as st:
+                    chunk = compute_expected_billing(
+                        chunk, copy=False, rate_index=rate_index, fuel_schedule=fuel_schedule
+                    )
+                    st.rows_out = len(chunk)
+                with metrics.stage("rules", rows_in=len(chunk)) as st:
+                    chunk = apply_leakage_rules(chunk, duplicate_ids=duplicate_ids, copy=False, compact=compact)
+                    st.rows_out = int(chunk["is_flagged"].sum())
+
+            if "rules" in stages:
+                with metrics.stage("leakage_report", rows_in=len(chunk)) as st:
+                    cols = ["shipment_id", "flag_reason", "underbilled_amount"]
+                    cols = [c for c in cols if c in chunk.columns]
+                    flagged = chunk.loc[chunk["flag_reason"].fillna("") != "", cols]
+                    leakage_out.append(flagged)
+                    st.rows_out = len(flagged)
+
+            if "summary" in stages:
+                with metrics.stage("summary", rows_in=len(chunk)):
+                    partials = merge_leakage_partials(partials, leakage_partials(chunk))
+
+            if "explanations" in stages:
+                with metrics.stage("explanations", rows_in=len(chunk)) as st:
+                    explanations = _explanation_frame(chunk, explainer)
+                    st.rows_out = len(explanations)
+                with metrics.stage("write_explanations", rows_in=len(explanations)):
+                    exp_out.append(explanations)
+                    _write_jsonl(explanations, jsonl_out)
+
+            if anomaly_model is not None:
+                with metrics.stage("anomaly_score", rows_in=len(chunk)) as st:
+                    rows = _anomaly_rows(chunk, anomaly_model, anomaly.workers, score_pool)
+                    anomaly_out.append(rows)
+                    st.rows_out = int(rows["anomaly_flag"].sum())
+
+            if duplicate_index is not None:
+                # earlier chunks are in the index by now, so pairs across chunks are found too
+                pairs = _near_duplicates(chunk, duplicate_index, metrics)
+                with metrics.stage("near_duplicate_report", rows_in=len(pairs)):
+                    near_duplicate_out.append(sort_pairs(pairs))
+
+            if contracts is not None:
+                flagged, part = _reconcile(chunk, contracts, rate_tolerance_pct, metrics)
+                with metrics.stage("reconciliation_report", rows_in=len(flagged)):
+                    reconciliation_out.append(flagged)
+                reconciliation = merge_reconciliation_partials(reconciliation, part)
+
+        if anomaly_model is not None:
+            with metrics.stage("anomaly_report"):
+                anomaly_out.close()
+
+    summary = None
+    if "summary" in stages:
+        with metrics.stage("summary"):
+            summary = _write_summary(partials, summary_metrics_path)
+
+    if "explanations" in stages:
+        print(f"Explanations written to: {exp_table} and {exp_jsonl}")
+    if duplicate_index is not None:
+        print(f"Near-duplicate report written to: {near_duplicate_path}")
+    if contracts is not None:
+        print(f"Reconciliation report written to: {reconciliation_path}")
+        _write_reconciliation_summary(reconciliation, out_dir, metrics)
+    _print_summary(summary, leakage_report_path if "rules" in stages else None, summary_metrics_path)
+    if anomaly_model is not None:
+        print(f"Anomaly report written to: {anomaly_report_path}")
+    elif "anomaly" in stages:
+        print("Anomaly report skipped in chunked mode (no saved anomaly model).")
+
+
+def _merge_state(
+    df: pd.DataFrame,
+    keys: pd.Series,
+    hashes: np.ndarray,
+    reuse: np.ndarray,
+    prior: Optional[pd.DataFrame],
+    delta: pd.DataFrame,
+    delta_explained: pd.DataFrame,
+):
+    """Per-row state (reused rows from ``prior``, the rest from ``delta``) and the report frame built from it."""
+    state = pd.DataFrame({"row_key": keys, "row_hash": hashes}, index=df.index)
+    state[["underbilled_amount", "flag_mask", "explanation", "model", "used_llm"]] = None
+    if reuse.any():
+        reused = prior.loc[keys[reuse].to_numpy(), ["underbilled_amount", "flag_mask", "explanation", "model", "used_llm"]]
+        state.loc[reuse, reused.columns] = reused.to_numpy()
+    state.loc[~reuse, "underbilled_amount"] = delta["underbilled_amount"].to_numpy()
+    state.loc[~reuse, "flag_mask"] = delta["flag_mask"].to_numpy()
+    state.loc[delta_explained.index, ["explanation", "model", "used_llm"]] = (
+        delta_explained[["explanation", "model", "used_llm"]].to_numpy()
+    )
+    state["underbilled_amount"] = state["underbilled_amount"].astype("float64")
+    state["flag_mask"] = state["flag_mask"].astype("int64")
+    # nullable bool so SQLite stores it as an integer column, not mixed text
+    state["used_llm"] = state["used_llm"].astype("boolean")
+
+    codes, texts = render_flag_reasons(state["flag_mask"].to_numpy())
+    merged = pd.DataFrame(
+        {
+            "shipment_id": df["shipment_id"],
+            "customer_id": df["customer_id"],
+            "flag_reason": np.asarray(texts, dtype=object)[codes],
+            "underbilled_amount": state["underbilled_amount"],
+        }
+    )
+    # rollup dimensions, when the input has them
+    for col in ("carrier", "origin_zip", "destination_zip", "ship_date"):
+        if col in df.columns:
+            merged[col] = df[col]
+    return state, merged
+
+
+def _merged_explanations(merged: pd.DataFrame, state: pd.DataFrame, flagged: np.ndarray) -> pd.DataFrame:
+    return pd.DataFrame(
+        {
+            "shipment_id": merged.loc[flagged, "shipment_id"].astype(str).str.strip(),
+            "flag_reason": merged.loc[flagged, "flag_reason"].astype(str),
+            "underbilled_amount": merged.loc[flagged, "underbilled_amount"].fillna(0.0),
+            "explanation": state.loc[flagged, "explanation"],
+            "model": state.loc[flagged, "model"],
+            "used_llm": state.loc[flagged, "used_llm"].astype(bool),
+        },
+        columns=EXPLANATION_COLUMNS,
+    )
+
+
+def _run_pipeline_incremental(
+    data_path: str,
+    out_dir: str,
+    state_path: str,
+    explainer: Optional[LLMExplainer],
+    fmt: str,
+    arrow_dtypes: bool,
+    compact: bool,
+    seed: int = 42,
+    anomaly: AnomalyOptions = AnomalyOptions(),
+    metrics: Optional[StageRecorder] = None,
+    rate_index: Optional[RateIndex] = None,
+    fuel_schedule: Optional[FuelSchedule] = None,
+    stages: FrozenSet[str] = frozenset(STAGES),
+    contracts: Optional[CarrierContracts] = None,
+    rate_tolerance_pct: float = 2.0,
+) -> None:
+    """
+    Delta run against the state store at ``state_path``.
+
+    Rate engine, rules and explanations run only for new or changed rows, plus
+    rows whose cross-row rules flipped. Reports and the summary are rebuilt from
+    the merged per-row results, so they match a full run. Anomaly scores read
+    only ingested columns, so every row is scored with the saved model (or one
+    fitted on this snapshot). Contract reconciliation is vectorized and reads
+    billed columns, so it also covers every row, with underbilled_amount taken
+    from the merged results.
+
+    Explanations are kept in the state, so they always run; ``stages`` only
+    drops the leakage report, summary or anomaly report.
+    """
+    leakage_report_path = report_path(out_dir, "leakage_report", fmt)
+    summary_metrics_path = os.path.join(out_dir, "summary_metrics.json")
+
+    metrics = metrics or StageRecorder()
+    with metrics.stage("ingest") as st:
+        df = load_invoice_data(data_path, arrow_dtypes=arrow_dtypes, compact=compact)
+        st.rows_out = len(df)
+
+    with metrics.stage("plan_delta", rows_in=len(df)) as st:
+        keys = row_keys(df)
+        hashes = row_hashes(df)
+
+        settings = {
+            "row_hash": ROW_HASH_VERSION,
+            "rules": [r.name for r in RULES],
+            "explanations": explainer.model if explainer is not None else "rules",
+        }
+        # other contract rates or fuel prices make every stored result stale
+        if rate_index is not None:
+            settings["rates"] = rate_index.fingerprint
+        if fuel_schedule is not None:
+            settings["fuel"] = fuel_schedule.fingerprint
+        store = StateStore(state_path)
+        prior = store.load(settings)
+
+        # cross-row rules are re-evaluated over the whole snapshot every run
+        is_cross_row = lambda rule: rule.cross_row  # noqa: E731
+        ctx = rule_context(df)
+        cross_mask = evaluate_rules(df, ctx, where=is_cross_row)
+        reuse = plan_delta(keys, hashes, cross_mask, rule_mask_bits(is_cross_row), prior)
+
+        ids = df[ctx.col("id")]
+        duplicate_ids = set(ids[ids.duplicated(keep=False)].unique())
+        st.rows_out = int((~reuse).sum())
+
+    delta = df.loc[~reuse].copy()
+    with metrics.stage("rate_engine", rows_in=len(delta)) as st:
+        delta = compute_expected_billing(
+            delta, copy=False, rate_index=rate_index, fuel_schedule=fuel_schedule
+        )
+        st.rows_out = len(delta)
+    with metrics.stage("rules", rows_in=len(delta)) as st:
+        delta = apply_leakage_rules(delta, duplicate_ids=duplicate_ids, copy=False, compact=compact)
+        st.rows_out = int(delta["is_flagged"].sum())
+    with metrics.stage("explanations", rows_in=len(delta)) as st:
+        delta_explained = _explanation_frame(delta, explainer)
+        st.rows_out = len(delta_explained)
+
+    with metrics.stage("merge_state", rows_in=len(df)):
+        state, merged = _merge_state(df, keys, hashes, reuse, prior, delta, delta_explained)
+        flagged = state["flag_mask"].to_numpy() != 0
+
+    if "rules" in stages:
+        with metrics.stage("leakage_report", rows_in=len(merged)) as st:
+            write_report(
+                merged.loc[flagged, ["shipment_id", "flag_reason", "underbilled_amount"]], leakage_report_path, fmt
+            )
+            st.rows_out = int(flagged.sum())
+
+    summary = None
+    if "summary" in stages:
+        with metrics.stage("summary", rows_in=len(merged)):
+            summary = _write_summary(leakage_partials(merged), summary_metrics_path)
+
+    with metrics.stage("write_explanations", rows_in=int(flagged.sum())):
+        explanations = _merged_explanations(merged, state, flagged)
+        exp_table = report_path(out_dir, "explanations", fmt)
+        exp_jsonl = os.path.join(out_dir, "explanations.jsonl")
+        write_report(explanations, exp_table, fmt)
+        with open(exp_jsonl, "w", encoding="utf-8") as f:
+            _write_jsonl(explanations, f)
+
+    if contracts is not None:
+        reconciled = df.assign(underbilled_amount=merged["underbilled_amount"])
+        _write_reconciliation(reconciled, contracts, rate_tolerance_pct, out_dir, fmt, metrics)
+
+    anomaly_model = _anomaly_stage(df, anomaly, seed, metrics) if "anomaly" in stages else None
+    if anomaly_model is not None:
+        anomaly_report_path = report_path(out_dir, "anomaly_report", fmt)
+        with metrics.stage("anomaly_score", rows_in=len(df)) as st:
+            rows = _anomaly_rows(df, anomaly_model, anomaly.workers)
+            st.rows_out = int(rows["anomaly_flag"].sum())
+        with metrics.stage("anomaly_report", rows_in=len(rows)):
+            _write_anomaly_report(rows, anomaly_report_path, fmt)
+
+    with metrics.stage("save_state", rows_in=len(state)):
+        store.save(state, settings)
+
+    n_new = len(df) if prior is None else int((~keys.isin(prior.index)).sum())
+    print(f"Incremental: {int(reuse.sum())} reused, {len(df) - int(reuse.sum()) - n_new} reprocessed, {n_new} new")
+    print(f"Explanations written to: {exp_table} and {exp_jsonl}")
+    _print_summary(summary, leakage_report_path if "rules" in stages else None, summary_metrics_path)
+    if anomaly_model is not None:
+        print(f"Anomaly report written to: {anomaly_report_path}")
+
 
-    print(f"Explanations written to: {exp_csv} and {exp_jsonl}")
+def _run_pipeline_full(
+    data_path: str,
+    out_dir: str,
+    seed: int,
+    explainer: Optional[LLMExplainer],
+    fmt: str,
+    arrow_dtypes: bool,
+    compact: bool,
+    anomaly: AnomalyOptions,
+    metrics: StageRecorder,
+    workers: int = 1,
+    duplicate_index: Optional[DuplicateIndex] = None,
+    rate_index: Optional[RateIndex] = None,
+    fuel_schedule: Optional[FuelSchedule] = None,
+    stages: FrozenSet[str] = frozenset(STAGES),
+    contracts: Optional[CarrierContracts] = None,
+    rate_tolerance_pct: float = 2.0,
+) -> None:
+    partials = None
+    if workers > 1:
+        df, partials = process_shards(
+            data_path,
+            workers,
+            arrow_dtypes=arrow_dtypes,
+            compact=compact,
+            metrics=metrics,
+            rate_index=rate_index,
+            fuel_schedule=fuel_schedule,
+        )
+    else:
+        # the pipeline owns this frame, so later stages add columns in place
+        with metrics.stage("ingest") as st:
+            df = load_invoice_data(data_path, arrow_dtypes=arrow_dtypes, compact=compact)
+            st.rows_out = len(df)
+        if stages & RULE_STAGES:
+            with metrics.stage("rate_engine", rows_in=len(df)) as st:
+                df = compute_expected_billing(df, copy=False, rate_index=rate_index, fuel_schedule=fuel_schedule)
+                st.rows_out = len(df)
+            with metrics.stage("rules", rows_in=len(df)) as st:
+                df = apply_leakage_rules(df, copy=False, compact=compact)
+                st.rows_out = int(df["is_flagged"].sum())
+
+    leakage_report_path = report_path(out_dir, "leakage_report", fmt)
+    summary_metrics_path = os.path.join(out_dir, "summary_metrics.json")
+    anomaly_report_path = report_path(out_dir, "anomaly_report", fmt)
+
+    if "rules" in stages:
+        with metrics.stage("leakage_report", rows_in=len(df)) as st:
+            flagged = df[df["flag_reason"].fillna("") != ""]
+            cols = ["shipment_id", "flag_reason", "underbilled_amount"]
+            cols = [c for c in cols if c in flagged.columns]
+            write_report(flagged[cols], leakage_report_path, fmt)
+            st.rows_out = len(flagged)
+
+    summary = None
+    if "summary" in stages:
+        with metrics.stage("summary", rows_in=len(df)):
+            summary = _write_summary(leakage_partials(df) if partials is None else partials, summary_metrics_path)
+
+    anomaly_model = _anomaly_stage(df, anomaly, seed, metrics) if "anomaly" in stages else None
+    if anomaly_model is not None:
+        with metrics.stage("anomaly_score", rows_in=len(df)) as st:
+            rows = _anomaly_rows(df, anomaly_model, anomaly.workers)
+            st.rows_out = int(rows["anomaly_flag"].sum())
+        with metrics.stage("anomaly_report", rows_in=len(rows)):
+            _write_anomaly_report(rows, anomaly_report_path, fmt)
+    if "explanations" in stages:
+        _write_explanations(df, out_dir, explainer=explainer, fmt=fmt, metrics=metrics)
+    if duplicate_index is not None:
+        _write_near_duplicates(_near_duplicates(df, duplicate_index, metrics), out_dir, fmt, metrics)
+    if contracts is not None:
+        _write_reconciliation(df, contracts, rate_tolerance_pct, out_dir, fmt, metrics)
+
+    _print_summary(summary, leakage_report_path if "rules" in stages else None, summary_metrics_path)
+    if compact:
+        print(f"In-memory frame (compact): {df.memory_usage(deep=True).sum() / 2**20:.1f} MiB")
+    if anomaly_model is not None:
+        print(f"Anomaly report written to: {anomaly_report_path}")
 
 
 def run_pipeline(
@@ -102,37 +713,160 @@ def run_pipeline(
     seed: int,
     use_llm: bool = False,
     llm_model: str = "gpt-4o-mini",
+    chunksize: Optional[int] = None,
+    fmt: str = "csv",
+    arrow_dtypes: bool = False,
+    compact: bool = False,
+    state_path: Optional[str] = None,
+    llm_concurrency: int = 8,
+    llm_rpm: Optional[float] = None,
+    llm_cache_dir: Optional[str] = DEFAULT_CACHE_DIR,
+    anomaly_model_path: Optional[str] = None,
+    anomaly_segment_by: Optional[str] = None,
+    anomaly_workers: int = 1,
+    anomaly_min_segment_rows: int = MIN_SEGMENT_ROWS,
+    profile: bool = False,
+    workers: int = 1,
+    duplicate_index_path: Optional[str] = None,
+    duplicate_window_days: int = DuplicateConfig.window_days,
+    rate_index_path: Optional[str] = None,
+    fuel_prices_path: Optional[str] = None,
+    fuel_brackets_path: Optional[str] = None,
+    stages: Sequence[str] = STAGES,
+    contracts_path: Optional[str] = None,
+    rate_tolerance_pct: float = 2.0,
 ) -> None:
+    """
+    anomaly_model_path: saved anomaly model to score with (see src.anomaly).
+    If the file doesn't exist yet, the model fitted on this run is saved there.
+
+    anomaly_segment_by: "carrier" or "distance_band" to fit and score one
+    forest per segment, ``anomaly_workers`` processes at a time. Segments under
+    anomaly_min_segment_rows use the global forest.
+
+    Every run writes per-stage timings to pipeline_metrics.json in out_dir;
+    profile=True also dumps a cProfile per stage to out_dir/profile/.
+
+    workers: run ingest, rate engine and rules over that many shards of the
+    input in a process pool (see src.sharding). Not combinable with chunksize
+    or state_path.
+
+    duplicate_index_path: SQLite index of past rows (see src.duplicates). Each
+    run is checked for near-duplicates within itself and against the index,
+    written to near_duplicate_report, and then added to the index. Full and
+    chunked runs only.
+
+    rate_index_path: compiled contract rates (.npz) or a contract table (.csv)
+    to price with instead of the built-in tiers (see src.rate_index).
+
+    fuel_prices_path / fuel_brackets_path: dated diesel prices and the
+    price-to-percent brackets (see src.fuel_schedule). Given together, expected
+    fuel follows the price in effect on each ship_date.
+
+    contracts_path: carrier contracts by carrier and zip3 lane (see
+    src.reconciliation). Each shipment's billed linehaul, fuel and accessorials
+    are checked against its contract; reconciliation_report lists the
+    overages and recoverable_amount_est next to the rules' underbilled_amount.
+
+    stages: the outputs to produce, a subset of STAGES. Deselected stages are
+    not run, and the rate engine and rules are skipped when no selected stage
+    reads them. Sharded (workers) runs always apply the rules; incremental runs
+    always need explanations.
+    """
+    stages = frozenset(stages) if contracts_path else frozenset(stages) - {"reconcile"}
+    unknown = sorted(stages - set(STAGES))
+    if unknown:
+        raise ValueError(f"Unknown stages: {unknown}; expected some of {list(STAGES)}")
+    if state_path and "explanations" not in stages:
+        raise ValueError("Incremental runs (state_path) keep explanations in their state, so stages must include them")
+    if workers > 1 and (chunksize or state_path):
+        raise ValueError("workers can't be combined with chunksize or state_path")
+    if duplicate_index_path and state_path:
+        raise ValueError("duplicate_index_path can't be combined with state_path")
+    if bool(fuel_prices_path) != bool(fuel_brackets_path):
+        raise ValueError("fuel_prices_path and fuel_brackets_path must be given together")
     os.makedirs(out_dir, exist_ok=True)
+    metrics = StageRecorder(profile_dir=os.path.join(out_dir, "profile") if profile else None)
+    anomaly = AnomalyOptions(anomaly_model_path, anomaly_segment_by, anomaly_workers, anomaly_min_segment_rows)
+
+    rate_index = None
+    if rate_index_path:
+        with metrics.stage("rate_index_load"):
+            rate_index = load_rate_index(rate_index_path)
+    fuel_schedule = None
+    if fuel_prices_path:
+        with metrics.stage("fuel_schedule_load"):
+            fuel_schedule = load_fuel_schedule(fuel_prices_path, fuel_brackets_path)
+
+    contracts = None
+    if "reconcile" in stages:
+        with metrics.stage("contracts_load"):
+            contracts = load_carrier_contracts(contracts_path)
+
+    duplicate_index = None
+    if duplicate_index_path and "near_duplicates" in stages:
+        duplicate_index = DuplicateIndex(duplicate_index_path, DuplicateConfig(window_days=duplicate_window_days))
+
+    explainer = None
+    if use_llm and "explanations" in stages:
+        explainer = LLMExplainer(
+            llm_model,
+            cache=ExplanationCache(llm_cache_dir) if llm_cache_dir else None,
+            max_concurrency=llm_concurrency,
+            requests_per_minute=llm_rpm,
+        )
 
-    df = load_invoice_data(data_path)
-    df = compute_expected_billing(df)
-    df = apply_leakage_rules(df)
-
-    leakage_report_path = os.path.join(out_dir, "leakage_report.csv")
-    summary_metrics_path = os.path.join(out_dir, "summary_metrics.json")
-    anomaly_report_path = os.path.join(out_dir, "anomaly_report.csv")
-
-    flagged = df[df["flag_reason"].fillna("") != ""].copy()
-    cols = ["shipment_id", "flag_reason", "underbilled_amount"]
-    cols = [c for c in cols if c in flagged.columns]
-    flagged[cols].to_csv(leakage_report_path, index=False)
-
-    summary = summarize_leakage(df)
-    with open(summary_metrics_path, "w", encoding="utf-8") as f:
-        json.dump(summary, f, indent=2)
-
-    wrote_anomaly = _write_anomaly_report(df, anomaly_report_path, seed)
-    _write_explanations(df, out_dir, use_llm=use_llm, llm_model=llm_model)
+    if state_path:
+        if chunksize:
+            raise ValueError("Incremental runs (state_path) can't be combined with chunksize")
+        _run_pipeline_incremental(
+            data_path,
+            out_dir,
+            state_path,
+            explainer=explainer,
+            fmt=fmt,
+            arrow_dtypes=arrow_dtypes,
+            compact=compact,
+            seed=seed,
+            anomaly=anomaly,
+            metrics=metrics,
+            rate_index=rate_index,
+            fuel_schedule=fuel_schedule,
+            stages=stages,
+            contracts=contracts,
+            rate_tolerance_pct=rate_tolerance_pct,
+        )
+        mode = "incremental"
+    elif chunksize:
+        _run_pipeline_chunked(
+            data_path,
+            out_dir,
+            chunksize,
+            explainer=explainer,
+            fmt=fmt,
+            arrow_dtypes=arrow_dtypes,
+            compact=compact,
+            anomaly=anomaly,
+            metrics=metrics,
+            duplicate_index=duplicate_index,
+            rate_index=rate_index,
+            fuel_schedule=fuel_schedule,
+            stages=stages,
+            contracts=contracts,
+            rate_tolerance_pct=rate_tolerance_pct,
+        )
+        mode = "chunked"
+    else:
+        _run_pipeline_full(
+            data_path, out_dir, seed, explainer, fmt, arrow_dtypes, compact, anomaly, metrics, workers, duplicate_index,
+            rate_index, fuel_schedule, stages, contracts, rate_tolerance_pct,
+        )
+        mode = "full"
 
-    print("=== PIPELINE SUMMARY ===")
-    print(f"Total shipments: {summary['total_shipments']}")
-    print(f"Flagged shipments: {summary['flagged_shipments']} ({summary['flag_rate_pct']}%)")
-    print(f"Est. leakage $: {summary['estimated_revenue_leakage_usd']}")
-    print(f"Leakage report written to: {leakage_report_path}")
-    print(f"Summary metrics written to: {summary_metrics_path}")
-    if wrote_anomaly:
-        print(f"Anomaly report written to: {anomaly_report_path}")
+    metrics_path = metrics.write(
+        out_dir, mode=mode, data_path=data_path, workers=workers, stages=[s for s in STAGES if s in stages]
+    )
+    print(f"Pipeline metrics written to: {metrics_path}")
 
 
 def main() -> None:
@@ -142,9 +876,81 @@ def main() -> None:
     parser.add_argument("--seed", type=int, default=42)
     parser.add_argument("--llm", action="store_true")
     parser.add_argument("--llm-model", default="gpt-4o-mini")
+    parser.add_argument("--llm-concurrency", type=int, default=8,
+                        help="Max LLM requests in flight")
+    parser.add_argument("--llm-rpm", type=float, default=None,
+                        help="Cap on LLM requests started per minute")
+    parser.add_argument("--llm-cache", dest="llm_cache_dir", default=DEFAULT_CACHE_DIR,
+                        help="Directory of cached LLM explanations ('' disables the cache)")
+    parser.add_argument("--chunksize", type=int, default=None,
+                        help="Stream the input in chunks of this many rows")
+    parser.add_argument("--format", dest="fmt", choices=REPORT_FORMATS, default="csv",
+                        help="Output format for the leakage, anomaly and explanation reports")
+    parser.add_argument("--arrow-dtypes", action="store_true",
+                        help="Keep Arrow-backed dtypes when reading the input")
+    parser.add_argument("--state", dest="state_path", default=None,
+                        help="SQLite state file; only new or changed shipments are reprocessed")
+    parser.add_argument("--compact", action="store_true",
+                        help="Categorical strings, bit-mask flag_reason and downcast non-monetary numerics")
+    parser.add_argument("--anomaly-model", dest="anomaly_model_path", default=None,
+                        help="Score with this saved anomaly model; written from this run if it doesn't exist")
+    parser.add_argument("--anomaly-segment-by", choices=SEGMENT_KEYS, default=None,
+                        help="Fit one anomaly model per carrier or distance band")
+    parser.add_argument("--anomaly-workers", type=int, default=1,
+                        help="Processes used to fit/score anomaly segments")
+    parser.add_argument("--anomaly-min-segment-rows", type=int, default=MIN_SEGMENT_ROWS,
+                        help="Smaller segments are scored by the global anomaly model")
+    parser.add_argument("--profile", action="store_true",
+                        help="Write a cProfile dump per stage to <outdir>/profile/")
+    parser.add_argument("--workers", type=int, default=1,
+                        help="Processes for sharded ingest, rate engine and rules (full runs)")
+    parser.add_argument("--duplicate-index", dest="duplicate_index_path", default=None,
+                        help="SQLite index of past rows to check for near-duplicate re-bills (created if missing)")
+    parser.add_argument("--duplicate-window-days", type=int, default=DuplicateConfig.window_days,
+                        help="Ship dates at most this many days apart can be near-duplicates")
+    parser.add_argument("--rate-index", dest="rate_index_path", default=None,
+                        help="Price with contract rates: a compiled index (.npz) or a contract table (.csv)")
+    parser.add_argument("--fuel-prices", dest="fuel_prices_path", default=None,
+                        help="Dated diesel prices (effective_date, diesel_price); needs --fuel-brackets")
+    parser.add_argument("--fuel-brackets", dest="fuel_brackets_path", default=None,
+                        help="Fuel percent by diesel price bracket (price_upper_bound, fuel_pct)")
+    parser.add_argument("--carrier-contracts", dest="contracts_path", default=None,
+                        help="Reconcile billed amounts against carrier contracts (carrier, zip3 lane)")
+    parser.add_argument("--rate-tolerance-pct", type=float, default=2.0,
+                        help="Linehaul over contract by more than this percent is flagged RATE_OVER_CONTRACT")
+    parser.add_argument("--stages", nargs="+", choices=STAGES, default=list(STAGES),
+                        help="Outputs to produce, e.g. --stages rules summary (default: all)")
 
     args = parser.parse_args()
-    run_pipeline(args.data, args.outdir, args.seed, use_llm=args.llm, llm_model=args.llm_model)
+    run_pipeline(
+        args.data,
+        args.outdir,
+        args.seed,
+        use_llm=args.llm,
+        llm_model=args.llm_model,
+        chunksize=args.chunksize,
+        fmt=args.fmt,
+        arrow_dtypes=args.arrow_dtypes,
+        compact=args.compact,
+        state_path=args.state_path,
+        llm_concurrency=args.llm_concurrency,
+        llm_rpm=args.llm_rpm,
+        llm_cache_dir=args.llm_cache_dir,
+        anomaly_model_path=args.anomaly_model_path,
+        anomaly_segment_by=args.anomaly_segment_by,
+        anomaly_workers=args.anomaly_workers,
+        anomaly_min_segment_rows=args.anomaly_min_segment_rows,
+        profile=args.profile,
+        workers=args.workers,
+        duplicate_index_path=args.duplicate_index_path,
+        duplicate_window_days=args.duplicate_window_days,
+        rate_index_path=args.rate_index_path,
+        fuel_prices_path=args.fuel_prices_path,
+        fuel_brackets_path=args.fuel_brackets_path,
+        stages=args.stages,
+        contracts_path=args.contracts_path,
+        rate_tolerance_pct=args.rate_tolerance_pct,
+    )
 
 
 if __name__ == "__main__":
@@ -1,3 +1,5 @@
+import pandas as pd
+
 REQUIRED_COLUMNS = [
     "shipment_id",
     "customer_id",
@@ -18,3 +20,68 @@ OPTIONAL_COLUMNS = [
     "notes",
     "accessorials_applied"
 ]
+
+# Columns outside the core schema that later stages read when present
+# (rules engine, explanations, synthetic generator schema). Together with the
+# lists above they form the column projection for columnar inputs.
+PIPELINE_COLUMNS = [
+    "carrier",
+    "accessorial_services",
+    "expected_total",
+    "expected_accessorials",
+    "actual_billed_accessorials",
+    "actual_billed_fuel",
+    "actual_billed_linehaul",
+]
+
+# Typed schema (pipeline column names). The CSV reader maps these onto the
+# source header, so pandas parses straight to the final dtypes.
+COLUMN_DTYPES = {
+    "shipment_id": "str",
+    "customer_id": "str",
+    "carrier": "str",
+    "accessorial_services": "str",
+    "distance_miles": "float64",
+    "weight_lb": "float64",
+    "freight_class": "float64",
+    "liftgate_fee_charged": "float64",
+    "fuel_surcharge_amount": "float64",
+    "base_linehaul_amount": "float64",
+    "actual_billed_total": "float64",
+    "expected_total": "float64",
+    "expected_accessorials": "float64",
+    "actual_billed_accessorials": "float64",
+    "actual_billed_fuel": "float64",
+    "actual_billed_linehaul": "float64",
+}
+
+DATE_COLUMNS = ["ship_date"]
+DATE_FORMAT = "%Y-%m-%d"
+
+BOOLEAN_COLUMNS = ["liftgate_required"]
+BOOLEAN_TRUE_VALUES = ["true", "1", "yes", "y"]
+
+# Compact mode (opt-in): string columns stored as categoricals when their
+# cardinality is low, and non-monetary numerics downcast where lossless.
+COMPACT_CATEGORICAL_COLUMNS = [
+    "carrier",
+    "customer_id",
+    "origin_zip",
+    "destination_zip",
+    "accessorial_services",
+]
+COMPACT_MAX_UNIQUE_RATIO = 0.5
+
+NON_MONETARY_NUMERIC_COLUMNS = [
+    "distance_miles",
+    "weight_lb",
+    "freight_class",
+]
+
+
+def zip3(zips: pd.Series) -> pd.Series:
+    """Three-digit zip prefix of each value, as a string."""
+    if pd.api.types.is_numeric_dtype(zips):
+        # zips read as numbers lost their leading zeros (and may be float if any are missing)
+        zips = zips.astype("Int64")
+    return zips.astype(str).str.strip().str.zfill(5).str[:3]
@@ -0,0 +1,381 @@
+"""
+Local audit service: warm state behind a batch submission API on localhost.
+
+    PYTHONPATH=. python -m src.service --anomaly-model models/anomaly.joblib --rate-index models/rates.npz
+    curl -s --data-binary @today.csv -H 'Content-Type: text/csv' localhost:8765/audit
+
+Everything a pipeline run would load is loaded once at startup: the rate index,
+fuel schedule, saved anomaly model and (with --rates) the reconciliation
+contract rates and their lane index. Requests then only pay for their own rows.
+
+    POST /audit      invoice batch as CSV, Parquet or JSON lines (Content-Type,
+                     or ?format=csv|parquet|jsonl). Returns shipment_id,
+                     flag_reason, underbilled_amount and, with a model,
+                     anomaly_flag/anomaly_score per row.
+    POST /reconcile  billed invoices against the --rates contract table
+    GET  /health     what is loaded, plus request and batch counters
+
+Small submissions that arrive within --batch-window-ms of each other (and
+share a column layout) are audited in one pass of up to --max-batch-rows rows
+and split back per request. POSSIBLE_DUPLICATE stays per submission. With
+--workers N > 1 batches run in a pool of N processes, each holding its own copy
+of the warm state.
+"""
+import argparse
+import io
+import json
+import queue
+import threading
+import time
+from concurrent.futures import Future, ProcessPoolExecutor
+from dataclasses import dataclass
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import List, Optional
+from urllib.parse import parse_qs, urlparse
+
+import numpy as np
+import pandas as pd
+
+from src.anomaly import has_anomaly_features, load_anomaly_model, score_anomalies
+from src.fuel_schedule import load_fuel_schedule
+from src.ingest import INPUT_FORMATS, read_invoice_bytes
+from src.rate_engine import compute_expected_billing
+from src.rate_index import load_rate_index
+from src.reconciliation import build_lane_index, reconcile_invoices
+from src.rules_engine import apply_leakage_rules, rule_context
+
+CONTENT_TYPES = {
+    "text/csv": "csv",
+    "application/vnd.apache.parquet": "parquet",
+    "application/x-parquet": "parquet",
+    "application/x-ndjson": "jsonl",
+    "application/jsonl": "jsonl",
+    "application/json": "jsonl",
+}
+
+
+@dataclass(frozen=True)
+class ServiceConfig:
+    rate_index_path: Optional[str] = None
+    fuel_prices_path: Optional[str] = None
+    fuel_brackets_path: Optional[str] = None
+    # saved model only; the service never fits one
+    anomaly_model_path: Optional[str] = None
+    # reconciliation contract rates (data/rates_sample.csv layout) for /reconcile
+    rates_path: Optional[str] = None
+    batch_window_ms: float = 5.0
+    max_batch_rows: int = 50_000
+    workers: int = 1
+
+
+class AuditState:
+    """The warm part: pricing tables, anomaly model and lane index, loaded once."""
+
+    def __init__(self, config: ServiceConfig):
+        if bool(config.fuel_prices_path) != bool(config.fuel_brackets_path):
+            raise ValueError("fuel_prices_path and fuel_brackets_path must be given together")
+        self.rate_index = load_rate_index(config.rate_index_path) if config.rate_index_path else None
+        self.fuel_schedule = (
+            load_fuel_schedule(config.fuel_prices_path, config.fuel_brackets_path) if config.fuel_prices_path else None
+        )
+        self.anomaly_model = load_anomaly_model(config.anomaly_model_path) if config.anomaly_model_path else None
+        self.rates = pd.read_csv(config.rates_path) if config.rates_path else None
+        self.lane_index = build_lane_index(self.rates) if self.rates is not None else None
+
+    def loaded(self) -> dict:
+        return {
+            "rate_index": None if self.rate_index is None else self.rate_index.fingerprint,
+            "fuel_schedule": None if self.fuel_schedule is None else self.fuel_schedule.fingerprint,
+            "anomaly_model": self.anomaly_model is not None,
+            "contract_lanes": 0 if self.rates is None else len(self.rates),
+        }
+
+    def audit(self, frames: List[pd.DataFrame]) -> List[pd.DataFrame]:
+        """Audit normalized frames with the same columns in one pass; one result frame per input."""
+        df = pd.concat(frames, ignore_index=True)
+        id_col = rule_context(df).col("id")
+        ids = df[id_col]
+        # POSSIBLE_DUPLICATE is per submission, so key ids by submission while the rules run
+        submission = np.repeat(np.arange(len(frames)), [len(f) for f in frames])
+        keyed = pd.Series(submission).astype(str) + "\x1f" + ids.astype(str)
+        df[id_col] = keyed
+        duplicate_ids = set(keyed[keyed.duplicated(keep=False)])
+
+        df = compute_expected_billing(df, copy=False, rate_index=self.rate_index, fuel_schedule=self.fuel_schedule)
+        df = apply_leakage_rules(df, duplicate_ids=duplicate_ids, copy=False)
+        df[id_col] = ids
+
+        out = df[["shipment_id", "flag_reason", "underbilled_amount"]].copy()
+        if self.anomaly_model is not None and has_anomaly_features(df, self.anomaly_model.features):
+            out["anomaly_flag"], out["anomaly_score"] = score_anomalies(self.anomaly_model, df)
+        bounds = np.cumsum([0] + [len(f) for f in frames])
+        return [out.iloc[a:b].reset_index(drop=True) for a, b in zip(bounds, bounds[1:])]
+
+    def reconcile(self, invoices: pd.DataFrame):
+        if self.rates is None:
+            raise ValueError("No contract rates loaded; start the service with --rates")
+        return reconcile_invoices(invoices, self.rates, lane_index=self.lane_index)
+
+
+# set in each pool process by _init_worker
+_WORKER_STATE: Optional[AuditState] = None
+
+
+def _init_worker(config: ServiceConfig) -> None:
+    global _WORKER_STATE
+    _WORKER_STATE = AuditState(config)
+
+
+def _audit_in_worker(frames: List[pd.DataFrame]) -> List[pd.DataFrame]:
+    return _WORKER_STATE.audit(frames)
+
+
+def _layout(df: pd.DataFrame) -> tuple:
+    return tuple(zip(df.columns, map(str, df.dtypes)))
+
+
+class MicroBatcher:
+    """
+    Coalesces audit submissions: the first one waits up to ``window_s`` for
+    others with the same columns, up to ``max_rows`` rows in total.
+    """
+
+    def __init__(self, state: AuditState, config: ServiceConfig):
+        self.state = state
+        self.window_s = config.batch_window_ms / 1000.0
+        self.max_rows = config.max_batch_rows
+        self.pool = None
+        if config.workers > 1:
+            self.pool = ProcessPoolExecutor(config.workers, initializer=_init_worker, initargs=(config,))
+        self.counters = {"requests": 0, "rows": 0, "batches": 0}
+        self._lock = threading.Lock()
+        self._queue: "queue.Queue" = queue.Queue()
+        self._held = None  # a submission that didn't fit the last batch
+        self._thread = threading.Thread(target=self._dispatch, name="audit-batcher", daemon=True)
+        self._thread.start()
+
+    def submit(self, df: pd.DataFrame) -> pd.DataFrame:
+        """Audit one normalized frame; blocks until its batch is done."""
+        future: Future = Future()
+        self._queue.put((df, future))
+        return future.result()
+
+    def stats(self) -> dict:
+        with self._lock:
+            return dict(self.counters)
+
+    def close(self) -> None:
+        self._queue.put(None)
+        self._thread.join()
+        if self.pool is not None:
+            self.pool.shutdown()
+
+    def _next(self, timeout: Optional[float]):
+        if self._held is not None:
+            item, self._held = self._held, None
+            return item
+        return self._queue.get(timeout=timeout) if timeout is None or timeout > 0 else self._queue.get_nowait()
+
+    def _collect(self, first) -> list:
+        batch, rows = [first], len(first[0])
+        layout = _layout(first[0])
+        deadline = time.perf_counter() + self.window_s
+        while rows < self.max_rows:
+            try:
+                item = self._next(deadline - time.perf_counter())
+            except queue.Empty:
+                break
+            if item is None:
+                self._queue.put(None)
+                break
+            if _layout(item[0]) != layout or rows + len(item[0]) > self.max_rows:
+                self._held = item
+                break
+            batch.append(item)
+            rows += len(item[0])
+        return batch
+
+    def _dispatch(self) -> None:
+        while True:
+            first = self._next(None)
+            if first is None:
+                return
+            batch = self._collect(first)
+            frames = [df for df, _ in batch]
+            with self._lock:
+                self.counters["requests"] += len(batch)
+                self.counters["rows"] += sum(len(f) for f in frames)
+                self.counters["batches"] += 1
+            if self.pool is None:
+                self._finish(batch, lambda: self.state.audit(frames))
+            else:
+                done = self.pool.submit(_audit_in_worker, frames)
+                done.add_done_callback(lambda f, batch=batch: self._finish(batch, f.result))
+
+    @staticmethod
+    def _finish(batch: list, results) -> None:
+        try:
+            outs = results()
+        except Exception as exc:  # every request in the batch gets the error
+            for _, future in batch:
+                future.set_exception(exc)
+            return
+        for (_, future), out in zip(batch, outs):
+            future.set_result(out)
+
+
+def _records(df: pd.DataFrame) -> list:
+    return json.loads(df.to_json(orient="records", date_format="iso"))
+
+
+class AuditService:
+    def __init__(self, config: ServiceConfig):
+        self.config = config
+        self.started = time.time()
+        self.state = AuditState(config)
+        self.batcher = MicroBatcher(self.state, config)
+
+    def audit(self, body: bytes, fmt: str) -> dict:
+        start = time.perf_counter()
+        out = self.batcher.submit(read_invoice_bytes(body, fmt))
+        flagged = out["flag_reason"].fillna("") != ""
+        return {
+            "rows": len(out),
+            "flagged": int(flagged.sum()),
+            "underbilled_total": round(float(out.loc[flagged, "underbilled_amount"].sum()), 2),
+            "elapsed_ms": round((time.perf_counter() - start) * 1000, 3),
+            "results": _records(out),
+        }
+
+    def reconcile(self, body: bytes, fmt: str) -> dict:
+        if fmt == "csv":
+            invoices = pd.read_csv(io.BytesIO(body))
+        elif fmt == "parquet":
+            invoices = pd.read_parquet(io.BytesIO(body))
+        else:
+            invoices = pd.read_json(io.BytesIO(body), lines=True, dtype=False, convert_dates=False)
+        result, summary = self.state.reconcile(invoices)
+        return {"summary": summary, "results": _records(result)}
+
+    def health(self) -> dict:
+        return {
+            "status": "ok",
+            "uptime_s": round(time.time() - self.started, 3),
+            "workers": self.config.workers,
+            "loaded": self.state.loaded(),
+            **self.batcher.stats(),
+        }
+
+    def close(self) -> None:
+        self.batcher.close()
+
+
+def _request_format(handler: BaseHTTPRequestHandler, query: dict) -> str:
+    if "format" in query:
+        fmt = query["format"][0]
+    else:
+        content_type = (handler.headers.get("Content-Type") or "text/csv").split(";")[0].strip().lower()
+        fmt = CONTENT_TYPES.get(content_type)
+        if fmt is None:
+            raise ValueError(f"Unsupported Content-Type {content_type!r}; pass ?format= one of {INPUT_FORMATS}")
+    if fmt not in INPUT_FORMATS:
+        raise ValueError(f"Unknown format {fmt!r}; expected one of {INPUT_FORMATS}")
+    return fmt
+
+
+class _Handler(BaseHTTPRequestHandler):
+    server_version = "invoice-audit/1"
+    service: AuditService = None
+    quiet = False
+
+    def _reply(self, status: int, payload: dict) -> None:
+        body = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self) -> None:
+        if urlparse(self.path).path == "/health":
+            self._reply(200, self.service.health())
+        else:
+            self._reply(404, {"error": f"no route for GET {self.path}"})
+
+    def do_POST(self) -> None:
+        url = urlparse(self.path)
+        routes = {"/audit": self.service.audit, "/reconcile": self.service.reconcile}
+        if url.path not in routes:
+            self._reply(404, {"error": f"no route for POST {url.path}"})
+            return
+        try:
+            fmt = _request_format(self, parse_qs(url.query))
+            body = self.rfile.read(int(self.headers.get("Content-Length") or 0))
+            if not body:
+                raise ValueError("Empty request body")
+            self._reply(200, routes[url.path](body, fmt))
+        except ValueError as exc:
+            self._reply(400, {"error": str(exc)})
+        except KeyError as exc:
+            self._reply(400, {"error": f"Missing column {exc}"})
+        except Exception as exc:  # a bug, not a bad request; still answer in JSON
+            self.log_error("%s failed: %r", url.path, exc)
+            self._reply(500, {"error": f"Internal error: {type(exc).__name__}: {exc}"})
+
+    def log_message(self, fmt: str, *args) -> None:
+        if not self.quiet:
+            super().log_message(fmt, *args)
+
+
+def make_server(config: ServiceConfig, host: str = "127.0.0.1", port: int = 8765, quiet: bool = False):
+    """(HTTP server, service); call serve_forever() on the server, then service.close()."""
+    service = AuditService(config)
+    handler = type("AuditHandler", (_Handler,), {"service": service, "quiet": quiet})
+    return ThreadingHTTPServer((host, port), handler), service
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Serve invoice audits from warm state on localhost")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--rate-index", dest="rate_index_path", default=None,
+                        help="Compiled contract rates (.npz) or a contract table (.csv)")
+    parser.add_argument("--fuel-prices", dest="fuel_prices_path", default=None)
+    parser.add_argument("--fuel-brackets", dest="fuel_brackets_path", default=None)
+    parser.add_argument("--anomaly-model", dest="anomaly_model_path", default=None,
+                        help="Saved anomaly model (python -m src.anomaly fit) to score with")
+    parser.add_argument("--rates", dest="rates_path", default=None,
+                        help="Contract rates for /reconcile; their lane index is built at startup")
+    parser.add_argument("--batch-window-ms", type=float, default=ServiceConfig.batch_window_ms,
+                        help="How long a submission waits for others to share its audit pass")
+    parser.add_argument("--max-batch-rows", type=int, default=ServiceConfig.max_batch_rows)
+    parser.add_argument("--workers", type=int, default=ServiceConfig.workers,
+                        help="Processes auditing batches (1 audits in the service process)")
+    parser.add_argument("--quiet", action="store_true", help="Don't log each request")
+    args = parser.parse_args()
+
+    config = ServiceConfig(
+        rate_index_path=args.rate_index_path,
+        fuel_prices_path=args.fuel_prices_path,
+        fuel_brackets_path=args.fuel_brackets_path,
+        anomaly_model_path=args.anomaly_model_path,
+        rates_path=args.rates_path,
+        batch_window_ms=args.batch_window_ms,
+        max_batch_rows=args.max_batch_rows,
+        workers=args.workers,
+    )
+    start = time.perf_counter()
+    server, service = make_server(config, args.host, args.port, quiet=args.quiet)
+    print(f"Warm state loaded in {time.perf_counter() - start:.2f}s: {service.state.loaded()}")
+    print(f"Serving audits on http://{args.host}:{server.server_address[1]} (Ctrl-C to stop)")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        service.close()
+
+
+if __name__ == "__main__":
+    main()
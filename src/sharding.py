@@ -0,0 +1,119 @@
+"""
+Multi-process ingest -> rate engine -> rules over shards of one input file.
+
+Workers and the parent exchange frames through Arrow IPC files in a scratch
+directory; readers memory-map them rather than receiving pickled frames. The
+run has two phases so cross-shard rules stay global: after ingest and the
+rate engine, the parent collects the id column of every shard and works out
+which ids repeat anywhere in the input, then the rules phase flags
+POSSIBLE_DUPLICATE against that set. Each rules worker also returns its
+leakage_partials, which merge into the same summary and rollups
+as leakage_partials over the whole frame.
+"""
+import os
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+from typing import List, Optional, Set, Tuple
+
+import pandas as pd
+
+from src.ingest import InvoiceShard, load_invoice_shard, plan_invoice_shards
+from src.rate_engine import compute_expected_billing
+from src.fuel_schedule import FuelSchedule
+from src.rate_index import RateIndex
+from src.reporting import leakage_partials, merge_leakage_partials
+from src.rules_engine import apply_leakage_rules, rule_context
+from src.stage_metrics import StageRecorder
+
+
+def write_frame(df: pd.DataFrame, path: str) -> None:
+    import pyarrow as pa
+
+    table = pa.Table.from_pandas(df, preserve_index=False)
+    with pa.OSFile(path, "wb") as sink, pa.ipc.new_file(sink, table.schema) as writer:
+        writer.write_table(table)
+
+
+def read_frame(path: str, columns: Optional[List[str]] = None) -> pd.DataFrame:
+    import pyarrow as pa
+
+    with pa.memory_map(path) as source:
+        table = pa.ipc.open_file(source).read_all()
+        if columns is not None:
+            table = table.select(columns)
+        return table.to_pandas()
+
+
+def _ingest_shard(
+    data_path: str,
+    shard: InvoiceShard,
+    out_path: str,
+    arrow_dtypes: bool,
+    compact: bool,
+    rate_index: Optional[RateIndex] = None,
+    fuel_schedule: Optional[FuelSchedule] = None,
+) -> Tuple[str, int]:
+    """Write the shard after the rate engine; return the column duplicates are keyed on and the row count."""
+    df = load_invoice_shard(data_path, shard, arrow_dtypes=arrow_dtypes, compact=compact)
+    df = compute_expected_billing(df, copy=False, rate_index=rate_index, fuel_schedule=fuel_schedule)
+    write_frame(df, out_path)
+    return rule_context(df).col("id"), len(df)
+
+
+def _rules_shard(in_path: str, out_path: str, duplicate_ids: Set, compact: bool) -> dict:
+    # a new file: the frame read from in_path may still be backed by its mapping
+    df = apply_leakage_rules(read_frame(in_path), duplicate_ids=duplicate_ids, copy=False, compact=compact)
+    write_frame(df, out_path)
+    return leakage_partials(df)
+
+
+def _duplicate_ids(paths: List[str], id_col: str) -> Set:
+    ids = pd.concat([read_frame(p, [id_col])[id_col] for p in paths], ignore_index=True)
+    return set(ids[ids.duplicated(keep=False)].unique())
+
+
+def process_shards(
+    data_path: str,
+    workers: int,
+    arrow_dtypes: bool = False,
+    compact: bool = False,
+    metrics: Optional[StageRecorder] = None,
+    rate_index: Optional[RateIndex] = None,
+    fuel_schedule: Optional[FuelSchedule] = None,
+) -> Tuple[pd.DataFrame, dict]:
+    """
+    Rule output for the whole input, in input order, plus its merged
+    leakage_partials. Equivalent to load_invoice_data -> compute_expected_billing
+    -> apply_leakage_rules in one process.
+    """
+    metrics = metrics or StageRecorder()
+    shards = plan_invoice_shards(data_path, workers)
+    with tempfile.TemporaryDirectory(prefix="shards-") as scratch, \
+            ProcessPoolExecutor(max_workers=min(workers, len(shards))) as pool:
+        paths = [os.path.join(scratch, f"shard-{s.index}.arrow") for s in shards]
+        rule_paths = [os.path.join(scratch, f"shard-{s.index}-rules.arrow") for s in shards]
+
+        with metrics.stage("shard_ingest_rate_engine") as st:
+            ingested = list(pool.map(
+                _ingest_shard,
+                [data_path] * len(shards), shards, paths,
+                [arrow_dtypes] * len(shards), [compact] * len(shards),
+                [rate_index] * len(shards), [fuel_schedule] * len(shards),
+            ))
+            rows = sum(n for _, n in ingested)
+            st.rows_out = rows
+        with metrics.stage("shard_duplicates", rows_in=rows):
+            duplicate_ids = _duplicate_ids(paths, ingested[0][0])
+        with metrics.stage("shard_rules", rows_in=rows) as st:
+            parts = list(pool.map(
+                _rules_shard, paths, rule_paths, [duplicate_ids] * len(paths), [compact] * len(paths)
+            ))
+            st.rows_out = sum(p["flagged_shipments"] for p in parts)
+        with metrics.stage("shard_merge", rows_in=rows) as st:
+            df = pd.concat([read_frame(p) for p in rule_paths], ignore_index=True)
+            st.rows_out = len(df)
+
+    partials = parts[0]
+    for part in parts[1:]:
+        partials = merge_leakage_partials(partials, part)
+    return df, partials
@@ -0,0 +1,197 @@
+"""
+String similarity for accessorial descriptions and lanes, cached and pruned.
+
+Scores are difflib.SequenceMatcher ratios of lowercased strings, the measure
+reconciliation has always used, so flags and confidence scores don't move.
+Three things make them cheap at volume:
+
+- ratio() keeps scores per lowercased pair in a bounded LRU. Invoices repeat
+  the same few descriptions, so most calls never reach SequenceMatcher.
+- StringIndex finds the best match for a string among many candidates. It
+  computes difflib's quick_ratio upper bound for every candidate at once from
+  a character count matrix and runs SequenceMatcher only while a candidate can
+  still beat the best score so far. The result equals a full scan.
+- AccessorialCodebook maps descriptions to canonical accessorial codes. A
+  precomputed dictionary of known spellings answers most lookups; spellings
+  it hasn't seen go to a StringIndex over those spellings, once each.
+"""
+import re
+from difflib import SequenceMatcher
+from functools import lru_cache
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+import pandas as pd
+
+PAIR_CACHE_SIZE = 65536
+
+# a description this close to a known spelling gets its code; the same bar
+# reconciliation uses for UNRECOGNIZED_ACCESSORIAL_DESC
+MIN_CODE_SCORE = 0.75
+
+ACCESSORIAL_ALIASES: Dict[str, List[str]] = {
+    "LIFTGATE": [
+        "liftgate", "lift gate", "lift gate service", "liftgate service", "liftgate delivery",
+        "liftgate pickup", "tailgate", "tail gate",
+    ],
+    "RESIDENTIAL": ["residential", "residential delivery", "residential pickup", "residential service"],
+    "INSIDE_DELIVERY": ["inside delivery", "inside pickup", "inside service"],
+    "APPOINTMENT": ["appointment", "appointment delivery", "delivery appointment", "scheduled appointment"],
+    "LIMITED_ACCESS": ["limited access", "limited access delivery", "limited access pickup"],
+    "NOTIFY_PRIOR": ["notification prior", "prior notification", "notify before delivery", "call before delivery"],
+    "HAZMAT": ["hazmat", "hazmat handling", "hazmat fee", "hazardous materials"],
+    "DETENTION": ["detention", "driver detention", "detention time"],
+}
+
+# word-level shorthand seen on invoices, expanded before lookup
+ABBREVIATIONS = {
+    "svc": "service",
+    "serv": "service",
+    "del": "delivery",
+    "dlvry": "delivery",
+    "appt": "appointment",
+    "res": "residential",
+    "resi": "residential",
+    "haz": "hazmat",
+    "ltd": "limited",
+    "lg": "liftgate",
+    "notif": "notification",
+}
+
+_NON_ALNUM = re.compile(r"[^0-9a-z]+")
+
+
+@lru_cache(maxsize=PAIR_CACHE_SIZE)
+def _pair_ratio(a: str, b: str) -> float:
+    return SequenceMatcher(None, a, b).ratio()
+
+
+def ratio(a, b) -> float:
+    """SequenceMatcher ratio of the lowercased strings (0.0 if either is missing), cached per pair."""
+    if pd.isna(a) or pd.isna(b):
+        return 0.0
+    return _pair_ratio(str(a).lower(), str(b).lower())
+
+
+def pair_cache_info():
+    """functools cache_info() of the pair LRU: hits, misses, maxsize, currsize."""
+    return _pair_ratio.cache_info()
+
+
+def clear_pair_cache() -> None:
+    _pair_ratio.cache_clear()
+
+
+def description_key(text) -> str:
+    """Lowercase words of ``text`` with punctuation dropped and ABBREVIATIONS expanded."""
+    if pd.isna(text):
+        return ""
+    words = _NON_ALNUM.sub(" ", str(text).lower()).split()
+    return " ".join(ABBREVIATIONS.get(w, w) for w in words)
+
+
+class StringIndex:
+    """
+    Best SequenceMatcher match for a query among fixed candidate strings.
+
+    Candidates are compared as given (callers lowercase them). Ties go to the
+    first candidate; candidates marked invalid never match. With
+    max_candidates, at most that many exact ratios are computed per query.
+    """
+
+    def __init__(
+        self,
+        candidates: Sequence[str],
+        valid: Optional[np.ndarray] = None,
+        max_candidates: Optional[int] = None,
+    ):
+        self.candidates = list(candidates)
+        self.valid = np.ones(len(self.candidates), dtype=bool) if valid is None else np.asarray(valid, dtype=bool)
+        self.max_candidates = max_candidates
+
+        alphabet = sorted({ch for s in self.candidates for ch in s})
+        self._char_pos = {ch: i for i, ch in enumerate(alphabet)}
+        self._char_counts = np.zeros((len(self.candidates), max(len(alphabet), 1)), dtype=np.int32)
+        for pos, s in enumerate(self.candidates):
+            for ch in s:
+                self._char_counts[pos, self._char_pos[ch]] += 1
+        self._lengths = np.array([len(s) for s in self.candidates], dtype=np.int64)
+
+    def upper_bounds(self, query: str) -> np.ndarray:
+        """difflib quick_ratio of ``query`` against every candidate, a bound on its ratio."""
+        counts = np.zeros(self._char_counts.shape[1], dtype=np.int32)
+        for ch in query:
+            i = self._char_pos.get(ch)
+            if i is not None:
+                counts[i] += 1
+        overlap = np.minimum(self._char_counts, counts).sum(axis=1)
+        total = self._lengths + len(query)
+        upper = np.where(total > 0, 2.0 * overlap / np.maximum(total, 1), 1.0)
+        upper[~self.valid] = 0.0
+        return upper
+
+    def best(self, query: str) -> Tuple[int, float]:
+        """(candidate position, ratio) of the best match; (0, 0.0) if nothing matches at all."""
+        upper = self.upper_bounds(query)
+        best_pos, best_score = 0, 0.0
+        order = np.lexsort((np.arange(len(upper)), -upper))
+        for n_checked, pos in enumerate(order):
+            if upper[pos] < best_score or upper[pos] == 0.0:
+                break
+            if self.max_candidates is not None and n_checked >= self.max_candidates:
+                break
+            score = SequenceMatcher(None, query, self.candidates[pos]).ratio()
+            if score > best_score or (score == best_score and pos < best_pos):
+                best_pos, best_score = int(pos), score
+        return best_pos, float(best_score)
+
+
+class AccessorialCodebook:
+    """
+    Canonical accessorial code per description.
+
+    Keys (description_key of every alias) resolve through a dict. Other
+    descriptions take the code of the closest alias key when its ratio is at
+    least ``min_score``, else None. Those searches are kept in a bounded LRU.
+    """
+
+    def __init__(
+        self,
+        aliases: Dict[str, List[str]] = ACCESSORIAL_ALIASES,
+        min_score: float = MIN_CODE_SCORE,
+        cache_size: int = PAIR_CACHE_SIZE,
+    ):
+        self.min_score = min_score
+        self._exact: Dict[str, str] = {}
+        for code, spellings in aliases.items():
+            for spelling in [code] + list(spellings):
+                self._exact.setdefault(description_key(spelling), code)
+        self._keys = list(self._exact)
+        self._codes = [self._exact[k] for k in self._keys]
+        self._index = StringIndex(self._keys)
+        self._search = lru_cache(maxsize=cache_size)(self._nearest)
+
+    def _nearest(self, key: str) -> Optional[str]:
+        pos, score = self._index.best(key)
+        return self._codes[pos] if score >= self.min_score else None
+
+    def code(self, text) -> Optional[str]:
+        key = description_key(text)
+        if not key:
+            return None
+        hit = self._exact.get(key)
+        return hit if hit is not None else self._search(key)
+
+    def codes(self, values) -> np.ndarray:
+        """code for each value, looking up each distinct value once."""
+        codes, uniques = pd.factorize(pd.Series(values, dtype=object))
+        found = np.array([self.code(u) for u in uniques] + [None], dtype=object)
+        return found[codes]
+
+    def cache_info(self):
+        return self._search.cache_info()
+
+
+@lru_cache(maxsize=1)
+def default_codebook() -> AccessorialCodebook:
+    return AccessorialCodebook()
@@ -0,0 +1,132 @@
+"""
+Per-stage instrumentation for pipeline runs.
+
+Each stage records wall time, CPU time (this process plus reaped worker
+processes), rows in/out and how much it raised the process's peak RSS. A stage
+entered more than once, e.g. per chunk, accumulates into one record. With a
+profile directory, every stage also gets a cProfile dump (<stage>.pstats).
+"""
+import cProfile
+import json
+import os
+import sys
+import time
+from contextlib import contextmanager
+from dataclasses import asdict, dataclass
+from typing import Dict, Iterator, Optional
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+METRICS_FILENAME = "pipeline_metrics.json"
+
+
+def _peak_rss_mb() -> Optional[float]:
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is KiB on Linux, bytes on macOS
+    return peak / 2**20 if sys.platform == "darwin" else peak / 2**10
+
+
+def _cpu_seconds() -> float:
+    # process_time has ns resolution; os.times only covers reaped children
+    t = os.times()
+    return time.process_time() + t.children_user + t.children_system
+
+
+@dataclass
+class StageMetrics:
+    name: str
+    calls: int = 0
+    wall_s: float = 0.0
+    cpu_s: float = 0.0
+    rows_in: Optional[int] = None
+    rows_out: Optional[int] = None
+    peak_rss_delta_mb: Optional[float] = None
+    # stage-specific counts (e.g. candidate pairs), summed across calls
+    counters: Optional[Dict[str, float]] = None
+
+
+class _StageRun:
+    """Handle yielded by StageRecorder.stage; set rows_in/rows_out (and any counters) on it."""
+
+    def __init__(self, rows_in: Optional[int]):
+        self.rows_in = rows_in
+        self.rows_out: Optional[int] = None
+        self.counters: Dict[str, float] = {}
+
+
+def _add(total: Optional[float], value: Optional[float]) -> Optional[float]:
+    if value is None:
+        return total
+    return value if total is None else total + value
+
+
+class StageRecorder:
+    def __init__(self, profile_dir: Optional[str] = None):
+        self.profile_dir = profile_dir
+        self.stages: Dict[str, StageMetrics] = {}
+        self._profiles: Dict[str, cProfile.Profile] = {}
+        self._started = time.perf_counter()
+
+    @contextmanager
+    def stage(self, name: str, rows_in: Optional[int] = None) -> Iterator[_StageRun]:
+        run = _StageRun(rows_in)
+        profile = None
+        if self.profile_dir is not None:
+            profile = self._profiles.setdefault(name, cProfile.Profile())
+
+        rss0 = _peak_rss_mb()
+        cpu0 = _cpu_seconds()
+        wall0 = time.perf_counter()
+        if profile is not None:
+            profile.enable()
+        try:
+            yield run
+        finally:
+            if profile is not None:
+                profile.disable()
+            wall = time.perf_counter() - wall0
+            cpu = _cpu_seconds() - cpu0
+            rss1 = _peak_rss_mb()
+
+            m = self.stages.setdefault(name, StageMetrics(name))
+            m.calls += 1
+            m.wall_s += wall
+            m.cpu_s += cpu
+            m.rows_in = _add(m.rows_in, run.rows_in)
+            m.rows_out = _add(m.rows_out, run.rows_out)
+            if rss0 is not None:
+                m.peak_rss_delta_mb = _add(m.peak_rss_delta_mb, rss1 - rss0)
+            for key, value in run.counters.items():
+                m.counters = m.counters or {}
+                m.counters[key] = m.counters.get(key, 0) + value
+
+    def to_dict(self, **extra) -> dict:
+        return {
+            **extra,
+            "total_wall_s": round(time.perf_counter() - self._started, 6),
+            "peak_rss_mb": _peak_rss_mb(),
+            "stages": [
+                {
+                    k: round(v, 6) if isinstance(v, float) else v
+                    for k, v in asdict(m).items()
+                    if not (k == "counters" and v is None)
+                }
+                for m in self.stages.values()
+            ],
+        }
+
+    def write(self, out_dir: str, **extra) -> str:
+        """Write pipeline_metrics.json (and the per-stage profiles) and return its path."""
+        path = os.path.join(out_dir, METRICS_FILENAME)
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(self.to_dict(**extra), f, indent=2)
+        if self.profile_dir is not None:
+            os.makedirs(self.profile_dir, exist_ok=True)
+            for name, profile in self._profiles.items():
+                profile.dump_stats(os.path.join(self.profile_dir, f"{name}.pstats"))
+        return path
@@ -0,0 +1,11 @@
+import pytest
+
+from src.ingest import load_invoice_data
+
+SAMPLE = "data/freight_invoices_1k.csv"
+
+
+@pytest.fixture(scope="session")
+def sample_invoices():
+    """The checked-in 1k sample in the pipeline schema; copy before changing it."""
+    return load_invoice_data(SAMPLE)
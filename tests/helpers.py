@@ -0,0 +1,85 @@
+"""
+Reference implementations and fixtures shared by the tests and the benchmarks.
+
+The benchmarks import from here, so a change to a benchmark script can't
+change what the tests compare against.
+"""
+import numpy as np
+import pandas as pd
+
+from src.rate_engine import _class_multiplier, _distance_band, _lane_rate_per_lb
+
+EXPECTED_COLS = [
+    "expected_linehaul_amount",
+    "expected_fuel_amount",
+    "expected_liftgate_fee",
+    "expected_billed_total",
+]
+
+
+def legacy_compute_expected_billing(df: pd.DataFrame) -> pd.DataFrame:
+    """The pre-vectorization implementation, kept here as the reference."""
+    df = df.copy()
+
+    est_linehaul = []
+    for _, row in df.iterrows():
+        band = _distance_band(row["distance_miles"])
+        per_lb = _lane_rate_per_lb(band)
+        class_mult = _class_multiplier(row["freight_class"])
+        est_linehaul.append(per_lb * class_mult * row["weight_lb"])
+    df["expected_linehaul_amount"] = est_linehaul
+
+    expected_fuel = []
+    for _, row in df.iterrows():
+        band = _distance_band(row["distance_miles"])
+        pct = 0.05 if band == "local" else 0.10 if band == "regional" else 0.15
+        expected_fuel.append(row["expected_linehaul_amount"] * pct)
+    df["expected_fuel_amount"] = expected_fuel
+
+    df["expected_liftgate_fee"] = df["liftgate_required"].apply(lambda need: 75.0 if need else 0.0)
+    df["expected_billed_total"] = (
+        df["expected_linehaul_amount"] + df["expected_fuel_amount"] + df["expected_liftgate_fee"]
+    )
+    return df
+
+
+LANES = [
+    ("Buffalo, NY", "Columbus, OH"),
+    ("Toledo, OH", "Detroit, MI"),
+    ("Chicago, IL", "Dallas, TX"),
+    ("Houston, TX", "Miami, FL"),
+    ("Phoenix, AZ", "Denver, CO"),
+]
+ACCESSORIALS = ["Lift Gate Service", "Hazmat Handling", "Inside Delivery", "Residential", "Detention"]
+BILLED_DESCS = ACCESSORIALS + ["Liftgate svc", "LIFT GATE", "hazmat fee", "Inside del.", "Misc"]
+
+
+def make_reconciliation_tables(n_invoices: int, seed: int = 42):
+    """Contract and invoice tables for reconcile_invoices, with misspelled accessorials."""
+    rng = np.random.default_rng(seed)
+    rates = pd.DataFrame(
+        {
+            "contract_lane_desc": [f"{o} -> {d}" for o, d in LANES],
+            "origin": [o for o, _ in LANES],
+            "destination": [d for _, d in LANES],
+            "contract_rate_per_mile": rng.uniform(1.5, 3.5, len(LANES)).round(2),
+            "allowed_fuel_surcharge_pct": rng.choice([25.0, 30.0, 35.0], len(LANES)),
+            "allowed_accessorial_desc": ACCESSORIALS,
+            "allowed_accessorial_cap": rng.choice([75.0, 85.0, 100.0], len(LANES)),
+        }
+    )
+    lane = rng.integers(len(LANES), size=n_invoices)
+    invoices = pd.DataFrame(
+        {
+            "invoice_id": [f"INV-{i}" for i in range(n_invoices)],
+            "load_id": [f"LD-{i}" for i in range(n_invoices)],
+            "origin": np.array([o for o, _ in LANES], dtype=object)[lane],
+            "destination": np.array([d for _, d in LANES], dtype=object)[lane],
+            "miles_billed": rng.integers(100, 1500, n_invoices),
+            "rate_billed_per_mile": rng.uniform(1.5, 3.6, n_invoices).round(2),
+            "fuel_surcharge_pct": rng.choice([24.0, 30.0, 34.0, 36.5], n_invoices),
+            "accessorial_desc": rng.choice(BILLED_DESCS, n_invoices),
+            "accessorial_amount": rng.choice([60.0, 85.0, 95.0, 125.0], n_invoices),
+        }
+    )
+    return invoices, rates
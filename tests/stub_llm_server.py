@@ -0,0 +1,111 @@
+"""
+Local stand-in for the OpenAI Responses API, for exercising LLMExplainer offline.
+
+Answers POST /v1/responses after a fixed latency with a canned rewrite of the
+prompt, and counts requests. Every ``rate_limit_every``-th request gets a 429
+instead, to exercise the retry path.
+
+    PYTHONPATH=. python tests/stub_llm_server.py --port 8765 --latency 0.2
+    OPENAI_BASE_URL=http://127.0.0.1:8765/v1 OPENAI_API_KEY=stub \\
+        PYTHONPATH=. python -m src.run_pipeline --llm
+"""
+import argparse
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+class StubLLMServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, port: int = 0, latency: float = 0.05, rate_limit_every: int = 0):
+        super().__init__(("127.0.0.1", port), _Handler)
+        self.latency = latency
+        self.rate_limit_every = rate_limit_every
+        self.requests = 0
+        self.rate_limited = 0
+        self._lock = threading.Lock()
+
+    @property
+    def base_url(self) -> str:
+        return f"http://127.0.0.1:{self.server_address[1]}/v1"
+
+    def start(self) -> "StubLLMServer":
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+        return self
+
+
+class _Handler(BaseHTTPRequestHandler):
+    def log_message(self, *args) -> None:
+        pass
+
+    def _send(self, status: int, body: dict, headers: dict = None) -> None:
+        data = json.dumps(body).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        for k, v in (headers or {}).items():
+            self.send_header(k, v)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_POST(self) -> None:
+        payload = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+        server = self.server
+        with server._lock:
+            server.requests += 1
+            n = server.requests
+        time.sleep(server.latency)
+
+        if not self.path.endswith("/responses"):
+            self._send(404, {"error": {"message": "not found"}})
+            return
+        if server.rate_limit_every and n % server.rate_limit_every == 0:
+            with server._lock:
+                server.rate_limited += 1
+            self._send(429, {"error": {"message": "rate limited", "type": "rate_limit"}}, {"retry-after": "0"})
+            return
+
+        text = str(payload.get("input", "")).split("\n\n", 1)[-1]
+        self._send(
+            200,
+            {
+                "id": f"resp_{n}",
+                "object": "response",
+                "created_at": int(time.time()),
+                "model": payload.get("model", "stub"),
+                "status": "completed",
+                "output": [
+                    {
+                        "type": "message",
+                        "id": f"msg_{n}",
+                        "role": "assistant",
+                        "status": "completed",
+                        "content": [{"type": "output_text", "text": f"Audit note: {text}", "annotations": []}],
+                    }
+                ],
+                "parallel_tool_calls": False,
+                "tool_choice": "auto",
+                "tools": [],
+            },
+        )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--latency", type=float, default=0.05)
+    parser.add_argument("--rate-limit-every", type=int, default=0)
+    args = parser.parse_args()
+
+    server = StubLLMServer(args.port, args.latency, args.rate_limit_every)
+    print(f"Stub LLM server on {server.base_url}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,56 @@
+import numpy as np
+import pytest
+
+pytest.importorskip("sklearn")
+
+from src import anomaly  # noqa: E402
+from src.anomaly import (  # noqa: E402
+    SCALE_SAMPLE_ROWS,
+    SegmentScorePool,
+    _fit_forest,
+    fit_segmented_anomaly_model,
+    score_anomalies,
+    score_segmented_anomalies,
+)
+
+
+def test_score_scale_does_not_follow_row_order():
+    rng = np.random.default_rng(0)
+    # history ordered so the first rows are all from the calm half
+    n = SCALE_SAMPLE_ROWS + 4_000
+    X = np.vstack([rng.normal(0, 1, (n, 3)), rng.normal(0, 4, (n, 3))])
+
+    fitted = _fit_forest(X, ["a", "b", "c"], 20, 0.05, None, 42, with_scale=True)
+
+    spread = np.std(fitted.model.score_samples(X))
+    assert fitted.score_scale == pytest.approx(spread, rel=0.05)
+    # and it is seeded
+    again = _fit_forest(X, ["a", "b", "c"], 20, 0.05, None, 42, with_scale=True)
+    assert again.score_scale == fitted.score_scale
+
+
+def test_segment_score_pool_matches_in_process_scoring(sample_invoices):
+    model = fit_segmented_anomaly_model(sample_invoices, "distance_band", n_estimators=20, min_segment_rows=100)
+    assert len(model.segments) > 1
+
+    with SegmentScorePool(model, workers=2) as pool:
+        for chunk in (sample_invoices.iloc[:400], sample_invoices.iloc[400:]):
+            expected = score_segmented_anomalies(model, chunk)
+            pooled = score_segmented_anomalies(model, chunk, pool=pool)
+            for a, b in zip(pooled, expected):
+                np.testing.assert_array_equal(a, b)
+
+
+def test_segmented_scoring_honours_chunksize(sample_invoices, monkeypatch):
+    model = fit_segmented_anomaly_model(sample_invoices, "distance_band", n_estimators=20, min_segment_rows=100)
+    whole = score_anomalies(model, sample_invoices)
+
+    sizes = []
+    score_forest = anomaly._score_forest
+    monkeypatch.setattr(anomaly, "_score_forest", lambda m, X: sizes.append(len(X)) or score_forest(m, X))
+    pieces = score_anomalies(model, sample_invoices, chunksize=64)
+
+    assert max(sizes) == 64 and sum(sizes) == len(sample_invoices)
+
+    for a, b in zip(pieces, whole):
+        np.testing.assert_array_equal(a, b)
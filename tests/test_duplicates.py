@@ -0,0 +1,49 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from src.duplicates import DuplicateIndex, block_keys
+
+
+@pytest.fixture
+def invoices(sample_invoices):
+    return sample_invoices
+
+
+def _rebill_batch(invoices, float_zips: bool):
+    """Rows 500-599 plus row 0 billed again under a new id; optionally one missing origin_zip."""
+    rebill = invoices.iloc[[0]].assign(shipment_id="REBILL-0001")
+    batch = invoices.iloc[500:600].copy()
+    if float_zips:
+        batch["origin_zip"] = batch["origin_zip"].astype("float64")
+        batch.iloc[0, batch.columns.get_loc("origin_zip")] = np.nan
+    return pd.concat([batch, rebill], ignore_index=True)
+
+
+def test_block_keys_ignore_zip_dtype(invoices):
+    ints = block_keys(invoices)
+    floats = invoices.assign(origin_zip=invoices["origin_zip"].astype("float64"))
+    floats.iloc[0, floats.columns.get_loc("origin_zip")] = np.nan
+    strings = invoices.assign(destination_zip=invoices["destination_zip"].astype(str).str.zfill(5))
+
+    np.testing.assert_array_equal(block_keys(floats)["block"].to_numpy()[1:], ints["block"].to_numpy()[1:])
+    np.testing.assert_array_equal(block_keys(strings)["block"].to_numpy(), ints["block"].to_numpy())
+
+
+def test_block_keys_missing_values_block_as_empty(invoices):
+    row = invoices.iloc[[0]]
+    missing = row.assign(carrier=None)
+    empty = row.assign(carrier="")
+    assert block_keys(missing)["block"].iloc[0] == block_keys(empty)["block"].iloc[0]
+
+
+@pytest.mark.parametrize("float_zips", [False, True])
+def test_rebill_found_against_index_for_int_and_float_zips(tmp_path, invoices, float_zips):
+    index = DuplicateIndex(str(tmp_path / "duplicates.db"))
+    index.add(invoices.iloc[:500])
+
+    pairs = index.check(_rebill_batch(invoices, float_zips))
+
+    found = pairs[pairs["shipment_id"] == "REBILL-0001"]
+    assert found["duplicate_of"].tolist() == [invoices["shipment_id"].iloc[0]]
+    assert found["score"].iloc[0] == pytest.approx(1.0)
@@ -0,0 +1,34 @@
+import numpy as np
+import pandas as pd
+
+from src.fuel_schedule import build_fuel_schedule, load_fuel_schedule
+
+PRICES = "data/diesel_prices_sample.csv"
+BRACKETS = "data/fuel_brackets_sample.csv"
+
+
+def test_price_on_takes_the_price_effective_on_or_before_each_date():
+    schedule = load_fuel_schedule(PRICES, BRACKETS)
+    ship_dates = pd.Series(["2022-12-30", "2023-01-01", "2023-01-02", "2023-01-08", "2023-01-09", "2030-06-01", None])
+    np.testing.assert_array_equal(
+        schedule.price_on(ship_dates),
+        # before the first price, on it, the day before the next, on the next, after the last, missing
+        [np.nan, np.nan, 4.679, 4.679, 4.714, schedule.prices[-1], np.nan],
+    )
+    pct = schedule.fuel_pct(ship_dates)
+    assert np.isnan(pct[[0, 1, 6]]).all()
+    # 4.679 and 4.714 sit in the (4.60, 4.70] and (4.70, 4.80] brackets
+    np.testing.assert_array_equal(pct[[2, 3, 4]], [0.185, 0.185, 0.19])
+
+
+def test_fuel_pct_brackets_include_their_upper_bound_and_cap_at_the_top():
+    prices = pd.DataFrame({
+        "effective_date": ["2024-01-01", "2024-01-08", "2024-01-15", "2024-01-22"],
+        "diesel_price": [3.00, 3.0001, 5.00, 6.25],
+    })
+    schedule = build_fuel_schedule(prices, pd.read_csv(BRACKETS))
+    np.testing.assert_array_equal(
+        schedule.fuel_pct(pd.to_datetime(prices["effective_date"])),
+        # on the first bound, just over it, on the top bound, above every bound
+        [0.1, 0.105, 0.2, 0.205],
+    )
@@ -0,0 +1,45 @@
+import filecmp
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from src.incremental import row_hashes
+from src.ingest import load_invoice_data
+from src.run_pipeline import run_pipeline
+from tests.conftest import SAMPLE
+
+REPORTS = ["leakage_report.csv", "summary_metrics.json", "explanations.csv", "explanations.jsonl"]
+
+
+def test_row_hashes_ignore_storage_dtypes():
+    plain = row_hashes(load_invoice_data(SAMPLE))
+    assert len(set(plain)) == len(plain)
+    np.testing.assert_array_equal(row_hashes(load_invoice_data(SAMPLE, compact=True)), plain)
+
+    pytest.importorskip("pyarrow")
+    np.testing.assert_array_equal(row_hashes(load_invoice_data(SAMPLE, arrow_dtypes=True)), plain)
+    np.testing.assert_array_equal(row_hashes(load_invoice_data(SAMPLE, arrow_dtypes=True, compact=True)), plain)
+
+
+def _run(data, out_dir, **kwargs):
+    run_pipeline(str(data), str(out_dir), 42, llm_cache_dir=None, stages=["rules", "summary", "explanations"], **kwargs)
+
+
+@pytest.mark.parametrize("compact_second_run", [False, True])
+def test_second_run_with_a_changed_and_a_new_row_matches_a_full_run(tmp_path, capsys, compact_second_run):
+    raw = pd.read_csv(SAMPLE, dtype=str, keep_default_na=False)
+    raw.iloc[:900].to_csv(tmp_path / "day1.csv", index=False)
+    day2 = raw.iloc[:901].copy()
+    day2.loc[10, "actual_total_billed"] = str(float(day2.loc[10, "actual_total_billed"]) - 250.0)
+    day2.to_csv(tmp_path / "day2.csv", index=False)
+
+    state = tmp_path / "state.db"
+    _run(tmp_path / "day1.csv", tmp_path / "run1", state_path=str(state))
+    capsys.readouterr()
+    _run(tmp_path / "day2.csv", tmp_path / "run2", state_path=str(state), compact=compact_second_run)
+    assert "Incremental: 899 reused, 1 reprocessed, 1 new" in capsys.readouterr().out
+
+    _run(tmp_path / "day2.csv", tmp_path / "full")
+    for name in REPORTS:
+        assert filecmp.cmp(tmp_path / "run2" / name, tmp_path / "full" / name, shallow=False), name
@@ -0,0 +1,17 @@
+import pandas as pd
+
+from src.ingest import compact_invoice_frame, load_invoice_data
+from tests.conftest import SAMPLE
+
+
+def test_default_load_keeps_ids_as_strings(sample_invoices):
+    for col in ("shipment_id", "customer_id", "carrier"):
+        assert pd.api.types.is_string_dtype(sample_invoices[col]), col
+        assert not isinstance(sample_invoices[col].dtype, pd.CategoricalDtype), col
+
+
+def test_compact_makes_low_cardinality_columns_categorical(sample_invoices):
+    compact = load_invoice_data(SAMPLE, compact=True)
+    assert isinstance(compact["carrier"].dtype, pd.CategoricalDtype)
+    assert compact["carrier"].astype(str).tolist() == sample_invoices["carrier"].tolist()
+    pd.testing.assert_frame_equal(compact, compact_invoice_frame(sample_invoices.copy()))
@@ -0,0 +1,92 @@
+import os
+
+import numpy as np
+import pytest
+
+from src.ingest import compact_invoice_frame
+from src.llm_explainer import (
+    ExplanationCache,
+    LLMExplainer,
+    build_rule_explanation,
+    build_rule_explanations,
+)
+from src.rate_engine import compute_expected_billing
+from src.rules_engine import apply_leakage_rules
+from tests.stub_llm_server import StubLLMServer
+
+
+def _disk_bytes(root):
+    return sum(os.path.getsize(os.path.join(d, f)) for d, _, files in os.walk(root) for f in files)
+
+
+def test_cache_tracks_size_through_put_and_trims_lru(tmp_path):
+    cache = ExplanationCache(str(tmp_path), max_bytes=250)
+    for i in range(5):
+        cache.put("m", f"prompt {i}", "x" * 50)
+    assert cache.trim() == 0
+    assert cache.total_bytes() == 250
+
+    # tracked from here on without walking the directory
+    for i in range(5, 10):
+        cache.put("m", f"prompt {i}", "x" * 50)
+    cache.put("m", "prompt 9", "y" * 10)
+    assert cache.total_bytes() == _disk_bytes(tmp_path) == 460
+
+    assert cache.trim() == 5
+    assert cache.total_bytes() == _disk_bytes(tmp_path) == 210
+    assert cache.get("m", "prompt 9") == "y" * 10
+
+
+@pytest.fixture
+def stub_server():
+    pytest.importorskip("openai")
+    server = StubLLMServer(latency=0.0).start()
+    yield server
+    server.shutdown()
+
+
+def _flagged_texts(invoices):
+    df = apply_leakage_rules(compute_expected_billing(invoices))
+    return build_rule_explanations(df[df["flag_reason"] != ""]).tolist()
+
+
+def test_explain_many_fills_cache_then_makes_no_calls(tmp_path, stub_server, sample_invoices):
+    texts = _flagged_texts(sample_invoices)
+    explainer = lambda **kw: LLMExplainer(  # noqa: E731
+        "stub-model", api_key="stub", base_url=stub_server.base_url, backoff_base=0.01, **kw
+    )
+
+    sequential = explainer(max_concurrency=1).explain_many(texts)
+    assert stub_server.requests == len(set(texts))
+    assert all(out is not None for out in sequential)
+
+    cold = explainer(max_concurrency=8, cache=ExplanationCache(str(tmp_path))).explain_many(texts)
+    before = stub_server.requests
+    warm_explainer = explainer(max_concurrency=8, cache=ExplanationCache(str(tmp_path)))
+    warm = warm_explainer.explain_many(texts)
+
+    assert stub_server.requests == before
+    assert warm_explainer.cache_hits == len(set(texts))
+    assert sequential == cold == warm
+
+
+def test_explain_many_without_key_returns_none():
+    assert LLMExplainer("stub-model", api_key=None).explain_many(["a", "b"]) == [None, None]
+
+
+@pytest.mark.parametrize("compact", [False, True])
+def test_build_rule_explanations_matches_per_row_builder(sample_invoices, compact):
+    df = sample_invoices.copy()
+    if compact:
+        df = compact_invoice_frame(df)
+    df = apply_leakage_rules(compute_expected_billing(df), compact=compact)
+    flagged = df[df["flag_reason"] != ""].copy()
+    # missing carrier, negative zero and missing distance take their own formatting paths
+    edge = flagged.index[::7]
+    flagged.loc[edge[0::3], "carrier"] = np.nan
+    flagged.loc[edge[1::3], "fuel_surcharge_amount"] = -0.0
+    flagged.loc[edge[2::3], "distance_miles"] = np.nan
+
+    batch = build_rule_explanations(flagged)
+
+    assert batch.tolist() == [build_rule_explanation(row) for _, row in flagged.iterrows()]
@@ -0,0 +1,20 @@
+import numpy as np
+
+from src.rate_engine import compute_expected_billing
+from tests.helpers import EXPECTED_COLS, legacy_compute_expected_billing
+
+
+def test_matches_row_by_row_reference(sample_invoices):
+    fast = compute_expected_billing(sample_invoices)
+    slow = legacy_compute_expected_billing(sample_invoices)
+    for col in EXPECTED_COLS:
+        np.testing.assert_array_equal(fast[col].to_numpy(), slow[col].to_numpy(), err_msg=col)
+
+
+def test_copy_false_fills_the_same_columns_in_place(sample_invoices):
+    expected = compute_expected_billing(sample_invoices)
+    df = sample_invoices.copy()
+    out = compute_expected_billing(df, copy=False)
+    assert out is df
+    for col in EXPECTED_COLS:
+        np.testing.assert_array_equal(out[col].to_numpy(), expected[col].to_numpy(), err_msg=col)
@@ -0,0 +1,78 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from src import rate_index
+from src.rate_engine import compute_expected_billing
+from src.rate_index import (
+    compile_rate_index,
+    default_contract_table,
+    default_rate_index,
+    load_contract_table,
+    load_rate_index,
+)
+from tests.helpers import EXPECTED_COLS
+
+CONTRACTS = "data/contract_rates_sample.csv"
+
+
+def test_default_index_prices_like_the_built_in_tiers(sample_invoices):
+    df = sample_invoices.copy()
+    # tier edges, between them and missing values, on top of the sample's own
+    edges = df.index[:9]
+    df.loc[edges, "distance_miles"] = [300.0, 300.5, 1000.0, 1000.5, np.nan, 0.0, 299.9, 5000.0, 1000.0]
+    df["freight_class"] = df["freight_class"].astype("float64")
+    df.loc[edges, "freight_class"] = [60, 60.5, 70, 85, 85.5, np.nan, 50, 500, 70.1]
+
+    built_in = compute_expected_billing(df)
+    indexed = compute_expected_billing(df, rate_index=default_rate_index())
+    for col in EXPECTED_COLS:
+        np.testing.assert_array_equal(indexed[col].to_numpy(), built_in[col].to_numpy(), err_msg=col)
+
+
+def test_saved_index_round_trips_and_refuses_other_versions(tmp_path, sample_invoices, monkeypatch):
+    index = load_rate_index(CONTRACTS)
+    path = str(tmp_path / "rates.npz")
+    index.save(path)
+
+    loaded = load_rate_index(path)
+    assert loaded.fingerprint == index.fingerprint
+    for col, expected in index.price(sample_invoices).items():
+        np.testing.assert_array_equal(loaded.price(sample_invoices)[col], expected, err_msg=col)
+
+    # a changed rate is a different fingerprint, so incremental state keyed on it is dropped
+    table = load_contract_table(CONTRACTS)
+    table.loc[table["schedule"].eq("liftgate_fee").idxmax(), "value"] += 1
+    assert compile_rate_index(table).fingerprint != index.fingerprint
+    assert default_rate_index().fingerprint == compile_rate_index(default_contract_table()).fingerprint
+
+    monkeypatch.setattr(rate_index, "RATE_INDEX_VERSION", rate_index.RATE_INDEX_VERSION + 1)
+    with pytest.raises(ValueError, match="recompile"):
+        load_rate_index(path)
+
+
+def test_most_specific_contract_wins():
+    index = load_rate_index(CONTRACTS)
+    shipments = pd.DataFrame({
+        "customer_id": ["CUST_DAA271", "CUST_DAA271", "CUST_OTHER", "CUST_OTHER", None],
+        "origin_zip": [90005, 19101, 90001, 19101, 90005],
+        "destination_zip": [10002, 85006, 10001, 85006, 10002],
+        "distance_miles": [2500.0] * 5,
+        "weight_lb": [1000.0] * 5,
+        "freight_class": [50] * 5,
+        "liftgate_required": [True] * 5,
+    })
+    contract = index.contract_ids(shipments)
+    keys = [tuple(k) for k in index.contract_keys[contract].tolist()]
+    assert keys == [
+        ("CUST_DAA271", "900", "100"),  # customer and lane
+        ("CUST_DAA271", "*", "*"),  # customer only
+        ("*", "900", "100"),  # lane only
+        ("*", "*", "*"),
+        ("*", "900", "100"),  # no customer still matches the lane
+    ]
+    np.testing.assert_array_equal(
+        index.lookup("rate_per_lb", contract, shipments["distance_miles"]), [0.40, 0.44, 0.42, 0.48, 0.42]
+    )
+    # schedules a contract leaves out come from the default, not a less specific match
+    np.testing.assert_array_equal(index.price(shipments)["liftgate"], [75.0, 60.0, 75.0, 75.0, 75.0])
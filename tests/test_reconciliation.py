@@ -0,0 +1,122 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from src.reconciliation import (
+    CARRIER_CONTRACT_COLUMNS,
+    build_lane_index,
+    finalize_reconciliation_summary,
+    load_carrier_contracts,
+    reconcile_invoices,
+    reconcile_shipments,
+    reconciliation_partials,
+)
+from tests.helpers import make_reconciliation_tables
+
+
+def _sample_tables():
+    return pd.read_csv("data/invoices_sample.csv"), pd.read_csv("data/rates_sample.csv")
+
+
+@pytest.mark.parametrize("tables", [_sample_tables, lambda: make_reconciliation_tables(300)], ids=["sample", "generated"])
+def test_batch_matches_row_by_row(tables):
+    invoices, rates = tables()
+    index = build_lane_index(rates)
+
+    fast, fast_summary = reconcile_invoices(invoices, rates, lane_index=index, batch=True)
+    slow, slow_summary = reconcile_invoices(invoices, rates, lane_index=index, batch=False)
+
+    pd.testing.assert_frame_equal(fast, slow)
+    assert fast_summary == slow_summary
+
+
+CARRIER_CONTRACTS = "data/carrier_contracts_sample.csv"
+
+
+def _reference_shipment_row(row, table: pd.DataFrame, tolerance_pct: float) -> tuple:
+    """(flags, recoverable) for one shipment, reading the contract table directly."""
+    carrier = table["carrier"].str.strip().str.lower() == str(row["carrier"]).strip().lower()
+    o3, d3 = f"{int(row['origin_zip']):05d}"[:3], f"{int(row['destination_zip']):05d}"[:3]
+    lane = table[carrier & (table["origin_zip3"] == o3) & (table["dest_zip3"] == d3)]
+    contract = lane if len(lane) else table[carrier & (table["origin_zip3"] == "*")]
+    if contract.empty:
+        return "NO_CONTRACT", 0.0
+    c = contract.iloc[0]
+    linehaul, fuel, accessorials = (
+        row["actual_billed_linehaul"], row["actual_billed_fuel"], row["actual_billed_accessorials"]
+    )
+    expected = max(row["distance_miles"] * c["rate_per_mile"], c["min_charge"])
+    flags, recoverable = [], 0.0
+    if linehaul > expected:
+        recoverable += linehaul - expected
+        if linehaul > expected * (1 + tolerance_pct / 100):
+            flags.append("RATE_OVER_CONTRACT")
+    fuel_pct = fuel / linehaul * 100 if linehaul > 0 else float("nan")
+    if fuel_pct > c["max_fuel_pct"]:
+        recoverable += expected * (fuel_pct - c["max_fuel_pct"]) / 100
+        flags.append("FUEL_SURCHARGE_OVER_CONTRACT")
+    if accessorials > c["accessorial_cap"]:
+        recoverable += accessorials - c["accessorial_cap"]
+        flags.append("ACCESSORIAL_OVER_CAP")
+    return "; ".join(flags) or "OK", recoverable
+
+
+def test_shipments_against_the_sample_carrier_contracts(sample_invoices):
+    contracts = load_carrier_contracts(CARRIER_CONTRACTS)
+    rows = reconcile_shipments(sample_invoices, contracts)
+    summary = finalize_reconciliation_summary(reconciliation_partials(rows))
+
+    table = pd.read_csv(CARRIER_CONTRACTS, dtype=str).apply(lambda c: c.str.strip())
+    table[CARRIER_CONTRACT_COLUMNS[3:]] = table[CARRIER_CONTRACT_COLUMNS[3:]].astype(float)
+    reference = [_reference_shipment_row(row, table, 2.0) for _, row in sample_invoices.iterrows()]
+    assert rows["flags"].tolist() == [flags for flags, _ in reference]
+    np.testing.assert_allclose(rows["recoverable_amount_est"], [r for _, r in reference], atol=0.005)
+
+    assert summary["flagged_shipments"] == 30
+    assert summary["total_recoverable_usd"] == 1851.21
+    assert rows["contract_match"].value_counts().to_dict() == {"carrier": 984, "lane": 16}
+
+
+def _shipments(**columns) -> pd.DataFrame:
+    n = len(columns["carrier"])
+    base = {
+        "shipment_id": [f"S{i}" for i in range(n)],
+        "distance_miles": [100.0] * n,
+        "fuel_surcharge_amount": [0.0] * n,
+        "liftgate_fee_charged": [0.0] * n,
+    }
+    return pd.DataFrame({**base, **columns})
+
+
+def test_rate_tolerance_boundary_is_not_flagged():
+    contracts = load_carrier_contracts(CARRIER_CONTRACTS)
+    # FedEx Ground's default is 1.02 per mile: 102.00 for 100 miles
+    limit = 102.0 * (1 + 2.0 / 100)
+    shipments = _shipments(
+        carrier=["FedEx Ground"] * 3,
+        origin_zip=[30301] * 3,
+        destination_zip=[60601] * 3,
+        base_linehaul_amount=[102.0, limit, np.nextafter(limit, np.inf)],
+    )
+    rows = reconcile_shipments(shipments, contracts, rate_tolerance_pct=2.0)
+    assert rows["contract_linehaul"].tolist() == [102.0] * 3
+    assert rows["flags"].tolist() == ["OK", "OK", "RATE_OVER_CONTRACT"]
+    # an overage inside the tolerance is not flagged but still recoverable
+    assert rows["recoverable_amount_est"].tolist() == [0.0, 2.04, 2.04]
+
+
+def test_shipments_without_a_lane_contract():
+    contracts = load_carrier_contracts(CARRIER_CONTRACTS)
+    shipments = _shipments(
+        # FedEx Ground has a 100 -> 900 lane contract, not 900 -> 100; Acme has none at all
+        carrier=["FedEx Ground", "FedEx Ground", " fedex ground", "Acme Freight"],
+        origin_zip=[10001, 90001, 10001, 10001],
+        destination_zip=[90001, 10001, 90001, 90001],
+        base_linehaul_amount=[95.0, 95.0, 95.0, 95.0],
+    )
+    rows = reconcile_shipments(shipments, contracts)
+    assert rows["contract_match"].tolist() == ["lane", "carrier", "lane", ""]
+    # 0.90 per mile on the lane, the carrier default's 1.02 off it
+    np.testing.assert_array_equal(rows["contract_linehaul"], [90.0, 102.0, 90.0, np.nan])
+    assert rows["flags"].tolist() == ["RATE_OVER_CONTRACT", "OK", "RATE_OVER_CONTRACT", "NO_CONTRACT"]
+    assert rows["recoverable_amount_est"].tolist() == [5.0, 0.0, 5.0, 0.0]
@@ -0,0 +1,37 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from src.report_io import SortedReportWriter
+
+
+@pytest.mark.parametrize("ascending", [True, False])
+@pytest.mark.parametrize("fmt", ["csv", "parquet"])
+def test_sorted_report_matches_stable_sort_of_all_frames(tmp_path, ascending, fmt):
+    if fmt == "parquet":
+        pytest.importorskip("pyarrow")
+    rng = np.random.default_rng(7)
+    frames = []
+    for chunk in range(9):
+        n = int(rng.integers(0, 30))
+        # few distinct scores, so ties cross chunk and block boundaries
+        score = rng.integers(0, 5, n) / 4.0
+        score[rng.random(n) < 0.1] = np.nan
+        frames.append(pd.DataFrame({"shipment_id": [f"{chunk}-{i}" for i in range(n)], "anomaly_score": score}))
+
+    path = str(tmp_path / f"report.{fmt}")
+    # small blocks and fan_in force block reloads and an intermediate merge pass
+    with SortedReportWriter(path, fmt, by="anomaly_score", ascending=ascending, block_rows=4, fan_in=3) as out:
+        for frame in frames:
+            out.append(frame)
+
+    written = pd.read_parquet(path) if fmt == "parquet" else pd.read_csv(path)
+    expected = pd.concat(frames, ignore_index=True).sort_values("anomaly_score", ascending=ascending, kind="stable")
+    assert written["shipment_id"].tolist() == expected["shipment_id"].tolist()
+
+
+def test_sorted_report_of_empty_frames_keeps_header(tmp_path):
+    path = str(tmp_path / "report.csv")
+    with SortedReportWriter(path, "csv", by="anomaly_score") as out:
+        out.append(pd.DataFrame({"shipment_id": [], "anomaly_score": []}))
+    assert list(pd.read_csv(path).columns) == ["shipment_id", "anomaly_score"]
@@ -0,0 +1,64 @@
+import numpy as np
+import pandas as pd
+
+from src.rate_engine import compute_expected_billing
+from src.rules_engine import (
+    RULES,
+    LeakageRule,
+    RuleContext,
+    apply_leakage_rules,
+    evaluate_rules,
+    render_flag_reasons,
+)
+
+
+def test_render_flag_reasons_decodes_bits_in_rule_order():
+    names = [rule.name for rule in RULES]
+    mask = np.array([0, 1, 0b1010, 0b1111, 1, 0], dtype=np.uint8)
+
+    codes, texts = render_flag_reasons(mask)
+
+    rendered = [texts[c] for c in codes]
+    assert rendered == [
+        "",
+        names[0],
+        f"{names[1]}; {names[3]}",
+        "; ".join(names),
+        names[0],
+        "",
+    ]
+    # one text per distinct mask
+    assert len(texts) == 4
+
+
+def test_flag_reason_matches_flag_mask(sample_invoices):
+    flagged = apply_leakage_rules(compute_expected_billing(sample_invoices))
+    codes, texts = render_flag_reasons(flagged["flag_mask"].to_numpy())
+    assert flagged["flag_reason"].tolist() == [texts[c] for c in codes]
+    assert (flagged["flag_reason"] != "").sum() == flagged["is_flagged"].sum() > 0
+
+
+def test_evaluate_rules_on_a_custom_registry():
+    df = pd.DataFrame({"amount": [1.0, -2.0, 3.0]})
+    rules = [
+        LeakageRule("NEGATIVE", ("amount",), lambda d, ctx: d["amount"] < 0, column="is_negative"),
+        # reads a column the frame doesn't have, so it never fires
+        LeakageRule("NO_COLUMN", ("missing",), lambda d, ctx: pd.Series(True, index=d.index)),
+    ] + [LeakageRule(f"BIG_{i}", ("amount",), lambda d, ctx: d["amount"] > 2) for i in range(7)]
+
+    mask = evaluate_rules(df, RuleContext(columns={}), rules)
+
+    # nine rules no longer fit in a uint8
+    assert mask.dtype == np.uint16
+    assert mask.tolist() == [0, 1, sum(1 << bit for bit in range(2, 9))]
+    assert df["is_negative"].tolist() == [False, True, False]
+    codes, texts = render_flag_reasons(mask, rules)
+    assert texts[codes[1]] == "NEGATIVE"
+
+
+def test_compact_flags_match_plain(sample_invoices):
+    billed = compute_expected_billing(sample_invoices)
+    plain = apply_leakage_rules(billed)
+    compact = apply_leakage_rules(billed, compact=True)
+    assert compact["flag_reason"].astype(str).tolist() == plain["flag_reason"].tolist()
+    np.testing.assert_array_equal(compact["flag_mask"].to_numpy(), plain["flag_mask"].to_numpy())
@@ -0,0 +1,55 @@
+import json
+
+import pandas as pd
+import pytest
+
+from src.run_pipeline import run_pipeline
+from tests.conftest import SAMPLE
+
+
+@pytest.mark.parametrize("chunksize", [None, 100])
+@pytest.mark.parametrize("fmt", ["csv", "parquet"])
+def test_header_only_input_writes_an_empty_summary(tmp_path, chunksize, fmt):
+    header = pd.read_csv(SAMPLE, nrows=0)
+    data = tmp_path / f"empty.{fmt}"
+    if fmt == "parquet":
+        pytest.importorskip("pyarrow")
+        header.to_parquet(data)
+    else:
+        header.to_csv(data, index=False)
+
+    out = tmp_path / "reports"
+    run_pipeline(str(data), str(out), 42, chunksize=chunksize, llm_cache_dir=None)
+
+    summary = json.loads((out / "summary_metrics.json").read_text())
+    assert summary == {
+        "total_shipments": 0,
+        "flagged_shipments": 0,
+        "flag_rate_pct": 0.0,
+        "estimated_revenue_leakage_usd": 0.0,
+        "top_customers_by_leakage_usd": {},
+    }
+    assert pd.read_csv(out / "leakage_report.csv").empty
+
+
+def test_sharded_run_matches_single_process(tmp_path):
+    pytest.importorskip("pyarrow")
+    raw = pd.read_csv(SAMPLE, dtype=str, keep_default_na=False)
+    # repeat ids from the head of the file near its tail, so the pairs sit in
+    # different shards, and one pair inside the first shard
+    raw.loc[997:999, "invoice_id"] = raw.loc[0:2, "invoice_id"].to_numpy()
+    raw.loc[5, "invoice_id"] = raw.loc[4, "invoice_id"]
+    data = tmp_path / "invoices.csv"
+    raw.to_csv(data, index=False)
+
+    outs = {}
+    for workers in (1, 2):
+        outs[workers] = tmp_path / f"workers-{workers}"
+        run_pipeline(str(data), str(outs[workers]), 42, workers=workers, llm_cache_dir=None)
+
+    for name in ("leakage_report.csv", "summary_metrics.json"):
+        assert (outs[2] / name).read_bytes() == (outs[1] / name).read_bytes(), name
+
+    report = pd.read_csv(outs[2] / "leakage_report.csv", dtype={"shipment_id": str})
+    dup_ids = report.loc[report["flag_reason"].str.contains("POSSIBLE_DUPLICATE"), "shipment_id"]
+    assert set(dup_ids) == set(raw.loc[[0, 1, 2, 4], "invoice_id"])
@@ -0,0 +1,100 @@
+import json
+import threading
+import time
+import urllib.error
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+import pandas as pd
+import pytest
+
+from src.service import MicroBatcher, ServiceConfig, make_server
+from tests.conftest import SAMPLE
+
+
+class _RecordingState:
+    """Stands in for AuditState: echoes each frame back and records the batches."""
+
+    def __init__(self):
+        self.batches = []
+
+    def audit(self, frames):
+        self.batches.append([len(f) for f in frames])
+        return [f.assign(batch=len(self.batches)) for f in frames]
+
+
+def test_micro_batcher_coalesces_submissions_with_the_same_layout():
+    state = _RecordingState()
+    batcher = MicroBatcher(state, ServiceConfig(batch_window_ms=500, max_batch_rows=10))
+    frames = [pd.DataFrame({"shipment_id": [f"S{i}"] * n}) for i, n in enumerate([3, 4, 2, 5])]
+    frames.append(pd.DataFrame({"shipment_id": ["X"], "extra": [1]}))
+    try:
+        with ThreadPoolExecutor(len(frames)) as pool:
+            # in order, so the batcher sees them in order
+            futures = []
+            for f in frames:
+                futures.append(pool.submit(batcher.submit, f))
+                time.sleep(0.02)
+            outs = [f.result() for f in futures]
+    finally:
+        batcher.close()
+
+    # the first three fit in max_batch_rows; the fourth would overflow it and
+    # the last has other columns, so each starts a batch of its own
+    assert state.batches == [[3, 4, 2], [5], [1]]
+    assert [out["batch"].iloc[0] for out in outs] == [1, 1, 1, 2, 3]
+    for frame, out in zip(frames, outs):
+        assert out["shipment_id"].tolist() == frame["shipment_id"].tolist()
+    assert batcher.stats() == {"requests": 5, "rows": 15, "batches": 3}
+
+
+@pytest.fixture
+def audit_server():
+    server, service = make_server(ServiceConfig(batch_window_ms=500), port=0, quiet=True)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield f"http://127.0.0.1:{server.server_address[1]}", service
+    server.shutdown()
+    server.server_close()
+    service.close()
+
+
+def _post(url: str, body: bytes):
+    request = urllib.request.Request(url, data=body, headers={"Content-Type": "text/csv"})
+    try:
+        with urllib.request.urlopen(request) as response:
+            return response.status, json.loads(response.read())
+    except urllib.error.HTTPError as exc:
+        return exc.code, json.loads(exc.read())
+
+
+def test_duplicates_stay_within_one_submission(audit_server):
+    url, service = audit_server
+    with open(SAMPLE, "rb") as f:
+        header, *rows = f.read().splitlines()
+    # rows 5-9 are in both submissions; row 12 is repeated inside the second
+    first = b"\n".join([header, *rows[0:10]]) + b"\n"
+    second = b"\n".join([header, *rows[5:15], rows[12]]) + b"\n"
+    with ThreadPoolExecutor(2) as pool:
+        replies = list(pool.map(lambda body: _post(url + "/audit", body), [first, second]))
+
+    assert service.batcher.stats()["batches"] == 1
+    duplicates = []
+    for status, payload in replies:
+        assert status == 200
+        results = pd.DataFrame(payload["results"])
+        flagged = results["flag_reason"].str.contains("POSSIBLE_DUPLICATE", na=False)
+        duplicates.append(set(results.loc[flagged, "shipment_id"]))
+    assert duplicates == [set(), {rows[12].split(b",")[0].decode()}]
+
+
+def test_unexpected_errors_are_a_json_500(audit_server, monkeypatch):
+    url, service = audit_server
+
+    def broken(frames):
+        raise RuntimeError("boom")
+
+    monkeypatch.setattr(service.state, "audit", broken)
+    with open(SAMPLE, "rb") as f:
+        body = b"".join(f.readlines()[:3])
+    assert _post(url + "/audit", body) == (500, {"error": "Internal error: RuntimeError: boom"})
@@ -0,0 +1,56 @@
+import pandas as pd
+import pytest
+
+from src.similarity import (
+    ABBREVIATIONS,
+    ACCESSORIAL_ALIASES,
+    MIN_CODE_SCORE,
+    AccessorialCodebook,
+    StringIndex,
+    description_key,
+    ratio,
+)
+from tests.conftest import SAMPLE
+from tests.helpers import BILLED_DESCS
+
+# alias key -> code, first spelling wins, as AccessorialCodebook builds it
+ALIAS_CODES = {}
+for _code, _spellings in ACCESSORIAL_ALIASES.items():
+    for _spelling in [_code, *_spellings]:
+        ALIAS_CODES.setdefault(description_key(_spelling), _code)
+ALIAS_KEYS = list(ALIAS_CODES)
+
+
+def _queries() -> list:
+    """Accessorial descriptions as they show up on the sample invoices, plus shorthand and typos."""
+    services = pd.read_csv(SAMPLE)["accessorial_services"].dropna().str.split(",").explode().unique()
+    invoices = pd.read_csv("data/invoices_sample.csv")["accessorial_desc"].unique()
+    shorthand = [f"{abbr} {word}" for abbr in ABBREVIATIONS for word in ("svc", "del", "fee", "")]
+    typos = ["lfitgate", "liftgat delivry", "residental", "apointment", "hazmatt", "detension", "inside delvery"]
+    raw = [*services, *invoices, *BILLED_DESCS, *shorthand, *typos, "misc", "fuel", "x"]
+    return list(dict.fromkeys(q for text in raw for q in (str(text).lower().strip(), description_key(text)) if q))
+
+
+def _brute_best(query: str, candidates: list) -> tuple:
+    """(position, ratio) of the first candidate with the highest ratio, scanning them all."""
+    best_pos, best_score = 0, 0.0
+    for pos, candidate in enumerate(candidates):
+        score = ratio(query, candidate)
+        if score > best_score:
+            best_pos, best_score = pos, score
+    return best_pos, best_score
+
+
+@pytest.mark.parametrize("candidates", [ALIAS_KEYS, [d.lower() for d in BILLED_DESCS]], ids=["aliases", "billed"])
+def test_string_index_matches_a_full_scan(candidates):
+    index = StringIndex(candidates)
+    for query in _queries():
+        assert index.best(query) == _brute_best(query, candidates), query
+
+
+def test_codebook_matches_a_full_scan():
+    codebook = AccessorialCodebook()
+    for query in _queries():
+        pos, score = _brute_best(description_key(query), ALIAS_KEYS)
+        expected = ALIAS_CODES[ALIAS_KEYS[pos]] if score >= MIN_CODE_SCORE else None
+        assert codebook.code(query) == expected, query